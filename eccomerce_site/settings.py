@@ -21,6 +21,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.profiling.QueryProfilerMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +66,40 @@ DATABASES = {
     }
 }
 
+# Process-local cache for development. Deployments with several workers need
+# a shared backend so cache invalidation reaches every process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shopease',
+    }
+}
+
+# TTL fallback (seconds) for cached catalog pages and fragments
+SHOP_CACHE_TIMEOUT = 300
+
+# How long (seconds) stock stays held for a cart before the sweeper releases it
+SHOP_RESERVATION_TTL = 15 * 60
+
+# Background jobs (python manage.py run_jobs): attempts before a job is
+# marked failed, and the first retry delay in seconds (doubles per attempt)
+SHOP_JOB_MAX_ATTEMPTS = 5
+SHOP_JOB_RETRY_DELAY = 10
+
+# Admin changelists over tables estimated at fewer rows than this are
+# counted exactly; bigger unfiltered tables use the planner's row estimate
+SHOP_ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Request profiler (shop.profiling): share of requests profiled, and the
+# query count / repeats of one query shape that log a warning
+SHOP_PROFILER_SAMPLE_RATE = 1.0
+SHOP_PROFILER_QUERY_BUDGET = 50
+SHOP_PROFILER_DUPLICATE_LIMIT = 5
+
+# Development prints outgoing mail (order confirmations) to the console
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'ShopEase <no-reply@shopease.local>'
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -23,6 +23,32 @@ DATABASES = {
     )
 }
 
+# Shared cache so every worker sees the same catalog version stamps. Without
+# REDIS_URL (e.g. collectstatic during an image build) the per-process cache
+# from settings.py stays; `manage.py check --deploy` warns about it (shop.W001)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+SHOP_CACHE_TIMEOUT = int(os.environ.get('SHOP_CACHE_TIMEOUT', SHOP_CACHE_TIMEOUT))
+
+# Profile a small share of live requests (0 turns the profiler off)
+SHOP_PROFILER_SAMPLE_RATE = float(os.environ.get('SHOP_PROFILER_SAMPLE_RATE', '0.05'))
+
+# Outgoing mail (sent by the run_jobs worker)
+if os.environ.get('EMAIL_HOST'):
+    EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    EMAIL_HOST = os.environ['EMAIL_HOST']
+    EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+    EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+    EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+    EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', DEFAULT_FROM_EMAIL)
+
 # Static files with WhiteNoise
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -1,5 +1,10 @@
-from django.contrib import admin
-from .models import Category, Product, ProductImage, ProductReview, Cart, CartItem, Order, OrderItem, Wishlist, Coupon
+from django import forms
+from django.contrib import admin, messages
+from django.utils import timezone
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from .models import Category, Product, ProductImage, ProductReview, Cart, CartItem, Order, OrderItem, Wishlist, Coupon, Job, final_price_expression
+from .pagination import EstimatedCountPaginator
+from . import inventory
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -12,39 +17,114 @@ class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
 
+class ProductAdminForm(forms.ModelForm):
+    # Product.stock is a live counter that carts take holds out of, so staff
+    # enter a correction to apply to it rather than a new value
+    stock_change = forms.IntegerField(
+        required=False,
+        help_text='Units to add to stock (negative to remove), e.g. 20 for a delivery',
+    )
+    
+    class Meta:
+        model = Product
+        fields = '__all__'
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
     list_display = ['name', 'category', 'price', 'discount_price', 'stock', 'is_active']
+    readonly_fields = ['stock']
     list_filter = ['category', 'is_active', 'created_at']
+    list_select_related = ['category']
     search_fields = ['name', 'description', 'brand']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductImageInline]
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        delta = form.cleaned_data.get('stock_change')
+        if delta and not inventory.adjust_stock(obj, delta):
+            self.message_user(
+                request, f'Stock of {obj.name} was not changed: fewer than {-delta} units are unreserved.',
+                level=messages.WARNING,
+            )
 
 @admin.register(ProductReview)
 class ProductReviewAdmin(admin.ModelAdmin):
     list_display = ['product', 'user', 'rating', 'created_at']
     list_filter = ['rating', 'created_at']
+    list_select_related = ['product', 'user']
     search_fields = ['product__name', 'user__username']
+    raw_id_fields = ['product', 'user']
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_items', 'total_price', 'created_at']
+    list_select_related = ['user']
     readonly_fields = ['total_items', 'total_price']
+    raw_id_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Totals are correlated subqueries, so they are only evaluated for
+        # the rows on the page and the outer query needs no GROUP BY
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        return super().get_queryset(request).annotate(
+            item_count=Subquery(items.annotate(n=Sum('quantity')).values('n')),
+            price_total=Subquery(items.annotate(total=Sum(ExpressionWrapper(
+                F('quantity') * final_price_expression('product__'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ))).values('total')),
+        )
+    
+    @admin.display(description='Total items', ordering='item_count')
+    def total_items(self, obj):
+        return obj.item_count or 0
+    
+    @admin.display(description='Total price', ordering='price_total')
+    def total_price(self, obj):
+        return obj.price_total or 0
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_id', 'user', 'status', 'final_amount', 'created_at']
     list_filter = ['status', 'payment_method', 'created_at']
-    search_fields = ['order_id', 'user__username', 'email']
+    list_select_related = ['user']
+    # Exact and prefix lookups can use the indexes; icontains scans every order
+    search_fields = ['=order_id', '^user__username', '=email']
     readonly_fields = ['order_id', 'created_at', 'updated_at']
+    raw_id_fields = ['user', 'coupon']
+    # Both backed by the created_at indexes on Order
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'added_at']
     list_filter = ['added_at']
+    list_select_related = ['user', 'product']
+    raw_id_fields = ['user', 'product']
 
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
     list_display = ['code', 'discount_type', 'discount_value', 'is_active', 'valid_from', 'valid_to']
     list_filter = ['is_active', 'discount_type', 'valid_from', 'valid_to']
     search_fields = ['code']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_at', 'idempotency_key', 'updated_at']
+    list_filter = ['status', 'name']
+    search_fields = ['idempotency_key']
+    readonly_fields = ['locked_by', 'locked_at', 'last_error', 'created_at', 'updated_at']
+    actions = ['retry_now']
+    
+    @admin.action(description='Retry selected jobs now')
+    def retry_now(self, request, queryset):
+        queryset.exclude(status='running').update(status='pending', run_at=timezone.now(), attempts=0)
+
@@ -0,0 +1,332 @@
+"""
+End-to-end benchmark of the shop's URLs.
+
+``python manage.py benchmark`` runs inside a throwaway test database.
+That database uses the configured engine, so pass ``--settings`` for a
+local SQLite or PostgreSQL setup. The run:
+
+1. seeds the synthetic dataset of ``shop.synthetic`` at a chosen scale
+   factor (``seed_dataset``); the same ``--seed`` always produces the same
+   data;
+2. drives every route in ``shop/urls.py`` through the Django test client.
+   The parameter mix is realistic: product pages follow a Zipf-like
+   popularity curve, and listings cycle through categories, searches,
+   sorts, brand and price filters and second pages. The shopper is the
+   customer with the most orders; staff routes use a separate client;
+3. reports per-route p50/p95/p99 latency, requests per second and queries
+   per request as JSON (``run``).
+
+``compare`` flags routes whose latency or query count regressed between
+two reports. ``manage.py benchmark --compare BASELINE.json`` and
+``manage.py compare_benchmarks`` exit non-zero when there are any.
+
+Requests run one after another (a closed loop with one client), so rps is
+the inverse of the mean latency, not a measure of concurrency. The request
+profiler is turned off for the run.
+"""
+import json
+import platform
+import random
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from urllib.parse import urlencode
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from . import synthetic
+from .models import CartItem, Category, Order, Product, ProductFacetCount
+
+DEFAULT_REQUESTS = 50
+DEFAULT_WARMUP = 5
+DEFAULT_THRESHOLD = 0.10
+# Latency changes smaller than this (ms) are noise, whatever the ratio
+MIN_DELTA_MS = 1.0
+
+STAFF_USERNAME = 'bench-staff'
+
+CHECKOUT_FORM = {
+    'first_name': 'Bench', 'last_name': 'Mark', 'email': 'bench@example.com', 'phone': '5550100',
+    'address': '1 Load St', 'city': 'Perf', 'state': 'CA', 'postal_code': '94000', 'country': 'US',
+    'payment_method': 'card',
+}
+
+
+def seed_dataset(scale=0.1, seed=0):
+    """
+    Fill an empty database with the synthetic dataset for ``scale`` and
+    ``seed`` (see ``shop.synthetic``), plus the staff account the staff-only
+    routes run as. Returns a dict of row counts.
+    """
+    counts = synthetic.generate(scale=scale, seed=seed)
+    User.objects.create_user(STAFF_USERNAME, password=synthetic.PASSWORD, is_staff=True, is_superuser=True)
+    return counts
+
+
+@dataclass
+class Call:
+    method: str
+    path: str
+    client: str = 'shopper'
+    data: dict = None
+    ajax: bool = False
+
+
+class Workload:
+    """Picks route parameters for the benchmark from the seeded data"""
+
+    def __init__(self, rng, clients, shopper):
+        self.rng = rng
+        self.clients = clients
+        self.shopper = shopper
+        # Only ids are kept, so a million-product catalog still fits; rows
+        # are looked up one at a time (untimed) when picked
+        self.product_ids = list(Product.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+        self.categories = list(Category.objects.filter(is_active=True).values_list('slug', flat=True))
+        self.brands = sorted(set(ProductFacetCount.objects.exclude(brand='').values_list('brand', flat=True)))
+        self.order_ids = list(Order.objects.filter(user=self.shopper).values_list('order_id', flat=True))
+
+    def product(self):
+        """``(id, slug, name)`` of a product, popular ones more often"""
+        n = len(self.product_ids)
+        product_id = self.product_ids[synthetic.spread(synthetic.zipf_rank(self.rng, n), n)]
+        return Product.objects.values_list('id', 'slug', 'name').get(pk=product_id)
+
+    def fill_cart(self):
+        """Make sure the shopper's cart has something in it (not timed)"""
+        if not CartItem.objects.filter(cart__user=self.shopper).exists():
+            self.clients['shopper'].post(reverse('add_to_cart', args=[self.product()[0]]), {'quantity': 1})
+
+    def home(self):
+        return Call('GET', reverse('home'), client=self.rng.choice(['anon', 'shopper']))
+
+    def product_list(self):
+        choice = self.rng.randrange(7)
+        params = ''
+        if choice == 1:
+            params = f'?category={self.rng.choice(self.categories)}'
+        elif choice == 2:
+            # A word from the middle of a (synthetic, multi-word) name; any
+            # word of shorter names from other sources
+            words = self.product()[2].split()
+            params = '?' + urlencode({'q': self.rng.choice(words[1:3] or words).lower()})
+        elif choice == 3:
+            params = f'?sort={self.rng.choice(["price_low", "price_high", "name", "rating"])}'
+        elif choice == 4 and self.brands:
+            params = f'?brand={self.rng.choice(self.brands)}'
+        elif choice == 5:
+            params = '?min_price=25&max_price=50'
+        elif choice == 6:
+            # Second page: follow the first page's cursor (not timed)
+            content = self.clients['anon'].get(reverse('product_list')).content.decode()
+            match = re.search(r'\?(cursor=[^"&]+)', content)
+            params = f'?{match.group(1)}' if match else ''
+        return Call('GET', reverse('product_list') + params, client='anon')
+
+    def product_detail(self):
+        return Call('GET', reverse('product_detail', args=[self.product()[1]]), client=self.rng.choice(['anon', 'shopper']))
+
+    def add_to_cart(self):
+        return Call('POST', reverse('add_to_cart', args=[self.product()[0]]), data={'quantity': 1})
+
+    def update_cart_item(self):
+        self.fill_cart()
+        item_id = CartItem.objects.filter(cart__user=self.shopper).values_list('id', flat=True).first()
+        return Call('POST', reverse('update_cart_item', args=[item_id]), data={'quantity': self.rng.randint(1, 3)}, ajax=True)
+
+    def cart_view(self):
+        self.fill_cart()
+        return Call('GET', reverse('cart'))
+
+    def checkout(self):
+        self.fill_cart()
+        return Call('GET', reverse('checkout'))
+
+    def place_order(self):
+        self.fill_cart()
+        return Call('POST', reverse('checkout'), data=CHECKOUT_FORM)
+
+    def wishlist_view(self):
+        return Call('GET', reverse('wishlist'))
+
+    def wishlist_toggle(self):
+        return Call('POST', reverse('wishlist_toggle'), data={
+            'product_id': self.product()[0], 'action': self.rng.choice(['add', 'remove']),
+        }, ajax=True)
+
+    def order_history(self):
+        return Call('GET', reverse('order_history'))
+
+    def order_detail(self):
+        if not self.order_ids:
+            self.order_ids = list(Order.objects.filter(user=self.shopper).values_list('order_id', flat=True))
+        return Call('GET', reverse('order_detail', args=[self.rng.choice(self.order_ids)]))
+
+    def export_data(self):
+        dataset = self.rng.choice(['products', 'orders', 'order_items'])
+        return Call('GET', reverse('export_data', args=[dataset]) + '?format=' + self.rng.choice(['csv', 'jsonl']), client='staff')
+
+    def sales_report(self):
+        return Call('GET', reverse('sales_report'), client='staff')
+
+
+# Route name -> Workload method; every route in shop/urls.py has one
+ROUTES = {
+    'home': 'home',
+    'product_list': 'product_list',
+    'product_detail': 'product_detail',
+    'add_to_cart': 'add_to_cart',
+    'update_cart_item': 'update_cart_item',
+    'cart': 'cart_view',
+    'checkout': 'checkout',
+    'checkout_submit': 'place_order',
+    'wishlist': 'wishlist_view',
+    'wishlist_toggle': 'wishlist_toggle',
+    'order_history': 'order_history',
+    'order_detail': 'order_detail',
+    'export_data': 'export_data',
+    'sales_report': 'sales_report',
+}
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _send(clients, call):
+    client = clients[call.client]
+    extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if call.ajax else {}
+    counter = _QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        if call.method == 'POST':
+            response = client.post(call.path, call.data or {}, **extra)
+        else:
+            response = client.get(call.path, **extra)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+    return elapsed, counter.count, response.status_code
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * pct / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def _summary(timings, queries, errors):
+    total = sum(timings)
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(total / len(timings) * 1000, 3),
+        'rps': round(len(timings) / total, 2) if total else None,
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def run(requests=DEFAULT_REQUESTS, warmup=DEFAULT_WARMUP, seed=0, routes=None, meta=None):
+    """
+    Benchmark ``routes`` (default: all of ROUTES) against the current
+    database, ``requests`` timed calls each, interleaved at random after
+    ``warmup`` untimed calls per route. Returns the JSON-ready report.
+    """
+    routes = routes or list(ROUTES)
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        raise ValueError(f'Unknown routes: {", ".join(sorted(unknown))}')
+
+    shopper = User.objects.filter(is_staff=False).annotate(n=Count('order')).order_by('-n', 'id').first()
+    clients = {'anon': Client(), 'shopper': Client(), 'staff': Client()}
+    clients['shopper'].force_login(shopper)
+    clients['staff'].force_login(User.objects.get(username=STAFF_USERNAME))
+    rng = random.Random(seed)
+    workload = Workload(rng, clients, shopper)
+
+    for name in routes:
+        for _ in range(warmup):
+            _send(clients, getattr(workload, ROUTES[name])())
+
+    schedule = [name for name in routes for _ in range(requests)]
+    rng.shuffle(schedule)
+    results = {name: ([], [], 0) for name in routes}
+    started = time.perf_counter()
+    for name in schedule:
+        elapsed, queries, status = _send(clients, getattr(workload, ROUTES[name])())
+        timings, counts, errors = results[name]
+        timings.append(elapsed)
+        counts.append(queries)
+        if status >= 400:
+            results[name] = (timings, counts, errors + 1)
+    wall = time.perf_counter() - started
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'requests_per_route': requests,
+            'warmup': warmup,
+            'seed': seed,
+            **(meta or {}),
+        },
+        'routes': {name: _summary(*results[name]) for name in routes},
+        'total': {
+            'requests': len(schedule),
+            'seconds': round(wall, 3),
+            'rps': round(len(schedule) / wall, 2) if wall else None,
+        },
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Routes that got worse between two reports: p50/p95 latency up by more
+    than ``threshold`` (and ``MIN_DELTA_MS``), or more queries per request.
+    Returns a list of ``{'route', 'metric', 'baseline', 'current', 'change'}``.
+    """
+    regressions = []
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            old, new = before[metric], now[metric]
+            if new - old > MIN_DELTA_MS and old and (new - old) / old > threshold:
+                regressions.append({'route': name, 'metric': metric, 'baseline': old, 'current': new,
+                                    'change': round((new - old) / old, 3)})
+        if now['queries_mean'] > before['queries_mean'] + 0.5:
+            regressions.append({'route': name, 'metric': 'queries_mean', 'baseline': before['queries_mean'],
+                                'current': now['queries_mean'],
+                                'change': round(now['queries_mean'] - before['queries_mean'], 2)})
+        if now['errors'] > before['errors']:
+            regressions.append({'route': name, 'metric': 'errors', 'baseline': before['errors'],
+                                'current': now['errors'], 'change': now['errors'] - before['errors']})
+    return regressions
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,148 @@
+"""
+Versioned caching for catalog-derived pages and fragments.
+
+Cache keys embed a catalog version stamp held in the shared cache. The
+Product, ProductImage, ProductReview and Category signals in
+``shop.signals`` bump the stamp, so every entry built from older catalog
+data stops being addressed immediately, in every worker, without having to
+track and delete individual keys. ``SHOP_CACHE_TIMEOUT`` is the TTL
+fallback that bounds how long an entry can live regardless.
+
+Active categories, needed on every page, are held in a process-local
+snapshot tagged with a separate category version stamp (``active_categories``).
+Coupon lookups (``shop.coupons``) have their own version stamp as well.
+
+Hits and misses are counted per cache name (``cache_stats`` / ``manage.py
+cache_stats``).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Category
+
+VERSION_KEY = 'shop:catalog:version'
+CATEGORY_VERSION_KEY = 'shop:categories:version'
+COUPON_VERSION_KEY = 'shop:coupons:version'
+STATS_KEY = 'shop:cache:stats:{name}:{outcome}'
+
+DEFAULT_TIMEOUT = 300
+
+# Cache names reported by cache_stats()
+TRACKED_CACHES = ['home_page', 'home_sections', 'coupon_lookup', 'recommended']
+
+# (category version, [Category, ...]) for this process
+_category_snapshot = None
+
+
+def cache_timeout():
+    return getattr(settings, 'SHOP_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _new_version():
+    # Millisecond timestamps never collide with versions handed out before
+    # the stamp was evicted, unlike restarting the count at 1
+    return int(time.time() * 1000)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), timeout=None)
+
+
+def catalog_version():
+    """Return the current catalog version stamp, creating it if needed"""
+    return _get_version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Invalidate every entry keyed on the catalog version"""
+    _bump_version(VERSION_KEY)
+
+
+def category_version():
+    return _get_version(CATEGORY_VERSION_KEY)
+
+
+def bump_category_version():
+    """Make every worker reload its category snapshot on its next request"""
+    _bump_version(CATEGORY_VERSION_KEY)
+
+
+def coupon_version():
+    return _get_version(COUPON_VERSION_KEY)
+
+
+def bump_coupon_version():
+    """Drop every cached coupon lookup (positive and negative)"""
+    _bump_version(COUPON_VERSION_KEY)
+
+
+def active_categories():
+    """
+    Active categories from a process-local snapshot.
+
+    The snapshot is tagged with the category version stamp from the shared
+    cache; a request only costs a cache read unless the stamp has moved, in
+    which case this worker reloads from the database once.
+    """
+    global _category_snapshot
+    version = category_version()
+    snapshot = _category_snapshot
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+    categories = list(Category.objects.filter(is_active=True))
+    _category_snapshot = (version, categories)
+    return categories
+
+
+def catalog_key(name, *parts):
+    """Build a cache key that changes whenever the catalog version is bumped"""
+    return ':'.join(['shop', name, *[str(part) for part in parts], f'v{catalog_version()}'])
+
+
+def record(name, hit):
+    key = STATS_KEY.format(name=name, outcome='hit' if hit else 'miss')
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_or_set(name, key, builder, timeout=None):
+    """Return the cached value for ``key``, calling ``builder`` and storing its result on a miss"""
+    value = cache.get(key)
+    if value is not None:
+        record(name, True)
+        return value
+    record(name, False)
+    value = builder()
+    cache.set(key, value, cache_timeout() if timeout is None else timeout)
+    return value
+
+
+def cache_stats(names=None):
+    """Return ``{name: {'hit': n, 'miss': n}}`` for the tracked caches"""
+    names = names or TRACKED_CACHES
+    keys = {
+        (name, outcome): STATS_KEY.format(name=name, outcome=outcome)
+        for name in names
+        for outcome in ('hit', 'miss')
+    }
+    values = cache.get_many(keys.values())
+    return {
+        name: {outcome: values.get(keys[(name, outcome)], 0) for outcome in ('hit', 'miss')}
+        for name in names
+    }
@@ -0,0 +1,14 @@
+"""
+Cart summary service.
+
+The header badge needs the item count and subtotal on every page. Both
+come from a single aggregate over the user's cart items joined to their
+products (``CartItemQuerySet.totals``), instead of loading the cart and
+walking ``items.all()``.
+"""
+from .models import CartItem
+
+
+def cart_summary(user):
+    """Return ``{'total_items': int, 'total_price': Decimal}`` for a user's cart in one query"""
+    return CartItem.objects.filter(cart__user=user).totals()
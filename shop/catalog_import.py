@@ -0,0 +1,117 @@
+"""
+Bulk catalog upserts for ``manage.py import_catalog``.
+
+Validated rows (see ``shop.catalog_rows``) are written a batch at a time:
+
+* categories are created once per new ``category_slug`` (existing ones are
+  left as they are) and remembered for the rest of the run;
+* products are upserted on ``slug`` with a single
+  ``bulk_create(update_conflicts=True)``;
+* listed images that a product does not have yet are added with one
+  ``bulk_create``, every product's ``primary_image`` is recomputed with
+  one ``UPDATE``, and the images get their variant jobs queued in one
+  ``INSERT``.
+
+Bulk writes skip model signals, so the batch's search terms are rebuilt
+here, and ``finish_import`` recomputes facet counts and bumps the cache
+version stamps once at the end.
+
+Feed stock is what is on hand. ``Product.stock`` counts unreserved stock,
+so once the upsert has written the feed counts, the quantities carts
+currently hold are taken out of them, and sharded products have the result
+spread over their shards (``inventory.settle_imported_stock``).
+"""
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from . import caching, facets, images, inventory, search
+from .models import Category, Product, ProductImage
+
+PRODUCT_UPDATE_FIELDS = [
+    'name', 'description', 'price', 'discount_price', 'category', 'brand', 'stock', 'is_active', 'updated_at',
+]
+
+
+def _category_ids(rows, known):
+    """Map each row's category_slug to an id, creating missing categories"""
+    wanted = {row['category_slug']: row['category'] for row in rows if row['category_slug'] not in known}
+    if wanted:
+        known.update(Category.objects.filter(slug__in=wanted).values_list('slug', 'id'))
+        missing = [Category(slug=slug, name=name) for slug, name in wanted.items() if slug not in known]
+        if missing:
+            Category.objects.bulk_create(missing, ignore_conflicts=True)
+            known.update(Category.objects.filter(slug__in=[c.slug for c in missing]).values_list('slug', 'id'))
+    return known
+
+
+def _upsert_products(rows, category_ids):
+    products = [
+        Product(
+            slug=row['slug'],
+            name=row['name'],
+            description=row['description'],
+            price=row['price'],
+            discount_price=row['discount_price'],
+            category_id=category_ids[row['category_slug']],
+            brand=row['brand'],
+            stock=row['stock'],
+            is_active=row['is_active'],
+        )
+        for row in rows
+    ]
+    unique_fields = ['slug'] if connection.features.supports_update_conflicts_with_target else None
+    Product.objects.bulk_create(
+        products, update_conflicts=True, unique_fields=unique_fields, update_fields=PRODUCT_UPDATE_FIELDS,
+    )
+    # Not every backend returns ids from an upsert
+    ids = dict(Product.objects.filter(slug__in=[p.slug for p in products]).values_list('slug', 'id'))
+    for product in products:
+        product.pk = ids[product.slug]
+    return products
+
+
+def _add_images(rows, product_ids):
+    listed = {product_ids[row['slug']]: row['images'] for row in rows if row['images']}
+    if not listed:
+        return 0
+    existing = {}
+    for product_id, image in ProductImage.objects.filter(product_id__in=listed).values_list('product_id', 'image'):
+        existing.setdefault(product_id, set()).add(image)
+    new_images = [
+        ProductImage(product_id=product_id, image=path, is_primary=index == 0 and product_id not in existing)
+        for product_id, paths in listed.items()
+        for index, path in enumerate(paths)
+        if path not in existing.get(product_id, ())
+    ]
+    ProductImage.objects.bulk_create(new_images)
+    # bulk_create skips the post_save signal that queues variant jobs, and
+    # not every backend returns the new ids, so read the rows back
+    images.queue_variants(ProductImage.objects.filter(product_id__in=listed).only('id', 'image', 'variants'))
+    Product.objects.filter(pk__in=listed).update(primary_image_id=Subquery(
+        ProductImage.objects.filter(product_id=OuterRef('pk')).order_by('-is_primary', 'id').values('id')[:1]
+    ))
+    return len(new_images)
+
+
+def upsert_batch(rows, category_ids):
+    """
+    Write one batch of validated rows, returning ``(products, images)`` counts.
+
+    ``category_ids`` is a ``{slug: id}`` dict reused across batches.
+    """
+    # The last row wins when a slug repeats within a batch
+    rows = list({row['slug']: row for row in rows}.values())
+    with transaction.atomic():
+        _category_ids(rows, category_ids)
+        products = _upsert_products(rows, category_ids)
+        inventory.settle_imported_stock([product.pk for product in products])
+        image_count = _add_images(rows, {product.slug: product.pk for product in products})
+        search.index_products(products)
+    return len(products), image_count
+
+
+def finish_import():
+    """Refresh the data that product signals would normally keep current"""
+    facets.rebuild_facets()
+    transaction.on_commit(caching.bump_catalog_version)
+    transaction.on_commit(caching.bump_category_version)
@@ -0,0 +1,170 @@
+"""
+Reading and validating catalog feed rows.
+
+This module deliberately imports no models: ``parse_row`` runs in the
+worker processes of ``manage.py import_catalog``, which never set up the
+ORM. The database side of the import lives in ``shop.catalog_import``.
+
+Recognised columns (CSV header or JSONL keys):
+
+    slug           unique key; derived from ``name`` when blank
+    name           required
+    description
+    price          required, > 0
+    discount_price optional, must be below ``price``
+    stock          integer >= 0 (default 0)
+    brand
+    is_active      true/false/1/0/yes/no (default true)
+    category       category name, required
+    category_slug  derived from ``category`` when blank
+    images         image paths relative to MEDIA_ROOT, separated by ``|``
+                   (a list in JSONL); the first one becomes the primary image
+"""
+import csv
+import gzip
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.utils.text import slugify
+
+MAX_NAME_LENGTH = 200
+MAX_BRAND_LENGTH = 100
+MAX_CATEGORY_LENGTH = 100
+MAX_SLUG_LENGTH = 50
+MAX_PRICE = Decimal('99999999.99')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(path, fmt=None):
+    """Yield ``(line_number, raw_row)`` pairs from a CSV or JSONL file, one at a time"""
+    fmt = fmt or detect_format(path)
+    with _open(path) as handle:
+        if fmt == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    row = {'__error__': f'invalid JSON: {exc}'}
+                yield line_number, row
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(value, field, errors, required=False):
+    if value in (None, ''):
+        if required:
+            errors.append(f'{field} is required')
+        return None
+    try:
+        number = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        errors.append(f'{field} is not a number: {value!r}')
+        return None
+    if number <= 0 or number > MAX_PRICE:
+        errors.append(f'{field} out of range: {value}')
+        return None
+    return number
+
+
+def _images(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split('|')
+    return [str(path).strip() for path in value if str(path).strip()]
+
+
+def parse_row(item):
+    """
+    Validate one raw row.
+
+    Takes ``(line_number, raw_row)`` and returns ``(line_number, clean_row,
+    errors)``; ``clean_row`` is None when there are errors.
+    """
+    line_number, row = item
+    if not isinstance(row, dict):
+        return line_number, None, ['row is not an object']
+    if '__error__' in row:
+        return line_number, None, [row['__error__']]
+    errors = []
+
+    name = _text(row, 'name')
+    if not name:
+        errors.append('name is required')
+    elif len(name) > MAX_NAME_LENGTH:
+        errors.append(f'name longer than {MAX_NAME_LENGTH} characters')
+
+    slug = slugify(_text(row, 'slug') or name)[:MAX_SLUG_LENGTH]
+    if not slug:
+        errors.append('slug is required')
+
+    price = _decimal(row.get('price'), 'price', errors, required=True)
+    discount_price = _decimal(row.get('discount_price'), 'discount_price', errors)
+    if price is not None and discount_price is not None and discount_price >= price:
+        errors.append('discount_price must be below price')
+
+    stock = 0
+    if _text(row, 'stock'):
+        try:
+            stock = int(_text(row, 'stock'))
+        except ValueError:
+            errors.append(f'stock is not an integer: {row.get("stock")!r}')
+        else:
+            if stock < 0:
+                errors.append('stock cannot be negative')
+
+    is_active = True
+    active_text = _text(row, 'is_active').lower()
+    if active_text in FALSE_VALUES:
+        is_active = False
+    elif active_text and active_text not in TRUE_VALUES:
+        errors.append(f'is_active is not a boolean: {row.get("is_active")!r}')
+
+    brand = _text(row, 'brand')
+    if len(brand) > MAX_BRAND_LENGTH:
+        errors.append(f'brand longer than {MAX_BRAND_LENGTH} characters')
+
+    category = _text(row, 'category')
+    category_slug = slugify(_text(row, 'category_slug') or category)[:MAX_SLUG_LENGTH]
+    if not category or not category_slug:
+        errors.append('category is required')
+    elif len(category) > MAX_CATEGORY_LENGTH:
+        errors.append(f'category longer than {MAX_CATEGORY_LENGTH} characters')
+
+    if errors:
+        return line_number, None, errors
+    return line_number, {
+        'slug': slug,
+        'name': name,
+        'description': _text(row, 'description'),
+        'price': price,
+        'discount_price': discount_price,
+        'stock': stock,
+        'brand': brand,
+        'is_active': is_active,
+        'category': category,
+        'category_slug': category_slug,
+        'images': _images(row.get('images')),
+    }, []
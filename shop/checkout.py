@@ -0,0 +1,102 @@
+"""
+Checkout pipeline.
+
+``place_order`` turns a cart into an order inside a single transaction:
+
+1. Lock the cart row, so a double-submitted checkout waits and then finds
+   the cart already emptied.
+2. Make sure every cart item is fully covered by a stock hold (see
+   ``shop.inventory``), re-holding anything whose hold expired. Holds are
+   taken with conditional counter updates, so there is no need to lock the
+   product rows themselves.
+3. If a coupon code was given, validate it against the subtotal and claim
+   one use with a conditional ``used_count`` increment (see
+   ``shop.coupons``); a rollback gives the use back.
+4. Insert the order, ``bulk_create`` its items, then convert the holds
+   into a sale and clear the cart (``inventory.commit_cart``). That takes
+   one ``DELETE`` for the holds and a load plus one ``DELETE`` for the
+   items, with no per-item release of holds that were just sold.
+5. Queue the follow-up work (confirmation email, recommendation refresh)
+   as background jobs (see ``shop.jobs``) instead of doing it inside the
+   request.
+
+Any shortfall is reported for every affected item and nothing is written.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import coupons, inventory, jobs
+from .coupons import CouponError  # noqa: F401 (re-exported for callers)
+from .inventory import Shortfall  # noqa: F401 (re-exported for callers)
+from .models import Cart, CartItem, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(', '.join(
+            f'{s.product.name}: requested {s.requested}, available {s.available}' for s in shortfalls
+        ))
+
+
+def place_order(cart, order, coupon_code=None):
+    """
+    Create ``order`` (an unsaved Order with customer fields filled in) from
+    ``cart``, converting the cart's stock holds into a sale and applying
+    ``coupon_code`` if given. Raises EmptyCart, InsufficientStock or
+    CouponError without writing anything.
+    """
+    with transaction.atomic():
+        Cart.objects.select_for_update().filter(pk=cart.pk).first()
+        cart_items = list(CartItem.objects.filter(cart=cart).select_related('product').order_by('product_id'))
+        if not cart_items:
+            raise EmptyCart()
+
+        shortfalls = inventory.hold_cart(cart, cart_items)
+        if shortfalls:
+            raise InsufficientStock(shortfalls)
+
+        products = Product.objects.in_bulk({item.product_id for item in cart_items})
+
+        order_items = []
+        total = Decimal('0')
+        for item in cart_items:
+            product = products[item.product_id]
+            price = product.get_final_price()
+            line_total = price * item.quantity
+            total += line_total
+            order_items.append(OrderItem(
+                product=product,
+                quantity=item.quantity,
+                price=price,
+                total_price=line_total,
+            ))
+
+        if coupon_code:
+            coupon, order.discount_amount = coupons.validate(coupon_code, total)
+            coupons.redeem(coupon)
+            order.coupon_id = coupon.pk
+
+        order.total_amount = total
+        order.final_amount = total - (order.discount_amount or 0) + (order.tax_amount or 0)
+        order.save()
+        for order_item in order_items:
+            order_item.order = order
+        OrderItem.objects.bulk_create(order_items)
+
+        inventory.commit_cart(cart)
+
+        # Post-order work runs in the job worker; the job row commits (or
+        # rolls back) together with the order
+        jobs.enqueue('order_confirmation', {'order_id': order.order_id}, key=f'order_confirmation:{order.order_id}')
+        jobs.enqueue('refresh_recommendations', {'user_id': order.user_id}, key=f'refresh_recommendations:{order.order_id}')
+    return order
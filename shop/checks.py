@@ -0,0 +1,25 @@
+"""
+System checks for deployment settings (``manage.py check --deploy``).
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends that keep their data inside one process
+PROCESS_LOCAL_CACHES = frozenset([
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+])
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The catalog/category/coupon version stamps (shop.caching) need a cache every worker shares"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is local to each process.',
+        hint='Set REDIS_URL so every worker sees the same cache version stamps; otherwise '
+             'workers other than the one handling an edit keep serving stale pages.',
+        id='shop.W001',
+    )]
@@ -1,4 +1,5 @@
-from .models import Cart, Category
+from .caching import active_categories
+from .cart import cart_summary
 
 def cart_context(request):
     """Context processor to add cart information to all templates"""
@@ -9,20 +10,16 @@ def cart_context(request):
     
     if request.user.is_authenticated:
         try:
-            cart = Cart.objects.get(user=request.user)
-            context['cart_total_items'] = cart.total_items
-            context['cart_total_price'] = cart.total_price
-        except Cart.DoesNotExist:
-            # Cart doesn't exist yet, will be created when needed
-            pass
+            summary = cart_summary(request.user)
+            context['cart_total_items'] = summary['total_items']
+            context['cart_total_price'] = summary['total_price']
         except Exception:
-            # Handle any other errors gracefully
+            # Handle any errors gracefully
             pass
     
     return context
 
 def categories_context(request):
     """Context processor to add categories to all templates"""
-    categories = Category.objects.filter(is_active=True)
-    return {'categories': categories}
+    return {'categories': active_categories()}
 
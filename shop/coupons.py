@@ -0,0 +1,123 @@
+"""
+Coupon validation and redemption.
+
+``validate`` checks a code against a cart subtotal and works out the
+discount; ``redeem`` claims one use of the coupon with a conditional
+``UPDATE ... SET used_count = used_count + 1 WHERE used_count < usage_limit``,
+so concurrent checkouts can never push a coupon past its usage limit.
+``place_order`` calls both inside its transaction, so a failed order gives
+the use back.
+
+Lookups go through the cache, including misses: a code that does not
+exist is remembered for ``NEGATIVE_TIMEOUT`` seconds, so repeated guesses
+at bad codes do not reach the database. Malformed codes are rejected
+before any lookup. Coupon saves and deletes bump the coupon version stamp
+(see ``shop.signals``), which drops every cached lookup at once.
+"""
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching
+from .models import Coupon
+
+CODE_RE = re.compile(r'^[A-Za-z0-9_-]{1,50}$')
+
+# Cached stand-in for "no such coupon" (the cache returns None for misses)
+MISSING = 'missing'
+NEGATIVE_TIMEOUT = 60
+
+CACHED_FIELDS = [
+    'id', 'code', 'discount_type', 'discount_value', 'min_order_amount', 'max_discount',
+    'valid_from', 'valid_to', 'is_active', 'usage_limit', 'used_count',
+]
+
+CENT = Decimal('0.01')
+
+
+class CouponError(Exception):
+    """The code cannot be used; the message is safe to show the customer"""
+
+
+def normalize(code):
+    return (code or '').strip().upper()
+
+
+def _key(code):
+    return f'shop:coupon:{code}:v{caching.coupon_version()}'
+
+
+def lookup(code):
+    """Return an (unsaved) Coupon for ``code`` from the cache or database, or None"""
+    code = normalize(code)
+    if not CODE_RE.match(code):
+        return None
+    key = _key(code)
+    values = cache.get(key)
+    caching.record('coupon_lookup', values is not None)
+    if values is None:
+        values = Coupon.objects.filter(code__iexact=code).values(*CACHED_FIELDS).first()
+        if values is None:
+            cache.set(key, MISSING, NEGATIVE_TIMEOUT)
+        else:
+            cache.set(key, values, caching.cache_timeout())
+    if values is None or values == MISSING:
+        return None
+    return Coupon(**values)
+
+
+def forget(code):
+    cache.delete(_key(normalize(code)))
+
+
+def discount_for(coupon, subtotal):
+    """Discount ``coupon`` gives on ``subtotal``, never more than the subtotal"""
+    if coupon.discount_type == 'percent':
+        discount = subtotal * coupon.discount_value / Decimal('100')
+    else:
+        discount = coupon.discount_value
+    if coupon.max_discount is not None:
+        discount = min(discount, coupon.max_discount)
+    return min(discount, subtotal).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def validate(code, subtotal):
+    """
+    Check ``code`` against a cart subtotal.
+
+    Returns ``(coupon, discount)`` or raises CouponError. Usage counts come
+    from the cached lookup and may be slightly stale; ``redeem`` has the
+    final word.
+    """
+    coupon = lookup(code)
+    if coupon is None or not coupon.is_active:
+        raise CouponError('This coupon code is not valid.')
+    now = timezone.now()
+    if now < coupon.valid_from:
+        raise CouponError('This coupon is not active yet.')
+    if now > coupon.valid_to:
+        raise CouponError('This coupon has expired.')
+    if coupon.used_count >= coupon.usage_limit:
+        raise CouponError('This coupon has been fully redeemed.')
+    if subtotal < coupon.min_order_amount:
+        raise CouponError(f'This coupon needs a minimum order of ${coupon.min_order_amount}.')
+    return coupon, discount_for(coupon, subtotal)
+
+
+def redeem(coupon):
+    """Claim one use of ``coupon``; raises CouponError if none are left"""
+    now = timezone.now()
+    claimed = Coupon.objects.filter(
+        pk=coupon.pk,
+        is_active=True,
+        valid_from__lte=now,
+        valid_to__gte=now,
+        used_count__lt=F('usage_limit'),
+    ).update(used_count=F('used_count') + 1)
+    if not claimed:
+        # The cached copy was out of date; make the next lookup re-read it
+        forget(coupon.code)
+        raise CouponError('This coupon can no longer be used.')
@@ -0,0 +1,206 @@
+"""
+Precomputed facet counts for the product listing sidebar.
+
+``ProductFacetCount`` holds one row per (category, brand, price bucket)
+combination with the number of active products in it. The table is tiny
+compared to ``shop_product``, so counts for any mix of category/brand/price
+filters come from a ``SUM ... GROUP BY`` over it rather than over the
+catalog. Each facet ignores its own filter (standard drill-down behaviour):
+the brand list is counted within the selected category and price range, etc.
+
+The migration that creates the table seeds it from the existing catalog.
+After that, counts are adjusted incrementally by the Product signals in
+``shop.signals``; ``python manage.py rebuild_facets`` recomputes them from
+scratch after bulk loads that bypass signals.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Product, ProductFacetCount
+
+# Half-open [low, high) ranges on Product.price; None means unbounded
+PRICE_BUCKETS = [
+    (Decimal('0'), Decimal('25')),
+    (Decimal('25'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('250')),
+    (Decimal('250'), Decimal('500')),
+    (Decimal('500'), None),
+]
+
+# Product fields that determine which facet cell a product belongs to
+FACET_FIELDS = frozenset(['category', 'category_id', 'brand', 'price', 'is_active'])
+
+# Marker for saves that cannot have moved a product between cells
+UNCHANGED = object()
+
+
+def price_bucket(price):
+    """Return the PRICE_BUCKETS index containing ``price``"""
+    price = Decimal(price)
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        if high is None or price < high:
+            return index
+    return len(PRICE_BUCKETS) - 1
+
+
+def bucket_label(index):
+    low, high = PRICE_BUCKETS[index]
+    if high is None:
+        return f'${low}+'
+    return f'${low} - ${high}'
+
+
+def bucket_for_range(min_price, max_price):
+    """Return the bucket index matching a min/max price filter exactly, else None"""
+    if not min_price and not max_price:
+        return None
+    try:
+        low = Decimal(min_price) if min_price else Decimal('0')
+        high = Decimal(max_price) if max_price else None
+    except ArithmeticError:
+        return None
+    for index, bucket in enumerate(PRICE_BUCKETS):
+        if bucket == (low, high):
+            return index
+    return None
+
+
+def facet_key(category_id, brand, price, is_active):
+    """Facet cell for a product's values, or None if it should not be counted"""
+    if not is_active or category_id is None or price is None:
+        return None
+    return (category_id, brand or '', price_bucket(price))
+
+
+def adjust(key, delta):
+    """Add ``delta`` to the count of one facet cell"""
+    if key is None or not delta:
+        return
+    category_id, brand, bucket = key
+    cell = ProductFacetCount.objects.filter(category_id=category_id, brand=brand, price_bucket=bucket)
+    if cell.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            ProductFacetCount.objects.create(
+                category_id=category_id, brand=brand, price_bucket=bucket, count=delta
+            )
+    except IntegrityError:
+        # Another writer created the cell first
+        cell.update(count=F('count') + delta)
+
+
+def rebuild_facets():
+    """Recompute every facet cell from the catalog, returning the number of cells"""
+    cells = {}
+    rows = (
+        Product.objects.filter(is_active=True)
+        .values('category_id', 'brand', 'price')
+        .annotate(n=Count('id'))
+    )
+    for row in rows.iterator():
+        key = facet_key(row['category_id'], row['brand'], row['price'], True)
+        cells[key] = cells.get(key, 0) + row['n']
+
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.objects.bulk_create(
+            [
+                ProductFacetCount(category_id=c, brand=b, price_bucket=p, count=n)
+                for (c, b, p), n in cells.items()
+            ],
+            batch_size=1000,
+        )
+    return len(cells)
+
+
+def _cells(category_id=None, brands=None, bucket=None):
+    cells = ProductFacetCount.objects.filter(count__gt=0, category__is_active=True)
+    if category_id is not None:
+        cells = cells.filter(category_id=category_id)
+    if brands:
+        cells = cells.filter(brand__in=brands)
+    if bucket is not None:
+        cells = cells.filter(price_bucket=bucket)
+    return cells
+
+
+def get_facets(category_id=None, brands=None, bucket=None):
+    """
+    Facet counts for the given active filters, from the precomputed cells.
+
+    Returns ``{'categories': [...], 'brands': [...], 'price_buckets': [...]}``
+    where every entry is a dict with a ``count``.
+    """
+    categories = (
+        _cells(brands=brands, bucket=bucket)
+        .values('category_id', 'category__name', 'category__slug')
+        .annotate(total=Sum('count'))
+        .order_by('category__name')
+    )
+    brand_counts = (
+        _cells(category_id=category_id, bucket=bucket)
+        .exclude(brand='')
+        .values('brand')
+        .annotate(total=Sum('count'))
+        .order_by('brand')
+    )
+    bucket_counts = dict(
+        _cells(category_id=category_id, brands=brands)
+        .values_list('price_bucket')
+        .annotate(total=Sum('count'))
+    )
+    return _format(categories, brand_counts, bucket_counts)
+
+
+def get_facets_live(queryset):
+    """
+    Facet counts computed directly from a filtered Product queryset.
+
+    Used when the active filters cannot be expressed in facet cells (a text
+    search or a custom price range); the queryset is already narrowed, so
+    the GROUP BYs only touch matching rows.
+    """
+    queryset = queryset.order_by()
+    categories = (
+        queryset.filter(category__is_active=True)
+        .values('category_id', 'category__name', 'category__slug')
+        .annotate(total=Count('id'))
+        .order_by('category__name')
+    )
+    brand_counts = (
+        queryset.exclude(brand='')
+        .values('brand')
+        .annotate(total=Count('id'))
+        .order_by('brand')
+    )
+    bucket_counts = {}
+    for price, n in queryset.values_list('price').annotate(n=Count('id')):
+        index = price_bucket(price)
+        bucket_counts[index] = bucket_counts.get(index, 0) + n
+    return _format(categories, brand_counts, bucket_counts)
+
+
+def _format(categories, brand_counts, bucket_counts):
+    return {
+        'categories': [
+            {'slug': row['category__slug'], 'name': row['category__name'], 'count': row['total']}
+            for row in categories
+        ],
+        'brands': [{'value': row['brand'], 'count': row['total']} for row in brand_counts],
+        'price_buckets': [
+            {
+                'index': index,
+                'label': bucket_label(index),
+                'min': PRICE_BUCKETS[index][0],
+                'max': PRICE_BUCKETS[index][1],
+                'count': bucket_counts[index],
+            }
+            for index in range(len(PRICE_BUCKETS))
+            if bucket_counts.get(index)
+        ],
+    }
+
@@ -41,6 +41,14 @@ class CheckoutForm(forms.ModelForm):
             'placeholder': 'Phone Number'
         })
     )
+    coupon_code = forms.CharField(
+        max_length=50,
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Coupon Code'
+        })
+    )
     
     class Meta:
         model = Order
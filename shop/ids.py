@@ -0,0 +1,104 @@
+"""
+Time-ordered order identifiers.
+
+``new_order_id`` returns a 20 character ULID-style ID: a 10 character
+millisecond timestamp followed by 10 characters (50 bits) of randomness,
+both in Crockford base32 (uppercase, no I/L/O/U). IDs from one process
+are strictly increasing, even within the same millisecond or if the clock
+steps back. Within a millisecond the random part of the next ID is the
+last one plus a random step of up to 2**40, so knowing one ID still leaves
+about a trillion candidates for the next. New rows always append to the
+right-hand edge of the unique index instead of splitting pages all over
+it, and a time window maps to a contiguous ``order_id`` range
+(``order_id_range``).
+
+Orders created before the switch keep their lowercase hex ``uuid4`` IDs
+and stay reachable at the same URLs; they simply carry no timestamp
+(``timestamp_of`` returns None for them).
+"""
+import secrets
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+TIME_CHARS = 10
+RANDOM_CHARS = 10
+RANDOM_BITS = RANDOM_CHARS * 5
+RANDOM_MAX = (1 << RANDOM_BITS) - 1
+# Largest random step between two IDs issued in the same millisecond
+RANDOM_STEP = 1 << 40
+
+_lock = threading.Lock()
+_last = (0, 0)  # (milliseconds, random part) of the last ID issued
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def _decode(text):
+    value = 0
+    for char in text:
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+def _millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def new_order_id():
+    """Return a new, unguessable, time-ordered 20 character order ID"""
+    global _last
+    with _lock:
+        now = int(time.time() * 1000)
+        last_ms, last_random = _last
+        if now > last_ms:
+            ms, random_part = now, secrets.randbits(RANDOM_BITS)
+        elif RANDOM_MAX - last_random >= RANDOM_STEP:
+            # Same millisecond (or the clock went back): stay ahead of the
+            # last ID by stepping the random part
+            ms, random_part = last_ms, last_random + 1 + secrets.randbelow(RANDOM_STEP)
+        else:
+            # No room left for a full step: move on to the next millisecond
+            ms, random_part = last_ms + 1, secrets.randbits(RANDOM_BITS)
+        _last = (ms, random_part)
+    return _encode(ms, TIME_CHARS) + _encode(random_part, RANDOM_CHARS)
+
+
+def order_id_at(moment, random_part):
+    """
+    The ID an order created at ``moment`` would get, with the given random
+    part (0 <= random_part <= RANDOM_MAX). For generated or back-dated rows;
+    unlike new_order_id it keeps no ordering state between calls.
+    """
+    return _encode(_millis(moment), TIME_CHARS) + _encode(random_part & RANDOM_MAX, RANDOM_CHARS)
+
+
+def timestamp_of(order_id):
+    """Creation time encoded in a time-ordered ID, or None for legacy IDs"""
+    if len(order_id) != TIME_CHARS + RANDOM_CHARS or any(char not in ALPHABET for char in order_id):
+        return None
+    return datetime.fromtimestamp(_decode(order_id[:TIME_CHARS]) / 1000, tz=dt_timezone.utc)
+
+
+def order_id_range(start, end):
+    """
+    Q for orders created in ``[start, end)``, answered from the order_id index.
+
+    The ID bounds select a contiguous slice of the unique index; the
+    ``created_at`` terms keep the result exact on case-insensitive
+    collations, where legacy lowercase IDs can sort into the slice. Legacy
+    orders themselves are only matched by ``created_at``, so use a plain
+    ``created_at`` filter for windows before the switch.
+    """
+    low = _encode(_millis(start), TIME_CHARS) + ALPHABET[0] * RANDOM_CHARS
+    high = _encode(_millis(end), TIME_CHARS) + ALPHABET[0] * RANDOM_CHARS
+    return Q(order_id__gte=low, order_id__lt=high, created_at__gte=start, created_at__lt=end)
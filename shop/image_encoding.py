@@ -0,0 +1,55 @@
+"""
+Pillow encoding of product image variants.
+
+Like ``shop.catalog_rows`` this module imports no models, so
+``encode_variants`` can run in the worker processes of ``manage.py
+generate_image_variants``. Storage and bookkeeping live in ``shop.images``.
+"""
+import io
+
+from PIL import Image, ImageOps, features
+
+# Widths (px) matching the sizes templates draw images at, plus 2x/hi-dpi
+WIDTHS = (80, 250, 600, 1200)
+
+# format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != 'webp' or features.check('webp')]
+
+
+def _flatten(image):
+    """RGB copy of an image, with any transparency composited onto white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def encode_variants(source, widths=WIDTHS, formats=None):
+    """
+    Resize and encode image bytes.
+
+    Returns a list of ``(format, width, height, data)``. Images are never
+    scaled up; widths above the original collapse into one variant at the
+    original size.
+    """
+    formats = formats or available_formats()
+    with Image.open(io.BytesIO(source)) as original:
+        image = _flatten(ImageOps.exif_transpose(original))
+    variants = []
+    for width in sorted({min(width, image.width) for width in widths}):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, **FORMATS[fmt][1])
+            variants.append((fmt, width, height, buffer.getvalue()))
+    return variants
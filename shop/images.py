@@ -0,0 +1,118 @@
+"""
+Sized, pre-encoded variants of product images.
+
+Each ``ProductImage`` gets resized copies at ``image_encoding.WIDTHS`` in
+WebP and JPEG. Files are stored content-addressed under ``variants/``
+(named by the SHA-256 of their bytes), so identical uploads share files
+and regenerating is idempotent. The list of variants is kept on
+``ProductImage.variants``, which listings already load through
+``select_related('primary_image')``; the ``{% product_image %}`` tag
+(``shop_images`` library) turns it into a ``<picture>`` with ``srcset``
+so browsers download the smallest file that fills the slot.
+
+New uploads are processed by background jobs (``queue_variants``), queued
+from ``shop.signals`` and by the catalog import;
+``manage.py generate_image_variants`` backfills existing images with a
+process pool.
+"""
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from . import jobs
+from .image_encoding import FORMATS, encode_variants
+from .models import ProductImage
+
+VARIANT_DIR = 'variants'
+
+
+def variant_name(data, fmt):
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest}.{FORMATS[fmt][0]}'
+
+
+def store_variants(source_name, encoded):
+    """Save encoded variants and return the ``ProductImage.variants`` value for them"""
+    variants = {'source': source_name}
+    for fmt, width, height, data in encoded:
+        name = variant_name(data, fmt)
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        variants.setdefault(fmt, []).append([width, height, name])
+    return variants
+
+
+def read_source(image):
+    with image.image.open('rb') as handle:
+        return handle.read()
+
+
+def needs_variants(image):
+    return bool(image.image) and (image.variants or {}).get('source') != image.image.name
+
+
+def queue_variants(images):
+    """Queue an ``image_variants`` job for each of ``images`` that needs one"""
+    jobs.enqueue_many('image_variants', [
+        ({'image_id': image.pk, 'name': image.image.name}, f'image_variants:{image.pk}:{image.image.name}'[:200])
+        for image in images
+        if needs_variants(image)
+    ])
+
+
+def generate_variants(image):
+    """Build and record the variants of one image (runs in the current process)"""
+    variants = store_variants(image.image.name, encode_variants(read_source(image)))
+    # A plain UPDATE: saving the instance would queue another job
+    ProductImage.objects.filter(pk=image.pk, image=image.image.name).update(variants=variants)
+    image.variants = variants
+    return variants
+
+
+def backfill_variants(workers=None, force=False, batch_size=50, on_error=None):
+    """
+    Generate variants for every image that lacks up-to-date ones, encoding
+    in a process pool. Returns ``(processed, failed)``.
+    """
+    images = ProductImage.objects.exclude(image='').order_by('pk')
+    processed = failed = 0
+    last = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(images.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            last = batch[-1].pk
+            todo = [image for image in batch if force or needs_variants(image)]
+            sources = {}
+            for image in todo:
+                try:
+                    sources[image.pk] = read_source(image)
+                except (OSError, ValueError) as exc:
+                    failed += 1
+                    if on_error:
+                        on_error(image, exc)
+            futures = {image.pk: pool.submit(encode_variants, sources[image.pk]) for image in todo if image.pk in sources}
+            for image in todo:
+                if image.pk not in futures:
+                    continue
+                try:
+                    variants = store_variants(image.image.name, futures[image.pk].result())
+                except Exception as exc:
+                    failed += 1
+                    if on_error:
+                        on_error(image, exc)
+                    continue
+                ProductImage.objects.filter(pk=image.pk, image=image.image.name).update(variants=variants)
+                processed += 1
+    return processed, failed
+
+
+def variant_urls(image, fmt):
+    """``[(width, height, url), ...]`` for one format, smallest first"""
+    return [
+        (width, height, default_storage.url(name))
+        for width, height, name in (image.variants or {}).get(fmt, [])
+    ]
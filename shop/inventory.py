@@ -0,0 +1,366 @@
+"""
+Inventory reservations.
+
+Stock is held for a cart as soon as an item is added, and the hold is
+renewed when checkout starts. Each hold is a ``StockReservation`` row with
+an expiry (``SHOP_RESERVATION_TTL`` seconds). The held quantity is taken
+out of the available counter when the hold is placed, so the counters
+always show unreserved stock:
+
+* placing a hold is a conditional ``UPDATE ... SET n = n - q WHERE n >= q``;
+* committing an order just deletes its cart's reservation rows, since the
+  stock was already taken, and empties the cart;
+* releasing a hold (cart item removed or reduced, cart deleted, or the
+  hold expiring and being swept by ``manage.py release_expired_reservations``)
+  gives the quantity back to the counter it came from.
+
+``Product.stock`` therefore means unreserved stock (on hand minus held), not
+what is on the shelf. It is only ever changed with relative ``F()``
+updates: holds and releases here, staff corrections through
+``adjust_stock`` (the admin's "stock change" field), and catalog imports
+through ``settle_imported_stock``. ``Product.save()`` leaves it out of the
+``UPDATE`` for existing rows, so a stale instance cannot write it back.
+
+Most products keep their counter in ``Product.stock``. For hot products,
+``set_stock_shards`` spreads the available stock over several
+``StockShard`` rows; holds pick a shard at random, so concurrent checkouts
+update different rows instead of queueing on one row lock. For those
+products ``Product.stock`` is a display snapshot that the sweeper refreshes.
+"""
+import random
+from collections import namedtuple
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import CartItem, Product, StockReservation, StockShard
+
+DEFAULT_TTL = 15 * 60
+
+Shortfall = namedtuple('Shortfall', ['product', 'requested', 'available'])
+
+# Carts that commit_cart is emptying right now
+_committed_carts = ContextVar('committed_carts', default=frozenset())
+
+
+def reservation_ttl():
+    return getattr(settings, 'SHOP_RESERVATION_TTL', DEFAULT_TTL)
+
+
+def _expiry(ttl=None):
+    return timezone.now() + timedelta(seconds=reservation_ttl() if ttl is None else ttl)
+
+
+def _skip_locked():
+    return connection.features.has_select_for_update_skip_locked
+
+
+def available(product):
+    """Unreserved stock for a product, read from its counters"""
+    if product.stock_shards > 1:
+        return StockShard.objects.filter(product_id=product.pk).aggregate(total=Sum('quantity'))['total'] or 0
+    return Product.objects.filter(pk=product.pk).values_list('stock', flat=True).first() or 0
+
+
+def held(cart, product):
+    """Quantity of ``product`` currently held for ``cart``"""
+    return (
+        StockReservation.objects.filter(cart=cart, product_id=product.pk)
+        .aggregate(total=Sum('quantity'))['total'] or 0
+    )
+
+
+def available_to(cart, product):
+    """The most this cart could hold of ``product``: what it holds plus what is free"""
+    return held(cart, product) + available(product)
+
+
+def _take(product, quantity):
+    """
+    Take ``quantity`` out of a product's counters.
+
+    Returns a list of ``(shard, quantity)`` pieces taken, or None if there is
+    not enough stock.
+    """
+    if product.stock_shards <= 1:
+        taken = Product.objects.filter(pk=product.pk, stock__gte=quantity).update(stock=F('stock') - quantity)
+        return [(None, quantity)] if taken else None
+
+    # Start at a random shard so concurrent writers spread across rows
+    start = random.randrange(product.stock_shards)
+    for offset in range(product.stock_shards):
+        shard = (start + offset) % product.stock_shards
+        if StockShard.objects.filter(
+            product_id=product.pk, shard=shard, quantity__gte=quantity
+        ).update(quantity=F('quantity') - quantity):
+            return [(shard, quantity)]
+
+    # No single shard can cover it; gather from several under lock
+    with transaction.atomic():
+        rows = list(
+            StockShard.objects.select_for_update()
+            .filter(product_id=product.pk, quantity__gt=0)
+            .order_by('shard')
+        )
+        if sum(row.quantity for row in rows) < quantity:
+            return None
+        pieces = []
+        remaining = quantity
+        for row in rows:
+            part = min(row.quantity, remaining)
+            StockShard.objects.filter(pk=row.pk).update(quantity=F('quantity') - part)
+            pieces.append((row.shard, part))
+            remaining -= part
+            if not remaining:
+                break
+        return pieces
+
+
+def _give_back(product_id, shard, quantity):
+    # A hold can outlive a re-shard, so fall back to shard 0, then to
+    # Product.stock for products that are no longer sharded
+    for candidate in ([shard] if shard is not None else []) + [0]:
+        if StockShard.objects.filter(product_id=product_id, shard=candidate).update(
+            quantity=F('quantity') + quantity
+        ):
+            return
+    Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity)
+
+
+def reserve(cart, product, quantity, ttl=None):
+    """Hold ``quantity`` more of ``product`` for ``cart``; returns False if not enough stock"""
+    if quantity <= 0:
+        return True
+    with transaction.atomic():
+        pieces = _take(product, quantity)
+        if pieces is None and release_expired(product=product, exclude_cart=cart):
+            pieces = _take(product, quantity)
+        if pieces is None:
+            return False
+        expires_at = _expiry(ttl)
+        StockReservation.objects.bulk_create([
+            StockReservation(cart=cart, product_id=product.pk, shard=shard, quantity=part, expires_at=expires_at)
+            for shard, part in pieces
+        ])
+    return True
+
+
+def _release_rows(rows, quantity=None):
+    """Give back held stock from locked reservation rows, newest first, up to ``quantity``"""
+    remaining = quantity
+    for row in sorted(rows, key=lambda r: (r.created_at, r.pk), reverse=True):
+        if remaining is not None and remaining <= 0:
+            break
+        part = row.quantity if remaining is None else min(row.quantity, remaining)
+        _give_back(row.product_id, row.shard, part)
+        if part == row.quantity:
+            row.delete()
+        else:
+            StockReservation.objects.filter(pk=row.pk).update(quantity=F('quantity') - part)
+        if remaining is not None:
+            remaining -= part
+
+
+def release(cart, product_id, quantity=None):
+    """Release ``quantity`` (default: all) of the cart's holds on a product"""
+    with transaction.atomic():
+        rows = list(StockReservation.objects.select_for_update().filter(cart=cart, product_id=product_id))
+        _release_rows(rows, quantity)
+
+
+def release_cart(cart):
+    """Release every hold a cart has"""
+    with transaction.atomic():
+        rows = list(StockReservation.objects.select_for_update().filter(cart=cart))
+        _release_rows(rows)
+
+
+def set_held(cart, product, quantity, ttl=None):
+    """
+    Make the cart hold exactly ``quantity`` of ``product`` and renew the
+    hold's expiry. Returns False (holding what it held before) if there is
+    not enough stock.
+    """
+    if quantity < 0:
+        raise ValueError(f'Cannot hold a negative quantity ({quantity})')
+    with transaction.atomic():
+        rows = list(StockReservation.objects.select_for_update().filter(cart=cart, product_id=product.pk))
+        current = sum(row.quantity for row in rows)
+        if quantity > current:
+            if not reserve(cart, product, quantity - current, ttl):
+                return False
+        elif quantity < current:
+            _release_rows(rows, current - quantity)
+        StockReservation.objects.filter(cart=cart, product_id=product.pk).update(expires_at=_expiry(ttl))
+    return True
+
+
+def hold_cart(cart, cart_items, ttl=None):
+    """
+    Make sure every item in the cart is fully held and renew all holds.
+
+    Returns a list of Shortfall for items that could not be held; the caller
+    decides whether to roll back. Products that were deactivated or deleted
+    since they went into the cart count as a shortfall with nothing
+    available, even if the cart still holds them.
+    """
+    shortfalls = []
+    with transaction.atomic():
+        # Locking the cart's rows first keeps the sweeper (which skips
+        # locked rows) from releasing holds this checkout is about to use
+        rows = list(StockReservation.objects.select_for_update().filter(cart=cart))
+        current = {}
+        for row in rows:
+            current[row.product_id] = current.get(row.product_id, 0) + row.quantity
+        on_sale = set(
+            Product.objects.filter(pk__in={item.product_id for item in cart_items}, is_active=True)
+            .values_list('pk', flat=True)
+        )
+        for item in cart_items:
+            if item.product_id not in on_sale:
+                shortfalls.append(Shortfall(item.product, item.quantity, 0))
+                continue
+            missing = item.quantity - current.get(item.product_id, 0)
+            if missing > 0 and not reserve(cart, item.product, missing, ttl):
+                shortfalls.append(Shortfall(
+                    item.product, item.quantity, current.get(item.product_id, 0) + available(item.product)
+                ))
+        StockReservation.objects.filter(cart=cart).update(expires_at=_expiry(ttl))
+    return shortfalls
+
+
+def commit_cart(cart):
+    """
+    Convert the cart's holds into a sale and empty the cart. The stock is
+    already taken, so the holds are just dropped, in one ``DELETE``.
+    Deleting the items then skips the per-item release that
+    ``shop.signals.release_item_hold`` would otherwise run.
+    """
+    StockReservation.objects.filter(cart=cart).delete()
+    token = _committed_carts.set(_committed_carts.get() | {cart.pk})
+    try:
+        CartItem.objects.filter(cart=cart).delete()
+    finally:
+        _committed_carts.reset(token)
+
+
+def holds_committed(cart_id):
+    """True while ``commit_cart`` is emptying this cart (its holds are already sold)"""
+    return cart_id in _committed_carts.get()
+
+
+def release_expired(product=None, exclude_cart=None, limit=1000):
+    """Return expired holds to their counters, returning how many were released"""
+    with transaction.atomic():
+        expired = StockReservation.objects.select_for_update(skip_locked=_skip_locked()).filter(
+            expires_at__lte=timezone.now()
+        )
+        if product is not None:
+            expired = expired.filter(product_id=product.pk)
+        if exclude_cart is not None:
+            # A cart topping up its own holds must not sweep them mid-update
+            expired = expired.exclude(cart=exclude_cart)
+        rows = list(expired.order_by('expires_at')[:limit])
+        _release_rows(rows)
+    return len(rows)
+
+
+def adjust_stock(product, delta):
+    """
+    Add ``delta`` units (negative to remove) to a product's unreserved
+    stock, on one of its shards if it is sharded. Returns False, changing
+    nothing, if asked to remove more than is unreserved.
+    """
+    if delta < 0:
+        if _take(product, -delta) is None:
+            return False
+    elif delta > 0:
+        shard = random.randrange(product.stock_shards) if product.stock_shards > 1 else None
+        _give_back(product.pk, shard, delta)
+    if product.stock_shards > 1:
+        refresh_display_stock(product)
+    return True
+
+
+def held_expression():
+    """Quantity held by carts, as an expression usable on Product querysets"""
+    return Coalesce(
+        Subquery(
+            StockReservation.objects.filter(product_id=OuterRef('pk'))
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def on_hand_expression():
+    """Stock on hand (unreserved plus held), the figure catalog feeds carry"""
+    return F('stock') + held_expression()
+
+
+def settle_imported_stock(product_ids):
+    """
+    Turn the on-hand counts a catalog import just wrote into ``Product.stock``
+    into unreserved stock, by taking out what carts hold. Sharded products
+    get the result spread over their shards.
+
+    Must run in the import's transaction, right after the upsert: the upsert
+    still locks the product rows, so holds on them wait for the import.
+    """
+    sharded = list(Product.objects.filter(pk__in=product_ids, stock_shards__gt=1).values_list('pk', flat=True))
+    # Holds on sharded products update shard rows, not the product row
+    list(StockShard.objects.select_for_update().filter(product_id__in=sharded))
+    Product.objects.filter(pk__in=product_ids).update(stock=Greatest(F('stock') - held_expression(), 0))
+    for product in Product.objects.filter(pk__in=sharded):
+        _spread(product, product.stock, product.stock_shards)
+
+
+def refresh_display_stock(product=None):
+    """Copy the shard totals of sharded products (or just ``product``) back into Product.stock"""
+    totals = StockShard.objects.filter(product__stock_shards__gt=1)
+    if product is not None:
+        totals = totals.filter(product_id=product.pk)
+    totals = (
+        totals.values('product_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    for row in totals:
+        Product.objects.filter(pk=row['product_id']).update(stock=row['total'])
+
+
+def set_stock_shards(product, shards):
+    """
+    Redistribute a product's available stock over ``shards`` counters
+    (1 turns sharding off and puts everything back in Product.stock).
+    """
+    shards = max(int(shards), 1)
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        shard_rows = StockShard.objects.select_for_update().filter(product_id=product.pk)
+        if product.stock_shards > 1:
+            total = shard_rows.aggregate(total=Sum('quantity'))['total'] or 0
+        else:
+            total = product.stock
+        _spread(product, total, shards)
+    product.stock, product.stock_shards = total, shards
+    return product
+
+
+def _spread(product, total, shards):
+    # Replace the product's counters with ``total`` spread evenly over ``shards``
+    StockShard.objects.filter(product_id=product.pk).delete()
+    if shards > 1:
+        base, extra = divmod(max(total, 0), shards)
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product.pk, shard=i, quantity=base + (1 if i < extra else 0))
+            for i in range(shards)
+        ])
+    Product.objects.filter(pk=product.pk).update(stock=total, stock_shards=shards)
@@ -0,0 +1,199 @@
+"""
+Database-backed background job queue.
+
+Work that does not need to finish before a response is sent (confirmation
+emails, bookkeeping after an order) is recorded as a ``Job`` row with
+``enqueue`` and run by ``python manage.py run_jobs``. No broker is needed:
+the row is written in the caller's transaction, so a job enqueued during
+checkout becomes visible to workers exactly when the order commits, and
+disappears with it if the order rolls back.
+
+Handlers are plain functions registered with ``@task('name')`` (see
+``shop.tasks``) and receive the job payload as keyword arguments. A
+handler that raises is retried with exponential backoff until
+``max_attempts`` is reached, after which the job is marked failed.
+Handlers may therefore run more than once and should be idempotent.
+
+Passing ``key`` to ``enqueue`` makes enqueueing idempotent: a second job
+with the same key is not created while the first one exists.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 10
+MAX_RETRY_DELAY = 60 * 60
+# A job still "running" this long after it was claimed belongs to a worker
+# that died; it is handed out again
+DEFAULT_LOCK_TIMEOUT = 10 * 60
+
+# name -> handler
+registry = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+def task(name):
+    """Register the decorated function as the handler for jobs called ``name``"""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def worker_id():
+    # The PID keeps threads of different worker processes on one host apart
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Queue a job and return it.
+
+    With ``key``, an existing job with that key is returned instead of
+    creating a second one.
+    """
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'run_at': timezone.now() + timedelta(seconds=delay),
+        'max_attempts': max_attempts or _setting('SHOP_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+    }
+    if key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(idempotency_key=key, **fields)
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=key)
+
+
+def enqueue_many(name, jobs, max_attempts=None):
+    """
+    Queue many jobs of one kind with a single INSERT. ``jobs`` is a list of
+    ``(payload, key)`` pairs; jobs whose key already exists are skipped.
+    """
+    run_at = timezone.now()
+    max_attempts = max_attempts or _setting('SHOP_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    Job.objects.bulk_create(
+        [
+            Job(name=name, payload=payload, idempotency_key=key, run_at=run_at, max_attempts=max_attempts)
+            for payload, key in jobs
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try: exponential with jitter, capped"""
+    base = _setting('SHOP_JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    delay = min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(worker, limit=1):
+    """
+    Lock up to ``limit`` due jobs for ``worker`` and return them.
+
+    Rows locked by another worker's claim are skipped rather than waited on,
+    so any number of workers can poll the same table.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=_setting('SHOP_JOB_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    Job.objects.filter(status='running', locked_at__lt=stale, attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', locked_at=None, last_error='Worker stopped while running the job',
+    )
+    with transaction.atomic():
+        due = list(
+            Job.objects.select_for_update(skip_locked=skip_locked)
+            .filter(status='pending', run_at__lte=now)
+            .order_by('run_at', 'id')[:limit]
+        )
+        if len(due) < limit:
+            due += list(
+                Job.objects.select_for_update(skip_locked=skip_locked)
+                .filter(status='running', locked_at__lt=stale)
+                .order_by('locked_at', 'id')[:limit - len(due)]
+            )
+        if due:
+            # Counting the attempt at claim time means a job that keeps
+            # killing its worker still runs out of attempts
+            Job.objects.filter(pk__in=[job.pk for job in due]).update(
+                status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+            )
+    for job in due:
+        job.status, job.locked_by, job.locked_at = 'running', worker, now
+        job.attempts += 1
+    return due
+
+
+def run(job):
+    """Run one claimed job, recording success, a scheduled retry, or failure"""
+    owner = job.locked_by
+    handler = registry.get(job.name)
+    try:
+        if handler is None:
+            raise UnknownTask(job.name)
+        handler(**job.payload)
+    except Exception as exc:
+        job.last_error = traceback.format_exc()
+        if isinstance(exc, UnknownTask) or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error('Job %s (%s) failed after %s attempts', job.pk, job.name, job.attempts)
+        else:
+            job.status = 'pending'
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning('Job %s (%s) failed, retrying at %s', job.pk, job.name, job.run_at)
+    else:
+        job.status = 'done'
+        job.last_error = ''
+    job.locked_by, job.locked_at = '', None
+    # A worker that overran the lock timeout must not overwrite the outcome
+    # of the worker that took the job over
+    Job.objects.filter(pk=job.pk, locked_by=owner).update(
+        status=job.status, run_at=job.run_at,
+        last_error=job.last_error, locked_by='', locked_at=None, updated_at=timezone.now(),
+    )
+    return job.status
+
+
+def run_pending(worker=None, limit=100):
+    """Claim and run due jobs one at a time until none are left or ``limit`` have run"""
+    worker = worker or worker_id()
+    ran = 0
+    while ran < limit:
+        jobs = claim(worker)
+        if not jobs:
+            break
+        for job in jobs:
+            run(job)
+            ran += 1
+    return ran
+
+
+def purge(older_than_days=7):
+    """Delete finished jobs older than the given age, returning how many went"""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = Job.objects.filter(status='done', updated_at__lt=cutoff).delete()
+    return deleted
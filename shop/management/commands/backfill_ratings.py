@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from shop.ratings import backfill_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized rating count/sum/average on every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products updated per statement')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Backfilling product ratings...')
+        updated = backfill_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Updated {updated} products'))
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from shop import benchmark
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway test database at a given scale and benchmarks every shop URL (JSON report)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.1,
+                            help='Dataset scale factor (1 = 10,000 products, 2,000 users, 10,000 orders)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed for the dataset and the request mix')
+        parser.add_argument('--requests', type=int, default=benchmark.DEFAULT_REQUESTS,
+                            help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=benchmark.DEFAULT_WARMUP,
+                            help='Untimed requests per route before measuring')
+        parser.add_argument('--route', action='append', dest='routes', choices=sorted(benchmark.ROUTES),
+                            help='Only benchmark this route (repeatable)')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Compare against an earlier report and fail on regressions')
+        parser.add_argument('--threshold', type=float, default=benchmark.DEFAULT_THRESHOLD,
+                            help='Relative latency increase that counts as a regression')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database (and its seeded data) for the next run')
+
+    def handle(self, *args, **options):
+        baseline = benchmark.load_report(options['compare']) if options['compare'] else None
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'], aliases={'default'})
+        try:
+            if Product.objects.exists():
+                self.stderr.write('Reusing the dataset already in the test database')
+            else:
+                self.stderr.write(f'Seeding dataset at scale {options["scale"]}...')
+                counts = benchmark.seed_dataset(options['scale'], options['seed'])
+                self.stderr.write(', '.join(f'{n} {name}' for name, n in counts.items()))
+            self.stderr.write('Running requests...')
+            with override_settings(SHOP_PROFILER_SAMPLE_RATE=0):
+                report = benchmark.run(
+                    requests=options['requests'],
+                    warmup=options['warmup'],
+                    seed=options['seed'],
+                    routes=options['routes'],
+                    meta={'scale': options['scale']},
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            _report_regressions(self, benchmark.compare(baseline, report, options['threshold']))
+        self.stderr.write(self.style.SUCCESS(
+            f'[SUCCESS] {report["total"]["requests"]} requests in {report["total"]["seconds"]}s '
+            f'({report["total"]["rps"]} req/s)'
+        ))
+
+
+def _report_regressions(command, regressions):
+    for r in regressions:
+        command.stderr.write(command.style.WARNING(
+            f'{r["route"]}: {r["metric"]} {r["baseline"]} -> {r["current"]} ({r["change"]:+})'
+        ))
+    if regressions:
+        raise CommandError(f'{len(regressions)} regressions')
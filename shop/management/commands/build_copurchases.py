@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.recommendations import DEFAULT_CHUNK_SIZE, DEFAULT_TOP_K, build_copurchases
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the "frequently bought together" table from order history (needs numpy and scipy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                            help='Neighbours to keep per product')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Orders to read per batch')
+        parser.add_argument('--min-count', type=int, default=1,
+                            help='Ignore pairs bought together fewer times than this')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building co-purchase table...')
+        try:
+            rows = build_copurchases(options['top_k'], options['chunk_size'], options['min_count'])
+        except ImportError as exc:
+            raise CommandError(f'{exc}. Install numpy and scipy to build recommendations.')
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Wrote {rows} product associations'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.recommendations import DEFAULT_USER_CHUNK_SIZE, DEFAULT_USER_LIMIT, build_user_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds every user\'s "recommended for you" list (run after build_copurchases; needs numpy and scipy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=DEFAULT_USER_LIMIT,
+                            help='Recommendations to keep per user')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_USER_CHUNK_SIZE,
+                            help='Users to score per batch')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building user recommendations...')
+        try:
+            rows = build_user_recommendations(options['limit'], options['chunk_size'])
+        except ImportError as exc:
+            raise CommandError(f'{exc}. Install numpy and scipy to build recommendations.')
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Wrote {rows} user recommendations'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from shop.caching import cache_stats, catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Shows hit/miss counters for the shop page and fragment caches'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Catalog version: {catalog_version()}')
+        for name, counts in cache_stats().items():
+            total = counts['hit'] + counts['miss']
+            ratio = f'{counts["hit"] / total:.1%}' if total else 'n/a'
+            self.stdout.write(f'{name}: {counts["hit"]} hits, {counts["miss"]} misses (hit ratio {ratio})')
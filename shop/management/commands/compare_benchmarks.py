@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from shop import benchmark
+from shop.management.commands.benchmark import _report_regressions
+
+
+class Command(BaseCommand):
+    help = 'Compares two benchmark reports and fails if any route regressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help='Earlier JSON report')
+        parser.add_argument('current', help='New JSON report')
+        parser.add_argument('--threshold', type=float, default=benchmark.DEFAULT_THRESHOLD,
+                            help='Relative latency increase that counts as a regression')
+
+    def handle(self, *args, **options):
+        baseline = benchmark.load_report(options['baseline'])
+        current = benchmark.load_report(options['current'])
+        for name, now in current['routes'].items():
+            before = baseline['routes'].get(name, {})
+            self.stdout.write(
+                f'{name:18} p95 {before.get("p95_ms", "-"):>9} -> {now["p95_ms"]:>9} ms   '
+                f'queries {before.get("queries_mean", "-"):>6} -> {now["queries_mean"]:>6}'
+            )
+        _report_regressions(self, benchmark.compare(baseline, current, options['threshold']))
+        self.stdout.write(self.style.SUCCESS('[SUCCESS] No regressions'))
@@ -1,12 +1,44 @@
 from django.core.management.base import BaseCommand
+from shop import synthetic
 from shop.models import Category, Product, ProductImage
 from decimal import Decimal
 import os
 
 class Command(BaseCommand):
-    help = 'Creates sample categories and products for the ecommerce site'
+    help = 'Generates synthetic shop data at a given scale (see shop/synthetic.py), or the small demo catalog with --demo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.01,
+                            help='1 = 10,000 products, 2,000 users, 10,000 orders (100 gives a million products)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; the same seed and scale give the same data')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes writing partitions in parallel (PostgreSQL/MySQL only)')
+        parser.add_argument('--batch-size', type=int, default=synthetic.DEFAULT_BATCH_SIZE,
+                            help='Rows per bulk insert')
+        parser.add_argument('--recommendations', action='store_true',
+                            help='Also build the recommendation tables (needs numpy and scipy)')
+        parser.add_argument('--demo', action='store_true',
+                            help='Create the hand-written demo catalog instead')
 
     def handle(self, *args, **options):
+        if options['demo']:
+            return self.create_demo_catalog()
+        self.stdout.write(f'Generating synthetic data at scale {options["scale"]} (seed {options["seed"]})...')
+        counts = synthetic.generate(
+            scale=options['scale'],
+            seed=options['seed'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            with_recommendations=options['recommendations'],
+            progress=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            '[SUCCESS] Generated ' + ', '.join(f'{n} {table}' for table, n in counts.items())
+            + f'\nUsers log in with the password "{synthetic.PASSWORD}"'
+        ))
+
+    def create_demo_catalog(self):
         self.stdout.write('Creating sample data...')
         
         # Create Categories
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from shop import exports
+
+
+class Command(BaseCommand):
+    help = 'Streams a products/orders/order_items dump as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--status', action='append', default=[],
+                            help='Only orders with this status (repeatable)')
+        parser.add_argument('--from', dest='created_from', help='Only orders created on/after this date')
+        parser.add_argument('--to', dest='created_to', help='Only orders created on/before this date')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            lines = exports.stream(
+                options['dataset'],
+                options['format'],
+                statuses=options['status'],
+                created_from=options['created_from'],
+                created_to=options['created_to'],
+            )
+        except exports.ExportError as exc:
+            raise CommandError(str(exc))
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        rows = 0
+        try:
+            for line in lines:
+                output.write(line)
+                rows += 1
+        finally:
+            if options['output']:
+                output.close()
+        if options['output']:
+            if options['format'] == 'csv':
+                rows -= 1
+            self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Wrote {rows} rows to {options["output"]}'))
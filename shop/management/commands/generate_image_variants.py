@@ -0,0 +1,29 @@
+import os
+
+from django.core.management.base import BaseCommand
+from shop.caching import bump_catalog_version
+from shop.images import backfill_variants
+
+
+class Command(BaseCommand):
+    help = 'Builds resized WebP/JPEG variants for product images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Encoding processes')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Images read and encoded per batch')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild variants even if they are up to date')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Generating image variants...')
+        processed, failed = backfill_variants(
+            workers=max(options['workers'], 1),
+            force=options['force'],
+            batch_size=options['batch_size'],
+            on_error=lambda image, exc: self.stderr.write(f'{image.image.name}: {exc}'),
+        )
+        if processed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Built variants for {processed} images, {failed} failed'))
@@ -0,0 +1,89 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.catalog_import import finish_import, upsert_batch
+from shop.catalog_rows import parse_row, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams a CSV/JSONL product feed into the catalog with batched upserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file (optionally .gz)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows validated and written per batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Validation processes (0 validates in this process)')
+        parser.add_argument('--rejects', help='Write rejected rows with their errors to this JSONL file')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate only; write nothing to the database')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        batch_size = max(options['batch_size'], 1)
+        workers = max(options['workers'], 0)
+
+        rows = read_rows(path, options['format'])
+        pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+        rejects = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else None
+        category_ids = {}
+        seen = valid = rejected = written = images = 0
+        started = time.monotonic()
+        try:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                if pool:
+                    results = pool.map(parse_row, batch, chunksize=max(1, len(batch) // (workers * 4)))
+                else:
+                    results = map(parse_row, batch)
+
+                clean = []
+                for (line_number, raw), (_, row, errors) in zip(batch, results):
+                    if errors:
+                        rejected += 1
+                        if rejects:
+                            rejects.write(json.dumps({'line': line_number, 'errors': errors, 'row': raw}, default=str) + '\n')
+                        elif rejected <= 20:
+                            self.stderr.write(f'Line {line_number}: {"; ".join(errors)}')
+                    else:
+                        clean.append(row)
+                seen += len(batch)
+                valid += len(clean)
+
+                if clean and not options['dry_run']:
+                    products, new_images = upsert_batch(clean, category_ids)
+                    written += products
+                    images += new_images
+
+                elapsed = time.monotonic() - started
+                rate = seen / elapsed if elapsed else 0
+                self.stdout.write(f'{seen} rows, {rejected} rejected, {rate:.0f} rows/s')
+        finally:
+            if pool:
+                pool.shutdown()
+            if rejects:
+                rejects.close()
+
+        if written:
+            self.stdout.write('Refreshing facet counts...')
+            finish_import()
+
+        elapsed = time.monotonic() - started
+        rate = seen / elapsed if elapsed else 0
+        summary = f'{seen} rows in {elapsed:.1f}s ({rate:.0f} rows/s): {valid} valid, {rejected} rejected'
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Dry run, nothing written. {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'[SUCCESS] {summary}; upserted {written} products, added {images} images'
+            ))
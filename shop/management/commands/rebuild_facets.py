@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from shop.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the precomputed category/brand/price facet counts'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding facet counts...')
+        cells = rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Wrote {cells} facet cells'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from shop.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of index rows written per INSERT')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding search index...')
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Indexed {indexed} products'))
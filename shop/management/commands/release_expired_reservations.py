@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.inventory import refresh_display_stock, release_expired
+
+
+class Command(BaseCommand):
+    help = 'Returns expired cart stock holds to inventory and refreshes sharded stock levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, sweeping every INTERVAL seconds')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            while True:
+                batch = release_expired(limit=options['batch_size'])
+                released += batch
+                if batch < options['batch_size']:
+                    break
+            refresh_display_stock()
+            self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Released {released} expired reservations'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
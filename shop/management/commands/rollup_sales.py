@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from shop.rollups import rollup_sales
+
+
+class Command(BaseCommand):
+    help = 'Updates the daily sales rollup tables with orders changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every day from scratch (e.g. after deleting orders)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rolling up sales...')
+        days = rollup_sales(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Recomputed {days} days of sales'))
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from shop import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (order emails and other post-order work)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due now and exit')
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='Delete finished jobs older than this many days')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            ran = jobs.run_pending(limit=float('inf'))
+            purged = jobs.purge(options['purge_days'])
+            self.stdout.write(self.style.SUCCESS(f'[SUCCESS] Ran {ran} jobs, purged {purged}'))
+            return
+
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.work, args=(stop, options['poll_interval']), daemon=True)
+            for _ in range(max(options['workers'], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f'Running {len(threads)} job worker(s), press Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(60)
+                jobs.purge(options['purge_days'])
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS('[SUCCESS] Job workers stopped'))
+
+    def work(self, stop, poll_interval):
+        worker = jobs.worker_id()
+        while not stop.is_set():
+            # Each thread has its own connection; drop it if it went stale
+            close_old_connections()
+            try:
+                ran = jobs.run_pending(worker)
+            except Exception as exc:
+                self.stderr.write(f'{worker}: {exc}')
+                ran = 0
+            if not ran:
+                stop.wait(poll_interval)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.inventory import set_stock_shards
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Spreads a product\'s stock over several counters (1 turns sharding off)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug')
+        parser.add_argument('shards', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.get(slug=options['slug'])
+        except Product.DoesNotExist:
+            raise CommandError(f'No product with slug "{options["slug"]}"')
+        product = set_stock_shards(product, options['shards'])
+        self.stdout.write(self.style.SUCCESS(
+            f'[SUCCESS] {product.name}: {product.stock} in stock over {product.stock_shards} counter(s)'
+        ))
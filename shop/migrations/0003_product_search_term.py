@@ -0,0 +1,65 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:22
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the shop.search tokenizer as of this migration, so the
+# backfill does not change (or break) when the live one evolves
+FIELD_WEIGHTS = {'name': 10, 'brand': 5, 'description': 1}
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+MAX_TERM_LENGTH = 50
+
+
+def build_terms(product):
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for token in TOKEN_RE.findall((getattr(product, field) or '').lower()):
+            if token not in STOP_WORDS:
+                weights[token[:MAX_TERM_LENGTH]] += field_weight
+    return weights
+
+
+def populate_search_terms(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductSearchTerm = apps.get_model('shop', 'ProductSearchTerm')
+    rows = []
+    products = Product.objects.filter(is_active=True).only('id', 'name', 'brand', 'description').order_by('pk')
+    for product in products.iterator(chunk_size=1000):
+        rows.extend(
+            ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+            for term, weight in build_terms(product).items()
+        )
+        if len(rows) >= 1000:
+            ProductSearchTerm.objects.bulk_create(rows)
+            rows = []
+    ProductSearchTerm.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_order_address_order_city_order_country_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='shop.product')),
+            ],
+            options={
+                'unique_together': {('term', 'product')},
+            },
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_primary_image(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductImage = apps.get_model('shop', 'ProductImage')
+    for product in Product.objects.only('id').iterator():
+        image_id = (
+            ProductImage.objects.filter(product_id=product.id)
+            .order_by('-is_primary', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if image_id:
+            Product.objects.filter(pk=product.id).update(primary_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.productimage'),
+        ),
+        migrations.RunPython(populate_primary_image, migrations.RunPython.noop),
+    ]
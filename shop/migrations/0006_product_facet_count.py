@@ -0,0 +1,56 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:26
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+# Frozen copy of the shop.facets price buckets as of this migration (upper
+# bounds of the half-open ranges; the last bucket is unbounded)
+BUCKET_LIMITS = [Decimal('25'), Decimal('50'), Decimal('100'), Decimal('250'), Decimal('500')]
+
+
+def price_bucket(price):
+    for index, high in enumerate(BUCKET_LIMITS):
+        if price < high:
+            return index
+    return len(BUCKET_LIMITS)
+
+
+def populate_facet_counts(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductFacetCount = apps.get_model('shop', 'ProductFacetCount')
+    cells = {}
+    rows = Product.objects.filter(is_active=True).values('category_id', 'brand', 'price').annotate(n=Count('id')).order_by()
+    for row in rows.iterator():
+        key = (row['category_id'], row['brand'] or '', price_bucket(row['price']))
+        cells[key] = cells.get(key, 0) + row['n']
+    ProductFacetCount.objects.bulk_create(
+        [ProductFacetCount(category_id=c, brand=b, price_bucket=p, count=n) for (c, b, p), n in cells.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand', models.CharField(blank=True, max_length=100)),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='shop.category')),
+            ],
+            options={
+                'unique_together': {('category', 'brand', 'price_bucket')},
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:38
+
+import shop.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_order_coupon'),
+    ]
+
+    # New orders get time-ordered IDs (shop.ids). Existing hex IDs are left
+    # as they are, so their order_detail URLs keep working.
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.CharField(default=shop.ids.new_order_id, editable=False, max_length=20, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.IntegerField(default=0, editable=False, help_text='Units on hand that no cart is holding'),
+        ),
+    ]
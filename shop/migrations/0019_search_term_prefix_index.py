@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'searchterm_term_prefix_idx'
+
+
+def create_prefix_index(apps, schema_editor):
+    # PostgreSQL only uses a btree for LIKE 'x%' under the C collation or with
+    # a pattern operator class; other backends make do with the unique index
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductSearchTerm = apps.get_model('shop', 'ProductSearchTerm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        f'ON {schema_editor.quote_name(ProductSearchTerm._meta.db_table)} (term varchar_pattern_ops)'
+    )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_product_stock_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -2,7 +2,21 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-import uuid
+from decimal import Decimal
+from .ids import new_order_id
+
+def final_price_expression(prefix=''):
+    """
+    SQL equivalent of Product.get_final_price() for use in annotations.
+
+    ``prefix`` is the lookup path to the product, e.g. ``'product__'``.
+    """
+    return models.Case(
+        models.When(**{f'{prefix}discount_price__isnull': True}, then=models.F(f'{prefix}price')),
+        models.When(**{f'{prefix}discount_price': 0}, then=models.F(f'{prefix}price')),
+        default=models.F(f'{prefix}discount_price'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -25,17 +39,75 @@ class Product(models.Model):
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     brand = models.CharField(max_length=100, blank=True)
-    stock = models.IntegerField(default=0)
+    # Unreserved stock: on hand minus what carts currently hold. Holds,
+    # releases and staff corrections change it with relative F() updates
+    # (shop.inventory), never by assigning and saving
+    stock = models.IntegerField(
+        default=0, editable=False,
+        help_text='Units on hand that no cart is holding',
+    )
+    # Hot products can spread their stock over several StockShard counter
+    # rows so concurrent holds don't all queue on one row lock; stock then
+    # becomes a display snapshot refreshed by the reservation sweeper
+    stock_shards = models.PositiveSmallIntegerField(default=1, editable=False)
     is_active = models.BooleanField(default=True)
+    # Denormalized pointer to the image shown on product cards, kept in
+    # sync by the ProductImage signals so listings can select_related it
+    primary_image = models.ForeignKey(
+        'ProductImage', related_name='+', null=True, blank=True,
+        editable=False, on_delete=models.SET_NULL,
+    )
+    # Review aggregates, maintained by the ProductReview signals (shop.ratings)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        # Composite keys backing the keyset-paginated sorts in product_list
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_seek_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_seek_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_seek_idx'),
+            models.Index(fields=['rating_avg', 'rating_count', 'id'], name='product_rating_seek_idx'),
+        ]
+    
+    # Columns only changed by targeted updates: the stock counters
+    # (shop.inventory), the review aggregates (shop.ratings) and the
+    # primary image pointer (update_primary_image)
+    MAINTAINED_FIELDS = frozenset([
+        'stock', 'stock_shards', 'rating_count', 'rating_sum', 'rating_avg', 'primary_image',
+    ])
+    
+    def save(self, *args, **kwargs):
+        # A full save of an existing row would write back whatever values the
+        # instance was loaded with, undoing holds, reviews and image changes
+        # made since; leave those columns out
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     def get_final_price(self):
         return self.discount_price if self.discount_price else self.price
     
     def is_in_stock(self):
         return self.stock > 0
     
+    def update_primary_image(self):
+        """Point primary_image at the flagged image, falling back to the oldest one"""
+        image_id = (
+            ProductImage.objects.filter(product_id=self.pk)
+            .order_by('-is_primary', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        Product.objects.filter(pk=self.pk).update(primary_image_id=image_id)
+        self.primary_image_id = image_id
+    
     def __str__(self):
         return self.name
 
@@ -43,10 +115,63 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/')
     is_primary = models.BooleanField(default=False)
+    # Sized WebP/JPEG copies, {'source': name, 'webp': [[w, h, name], ...], 'jpeg': [...]}
+    # (built by shop.images)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"Image for {self.product.name}"
 
+class StockShard(models.Model):
+    """One slice of a sharded product's available stock (see shop.inventory)"""
+    product = models.ForeignKey(Product, related_name='stock_shard_rows', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['product', 'shard']
+    
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.quantity}"
+
+class ProductSearchTerm(models.Model):
+    """Inverted index entry for product search (maintained by shop.search)"""
+    product = models.ForeignKey(Product, related_name='search_terms', on_delete=models.CASCADE)
+    term = models.CharField(max_length=50)
+    weight = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        unique_together = ['term', 'product']
+    
+    def __str__(self):
+        return f"{self.term} -> {self.product_id}"
+
+class ProductFacetCount(models.Model):
+    """Active product count for one (category, brand, price bucket) cell (maintained by shop.facets)"""
+    category = models.ForeignKey(Category, related_name='facet_counts', on_delete=models.CASCADE)
+    brand = models.CharField(max_length=100, blank=True)
+    price_bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['category', 'brand', 'price_bucket']
+    
+    def __str__(self):
+        return f"{self.category_id}/{self.brand or '-'}/{self.price_bucket}: {self.count}"
+
+class ProductAssociation(models.Model):
+    """One of a product's top "frequently bought together" neighbours (built by shop.recommendations)"""
+    product = models.ForeignKey(Product, related_name='co_purchases', on_delete=models.CASCADE)
+    related = models.ForeignKey(Product, related_name='co_purchased_by', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        unique_together = ['product', 'rank']
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
 class ProductReview(models.Model):
     product = models.ForeignKey(Product, related_name='reviews', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -65,13 +190,49 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    def line_items(self):
+        """Cart items with products, images and DB-computed prices preloaded"""
+        return self.items.with_products().with_line_totals().order_by('added_at', 'id')
+    
+    def totals(self):
+        """Item count and subtotal in a single aggregate query"""
+        return self.items.totals()
+    
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.totals()['total_price']
     
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.totals()['total_items']
+
+class CartItemQuerySet(models.QuerySet):
+    def with_products(self):
+        return self.select_related('product__category', 'product__primary_image')
+    
+    def with_line_totals(self):
+        """Annotate ``unit_price`` and ``line_total`` computed in the database"""
+        return self.annotate(
+            unit_price=final_price_expression('product__'),
+            line_total=models.ExpressionWrapper(
+                models.F('quantity') * final_price_expression('product__'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+    
+    def totals(self):
+        """Return ``{'total_items': int, 'total_price': Decimal}`` for these items"""
+        totals = self.aggregate(
+            total_items=models.Sum('quantity'),
+            total_price=models.Sum(models.ExpressionWrapper(
+                models.F('quantity') * final_price_expression('product__'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )),
+        )
+        return {
+            'total_items': totals['total_items'] or 0,
+            'total_price': (totals['total_price'] or Decimal('0')).quantize(Decimal('0.01')),
+        }
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -79,13 +240,35 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
     
+    objects = CartItemQuerySet.as_manager()
+    
     @property
     def total_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.product.get_final_price() * self.quantity
     
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+class StockReservation(models.Model):
+    """Time-limited hold on stock for a cart (see shop.inventory)"""
+    cart = models.ForeignKey(Cart, related_name='reservations', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    # Counter the quantity was taken from: None for Product.stock, else a StockShard
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['cart', 'product'], name='reservation_cart_product_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for cart {self.cart_id}"
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -102,7 +285,7 @@ class Order(models.Model):
         ('stripe', 'Stripe'),
     ]
     
-    order_id = models.CharField(max_length=20, unique=True, editable=False)
+    order_id = models.CharField(max_length=20, unique=True, editable=False, default=new_order_id)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     first_name = models.CharField(max_length=50, blank=True)
     last_name = models.CharField(max_length=50, blank=True)
@@ -121,12 +304,23 @@ class Order(models.Model):
     discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     final_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    coupon = models.ForeignKey('Coupon', related_name='orders', on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_seek_idx'),
+            # Admin changelist: date hierarchy / ordering, alone and under a status filter
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # rollup_sales picks up orders changed since its watermark
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.order_id:
-            self.order_id = uuid.uuid4().hex[:20]
+            self.order_id = new_order_id()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -142,6 +336,16 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+class OrderSnapshot(models.Model):
+    """Rendered detail view of an order in a final status (see shop.snapshots)"""
+    order = models.OneToOneField(Order, related_name='snapshot', on_delete=models.CASCADE, primary_key=True)
+    status = models.CharField(max_length=20)
+    html = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Snapshot of {self.order_id} ({self.status})"
+
 class Wishlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -153,6 +357,19 @@ class Wishlist(models.Model):
     def __str__(self):
         return f"{self.user.username}'s wishlist - {self.product.name}"
 
+class UserRecommendation(models.Model):
+    """One entry of a user's precomputed "recommended for you" list (built by shop.recommendations)"""
+    user = models.ForeignKey(User, related_name='recommendations', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='recommended_to', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        unique_together = ['user', 'rank']
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.product_id} (#{self.rank})"
+
 class Coupon(models.Model):
     code = models.CharField(max_length=50, unique=True)
     discount_type = models.CharField(max_length=10, choices=[('percent', 'Percentage'), ('fixed', 'Fixed Amount')])
@@ -166,4 +383,76 @@ class Coupon(models.Model):
     used_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
-        return self.code
\ No newline at end of file
+        return self.code
+
+class SalesRollup(models.Model):
+    """Daily order totals for one date x payment method x status cell (built by shop.rollups)"""
+    date = models.DateField()
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    final_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = ['date', 'payment_method', 'status']
+    
+    def __str__(self):
+        return f"{self.date} {self.payment_method} {self.status}: {self.final_amount}"
+
+class CategorySalesRollup(models.Model):
+    """Daily item sales for one date x category x payment method x status cell (built by shop.rollups)"""
+    date = models.DateField()
+    category = models.ForeignKey(Category, related_name='sales_rollups', on_delete=models.CASCADE)
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = ['date', 'category', 'payment_method', 'status']
+    
+    def __str__(self):
+        return f"{self.date} {self.category_id} {self.payment_method} {self.status}: {self.revenue}"
+
+class RollupWatermark(models.Model):
+    """How far an incremental rollup has read its source table"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+class Job(models.Model):
+    """A unit of background work in the database-backed queue (see shop.jobs)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,225 @@
+"""
+Keyset (seek) pagination.
+
+Instead of ``OFFSET``/``COUNT(*)``, each page remembers the sort key of its
+first and last rows and the next request filters past them, e.g.
+``WHERE (created_at, id) < (:last_created_at, :last_id)``. Page cost is
+constant however deep the visitor goes, as long as the ordering columns
+are indexed.
+
+Cursors are signed, opaque tokens so they cannot be tampered with.
+
+For the admin changelists, which need page numbers, ``EstimatedCountPaginator``
+keeps Django's offset paging but takes the row count of an unfiltered
+changelist from the database's table statistics instead of ``COUNT(*)``.
+"""
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'shop.pagination'
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move either way"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, query_params=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.query_params = query_params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _query_for(self, cursor):
+        if self.query_params is None:
+            return urlencode({'cursor': cursor})
+        params = self.query_params.copy()
+        params.pop('page', None)
+        params['cursor'] = cursor
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        """Query string (without the leading ``?``) for the next page"""
+        return self._query_for(self.next_cursor) if self.has_next() else ''
+
+    @property
+    def previous_query(self):
+        """Query string (without the leading ``?``) for the previous page"""
+        return self._query_for(self.previous_cursor) if self.has_previous() else ''
+
+
+def _parse_ordering(ordering):
+    return [(key.lstrip('-'), key.startswith('-')) for key in ordering]
+
+
+def _key_field(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _serialize_value(value):
+    # isoformat() keeps full microsecond precision, which the seek needs
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(ordering, obj, direction):
+    values = [_serialize_value(getattr(obj, name)) for name, _ in _parse_ordering(ordering)]
+    return signing.dumps({'k': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(queryset, ordering, cursor):
+    """Return ``(values, direction)`` for a cursor, or ``None`` if it is invalid"""
+    try:
+        payload = signing.loads(cursor, salt=CURSOR_SALT)
+        raw_values, direction = payload['k'], payload['d']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+    keys = _parse_ordering(ordering)
+    if direction not in ('next', 'prev') or len(raw_values) != len(keys):
+        return None
+    try:
+        values = [
+            _key_field(queryset, name).to_python(value)
+            for (name, _), value in zip(keys, raw_values)
+        ]
+    except Exception:
+        return None
+    return values, direction
+
+
+def _seek_filter(keys, values, forward):
+    """Build ``(k1, k2, ...) > (v1, v2, ...)`` (or ``<``) honouring per-key direction"""
+    seek = Q()
+    for i, (name, descending) in enumerate(keys):
+        lookup = 'lt' if descending == forward else 'gt'
+        clause = Q(**{f'{name}__{lookup}': values[i]})
+        for (prev_name, _), prev_value in zip(keys[:i], values[:i]):
+            clause &= Q(**{prev_name: prev_value})
+        seek |= clause
+    return seek
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=12, query_params=None):
+    """
+    Paginate ``queryset`` by ``ordering`` (a list of field names such as
+    ``['-created_at', '-id']``) starting from ``cursor``.
+
+    ``ordering`` must end in a unique column (normally ``id``) so every row
+    has a distinct position. ``query_params`` (usually ``request.GET``) is
+    used to build next/previous links that keep the active filters.
+    """
+    keys = _parse_ordering(ordering)
+    decoded = decode_cursor(queryset, ordering, cursor) if cursor else None
+
+    if decoded is None:
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        has_more, has_before = len(rows) > per_page, False
+        rows = rows[:per_page]
+    else:
+        values, direction = decoded
+        forward = direction == 'next'
+        if forward:
+            page_qs = queryset.filter(_seek_filter(keys, values, True)).order_by(*ordering)
+        else:
+            reversed_ordering = [key[1:] if key.startswith('-') else f'-{key}' for key in ordering]
+            page_qs = queryset.filter(_seek_filter(keys, values, False)).order_by(*reversed_ordering)
+        rows = list(page_qs[:per_page + 1])
+        overflow = len(rows) > per_page
+        rows = rows[:per_page]
+        if forward:
+            has_more, has_before = overflow, True
+        else:
+            rows.reverse()
+            has_more, has_before = True, overflow
+
+    next_cursor = previous_cursor = None
+    if rows and has_more:
+        next_cursor = encode_cursor(ordering, rows[-1], 'next')
+    if rows and has_before:
+        previous_cursor = encode_cursor(ordering, rows[0], 'prev')
+
+    return KeysetPage(rows, next_cursor, previous_cursor, query_params)
+
+
+# Tables estimated below this size are counted exactly instead
+DEFAULT_EXACT_COUNT_LIMIT = 10000
+
+
+def exact_count_limit():
+    return getattr(settings, 'SHOP_ADMIN_EXACT_COUNT_LIMIT', DEFAULT_EXACT_COUNT_LIMIT)
+
+
+def estimated_count(model, using='default'):
+    """
+    Approximate row count of ``model``'s table from the planner statistics
+    (``pg_class.reltuples`` on PostgreSQL, ``information_schema.TABLES`` on
+    MySQL). Returns None when the backend has no estimate.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)'
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    # reltuples is -1 for a table that has never been analyzed
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over large tables.
+
+    An unfiltered queryset is counted from the table statistics, so opening
+    the changelist does not scan the table; filtered querysets and small
+    tables are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct and not query.combinator:
+            estimate = estimated_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate >= exact_count_limit():
+                return estimate
+        return super().count
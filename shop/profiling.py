@@ -0,0 +1,198 @@
+"""
+Per-request query and timing profiler.
+
+``QueryProfilerMiddleware`` profiles a sample of requests
+(``SHOP_PROFILER_SAMPLE_RATE``, 0 turns it off). For a sampled request it
+records:
+
+* the number of SQL queries and the time spent in them, using
+  ``connection.execute_wrapper``, so it works with ``DEBUG = False``;
+* how often each query *shape* ran. The shape is the SQL with parameters
+  left as placeholders and ``IN (...)`` lists collapsed, so a loop that runs
+  ``images.first()`` once per product shows up as a single repeated shape;
+* the time spent in the view (from URL resolution to the response coming
+  back up, so it includes the middleware listed below this one) and in
+  rendering templates.
+
+The numbers go out as ``Server-Timing`` response headers, which browser
+dev tools display next to the request. A warning is logged to
+``shop.profiling`` when a request runs more than ``SHOP_PROFILER_QUERY_BUDGET``
+queries or repeats one shape more than ``SHOP_PROFILER_DUPLICATE_LIMIT``
+times (the usual sign of an N+1).
+
+Unsampled requests pay for one ``random()`` call. Sampled requests pay a
+dict update per query. Template timing wraps ``Template.render`` of the
+Django backend only while at least one sampled request is in flight: the
+first one installs the wrapper and the last one to finish puts the original
+back. Other requests rendering in the meantime only pay a context variable
+lookup. Importing this module changes nothing, and with a sample rate of 0
+the middleware removes itself (``MiddlewareNotUsed``).
+
+Streaming responses are only measured up to the point the view returns.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as BackendTemplate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_QUERY_BUDGET = 50
+DEFAULT_DUPLICATE_LIMIT = 5
+
+_current = ContextVar('shop_profile', default=None)
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Reduce a SQL statement to its shape so repeats with other parameters match"""
+    sql = _IN_LIST.sub('(%s, ...)', sql)
+    sql = _NUMBER.sub('N', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class Profile:
+    """Measurements for one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.view_start = None
+        self.view_time = None
+        self.shapes = Counter()
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def duplicates(self, limit=1):
+        """``[(shape, count), ...]`` for shapes run more than ``limit`` times, most repeated first"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > limit]
+
+    def server_timing(self, total):
+        repeated = sum(n - 1 for _, n in self.duplicates())
+        entries = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'dupq;desc="{repeated} repeated"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ]
+        if self.view_time is not None:
+            entries.append(f'view;dur={self.view_time * 1000:.1f}')
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+_patch_lock = threading.Lock()
+_profiling = 0  # sampled requests in flight
+_original_render = None
+
+
+def _profiled_render(self, context=None, request=None):
+    profile = _current.get()
+    if profile is None:
+        return _original_render(self, context, request)
+    # Only time the outermost render; nested render_to_string calls are inside it
+    profile._template_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        profile._template_depth -= 1
+        if not profile._template_depth:
+            profile.template_time += time.perf_counter() - start
+
+
+def _start_template_timing():
+    global _profiling, _original_render
+    with _patch_lock:
+        if not _profiling:
+            _original_render = BackendTemplate.render
+            BackendTemplate.render = _profiled_render
+        _profiling += 1
+
+
+def _stop_template_timing():
+    global _profiling
+    with _patch_lock:
+        _profiling -= 1
+        if not _profiling and BackendTemplate.render is _profiled_render:
+            BackendTemplate.render = _original_render
+
+
+class QueryProfilerMiddleware:
+    """Profile a sample of requests and report through Server-Timing headers and warnings"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SHOP_PROFILER_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+        self.query_budget = getattr(settings, 'SHOP_PROFILER_QUERY_BUDGET', DEFAULT_QUERY_BUDGET)
+        self.duplicate_limit = getattr(settings, 'SHOP_PROFILER_DUPLICATE_LIMIT', DEFAULT_DUPLICATE_LIMIT)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = Profile()
+        token = _current.set(profile)
+        _start_template_timing()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _stop_template_timing()
+            _current.reset(token)
+        end = time.perf_counter()
+        total = end - start
+        if profile.view_start is not None:
+            profile.view_time = end - profile.view_start
+
+        response['Server-Timing'] = profile.server_timing(total)
+        self.check(request, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Only mark the start: calling the view here would skip the
+        # process_view hooks (CSRF included) of the middleware below us
+        profile = _current.get()
+        if profile is not None:
+            profile.view_start = time.perf_counter()
+        return None
+
+    def check(self, request, profile):
+        """Log a warning for requests over the query budget or with repeated query shapes"""
+        if profile.queries > self.query_budget:
+            logger.warning(
+                '%s %s ran %d queries (budget %d, %.1f ms in the database)',
+                request.method, request.path, profile.queries, self.query_budget, profile.db_time * 1000,
+            )
+        for shape, n in profile.duplicates(self.duplicate_limit):
+            logger.warning(
+                '%s %s repeated a query %d times (possible N+1): %s',
+                request.method, request.path, n, shape[:300],
+            )
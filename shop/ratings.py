@@ -0,0 +1,76 @@
+"""
+Denormalized review aggregates on Product.
+
+``rating_count``, ``rating_sum`` and ``rating_avg`` are adjusted whenever a
+ProductReview is created, edited or deleted (see ``shop.signals``), so
+product pages and listings can show and sort by rating without running
+``AVG()`` over ``shop_productreview``.
+
+``python manage.py backfill_ratings`` recomputes them from the reviews table.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Product, ProductReview
+
+TWO_PLACES = Decimal('0.01')
+
+
+def average(rating_sum, rating_count):
+    if not rating_count:
+        return Decimal('0')
+    return (Decimal(rating_sum) / rating_count).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def adjust_rating(product_id, count_delta, sum_delta):
+    """Apply a change in review count/sum to a product under a row lock"""
+    if not count_delta and not sum_delta:
+        return
+    with transaction.atomic():
+        product = (
+            Product.objects.select_for_update()
+            .only('rating_count', 'rating_sum')
+            .filter(pk=product_id)
+            .first()
+        )
+        if product is None:
+            # Product is being deleted along with its reviews
+            return
+        rating_count = max(product.rating_count + count_delta, 0)
+        rating_sum = max(product.rating_sum + sum_delta, 0)
+        Product.objects.filter(pk=product_id).update(
+            rating_count=rating_count,
+            rating_sum=rating_sum,
+            rating_avg=average(rating_sum, rating_count),
+        )
+
+
+def backfill_ratings(batch_size=1000):
+    """Recompute the aggregates for every product, returning the number updated"""
+    totals = {
+        row['product_id']: (row['n'], row['total'])
+        for row in ProductReview.objects.values('product_id').annotate(n=Count('id'), total=Sum('rating')).order_by()
+    }
+    updated = 0
+    batch = []
+    products = Product.objects.only('id', 'rating_count', 'rating_sum', 'rating_avg').order_by('pk')
+    with transaction.atomic():
+        for product in products.iterator(chunk_size=batch_size):
+            rating_count, rating_sum = totals.get(product.pk, (0, 0))
+            rating_avg = average(rating_sum, rating_count)
+            if (product.rating_count, product.rating_sum, product.rating_avg) == (rating_count, rating_sum, rating_avg):
+                continue
+            product.rating_count = rating_count
+            product.rating_sum = rating_sum
+            product.rating_avg = rating_avg
+            batch.append(product)
+            if len(batch) >= batch_size:
+                Product.objects.bulk_update(batch, ['rating_count', 'rating_sum', 'rating_avg'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_update(batch, ['rating_count', 'rating_sum', 'rating_avg'])
+            updated += len(batch)
+    return updated
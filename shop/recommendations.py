@@ -0,0 +1,238 @@
+"""
+"Frequently bought together" recommendations.
+
+``build_copurchases`` (run offline with ``python manage.py
+build_copurchases``) streams ``OrderItem`` rows in chunks of whole orders,
+turns each chunk into a sparse order x product incidence matrix ``X`` and
+accumulates the product x product co-occurrence matrix ``X.T @ X`` with
+SciPy. Pairs are scored by cosine similarity (co-purchases divided by the
+geometric mean of each product's order count), which keeps best sellers
+from showing up next to everything. The top ``top_k`` neighbours of every
+product are stored in ``ProductAssociation``, so a product page reads them
+with one indexed lookup (``frequently_bought_with``).
+
+Personal "recommended for you" lists are built from those neighbours:
+``build_user_recommendations`` scores candidates for a chunk of users at
+once as ``U @ S``, where ``U`` holds each user's wishlist and purchase
+weights and ``S`` the stored item similarities, and keeps each user's best
+unseen active products in ``UserRecommendation``. Adding to a wishlist or
+placing an order queues a refresh for just that user (see
+``shop.tasks``). ``recommended_for`` serves the list from a per-user cache.
+
+NumPy and SciPy are only needed to build the tables, not to read them.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from . import caching
+from .models import Order, OrderItem, Product, ProductAssociation, UserRecommendation, Wishlist
+
+DEFAULT_TOP_K = 8
+DEFAULT_CHUNK_SIZE = 5000
+
+DEFAULT_USER_LIMIT = 8
+DEFAULT_USER_CHUNK_SIZE = 500
+
+# How much each kind of interaction counts towards a user's taste
+WISHLIST_WEIGHT = 1.0
+PURCHASE_WEIGHT = 2.0
+
+
+def _top_per_row(rows, cols, scores, counts, k):
+    """Indices of the ``k`` best (score, then count) entries of every row, and their ranks"""
+    import numpy as np
+
+    order = np.lexsort((cols, -counts, -scores, rows))
+    sorted_rows = rows[order]
+    ranks = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows, side='left')
+    top = ranks < k
+    return order[top], ranks[top]
+
+
+def build_copurchases(top_k=DEFAULT_TOP_K, chunk_size=DEFAULT_CHUNK_SIZE, min_count=1):
+    """Rebuild ProductAssociation from order history, returning the number of rows written"""
+    import numpy as np
+    from scipy import sparse
+
+    product_ids = np.fromiter(
+        Product.objects.order_by('id').values_list('id', flat=True).iterator(), dtype=np.int64
+    )
+    n_products = len(product_ids)
+    co_counts = sparse.csr_matrix((n_products, n_products), dtype=np.int64)
+
+    orders = Order.objects.exclude(status='cancelled').order_by('pk')
+    last = 0
+    while n_products:
+        order_ids = list(orders.filter(pk__gt=last).values_list('pk', flat=True)[:chunk_size])
+        if not order_ids:
+            break
+        pairs = np.array(
+            OrderItem.objects.filter(order_id__gt=last, order_id__lte=order_ids[-1])
+            .exclude(order__status='cancelled')
+            .values_list('order_id', 'product_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        last = order_ids[-1]
+        # Lines for products created after the id snapshot have no column
+        product_index = np.searchsorted(product_ids, pairs[:, 1])
+        known = product_index < n_products
+        known[known] = product_ids[product_index[known]] == pairs[known, 1]
+        pairs, product_index = pairs[known], product_index[known]
+        if not len(pairs):
+            continue
+        _, order_index = np.unique(pairs[:, 0], return_inverse=True)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int64), (order_index, product_index)),
+            shape=(order_index.max() + 1, n_products),
+        )
+        # A product listed twice in one order still counts once
+        incidence.data[:] = 1
+        co_counts = co_counts + (incidence.T @ incidence).tocsr()
+
+    order_counts = co_counts.diagonal().astype(np.float64)
+    pairs = co_counts.tocoo()
+    keep = (pairs.row != pairs.col) & (pairs.data >= min_count)
+    rows, cols, counts = pairs.row[keep], pairs.col[keep], pairs.data[keep]
+    scores = counts / np.sqrt(order_counts[rows] * order_counts[cols])
+
+    # Co-purchase count breaks score ties
+    top, ranks = _top_per_row(rows, cols, scores, counts, top_k)
+    associations = [
+        ProductAssociation(product_id=int(product_id), related_id=int(related_id), rank=int(rank), score=float(score))
+        for product_id, related_id, rank, score in zip(
+            product_ids[rows[top]], product_ids[cols[top]], ranks, scores[top]
+        )
+    ]
+    with transaction.atomic():
+        ProductAssociation.objects.all().delete()
+        ProductAssociation.objects.bulk_create(associations, batch_size=1000)
+    return len(associations)
+
+
+def frequently_bought_with(product, limit=4):
+    """Active products most often bought together with ``product``, best first"""
+    return list(
+        Product.objects.filter(co_purchased_by__product=product, is_active=True)
+        .select_related('primary_image')
+        .order_by('co_purchased_by__rank')[:limit]
+    )
+
+
+def related_products(product, limit=4):
+    """Co-purchase neighbours, topped up from the same category when history is thin"""
+    products = frequently_bought_with(product, limit)
+    if len(products) < limit:
+        products += list(
+            Product.objects.filter(category_id=product.category_id, is_active=True)
+            .exclude(id__in=[product.id] + [p.id for p in products])
+            .select_related('primary_image')[:limit - len(products)]
+        )
+    return products
+
+
+def _interactions(user_ids):
+    """(user_id, product_id, weight) rows for the given users' wishlists and purchases"""
+    wished = Wishlist.objects.filter(user_id__in=user_ids).values_list('user_id', 'product_id')
+    bought = (
+        OrderItem.objects.filter(order__user_id__in=user_ids)
+        .exclude(order__status='cancelled')
+        .values_list('order__user_id', 'product_id')
+    )
+    return [(u, p, WISHLIST_WEIGHT) for u, p in wished] + [(u, p, PURCHASE_WEIGHT) for u, p in bought]
+
+
+def _score_users(user_ids, limit):
+    """Return UserRecommendation rows (unsaved) for a chunk of users"""
+    import numpy as np
+    from scipy import sparse
+
+    interactions = _interactions(user_ids)
+    if not interactions:
+        return []
+    users = np.array([row[0] for row in interactions], dtype=np.int64)
+    seen = np.array([row[1] for row in interactions], dtype=np.int64)
+    weights = np.array([row[2] for row in interactions], dtype=np.float64)
+
+    neighbours = np.array(
+        ProductAssociation.objects.filter(product_id__in=set(seen.tolist()))
+        .values_list('product_id', 'related_id', 'score'),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    if not len(neighbours):
+        return []
+    sources, targets = neighbours[:, 0].astype(np.int64), neighbours[:, 1].astype(np.int64)
+
+    # Local indexes: only the users and products this chunk touches
+    user_index_ids, user_index = np.unique(users, return_inverse=True)
+    product_ids = np.unique(np.concatenate([seen, targets]))
+    n_users, n_products = len(user_index_ids), len(product_ids)
+    taste = sparse.csr_matrix(
+        (weights, (user_index, np.searchsorted(product_ids, seen))), shape=(n_users, n_products)
+    )
+    similarity = sparse.csr_matrix(
+        (neighbours[:, 2], (np.searchsorted(product_ids, sources), np.searchsorted(product_ids, targets))),
+        shape=(n_products, n_products),
+    )
+    candidates = (taste @ similarity).tocoo()
+    rows, cols, scores = candidates.row, candidates.col, candidates.data
+
+    # Drop products the user already has or wants, and inactive ones
+    seen_keys = taste.tocoo()
+    seen_keys = seen_keys.row.astype(np.int64) * n_products + seen_keys.col
+    active = np.isin(
+        product_ids,
+        list(Product.objects.filter(id__in=product_ids.tolist(), is_active=True).values_list('id', flat=True)),
+    )
+    keep = ~np.isin(rows.astype(np.int64) * n_products + cols, seen_keys) & active[cols] & (scores > 0)
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    top, ranks = _top_per_row(rows, cols, scores, np.zeros(len(rows)), limit)
+    return [
+        UserRecommendation(user_id=int(user_id), product_id=int(product_id), rank=int(rank), score=float(score))
+        for user_id, product_id, rank, score in zip(
+            user_index_ids[rows[top]], product_ids[cols[top]], ranks, scores[top]
+        )
+    ]
+
+
+def _store_user_recommendations(user_ids, limit):
+    recommendations = _score_users(user_ids, limit)
+    with transaction.atomic():
+        UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+        UserRecommendation.objects.bulk_create(recommendations, batch_size=1000)
+    cache.delete_many([_user_key(user_id) for user_id in user_ids])
+    return len(recommendations)
+
+
+def build_user_recommendations(limit=DEFAULT_USER_LIMIT, chunk_size=DEFAULT_USER_CHUNK_SIZE):
+    """Rebuild every user's list in chunks of users, returning the number of rows written"""
+    user_ids = sorted(
+        set(Wishlist.objects.values_list('user_id', flat=True).distinct())
+        | set(Order.objects.values_list('user_id', flat=True).distinct())
+    )
+    # Users whose history is gone keep nothing
+    UserRecommendation.objects.exclude(user_id__in=user_ids).delete()
+    written = 0
+    for start in range(0, len(user_ids), chunk_size):
+        written += _store_user_recommendations(user_ids[start:start + chunk_size], limit)
+    return written
+
+
+def refresh_user_recommendations(user_id, limit=DEFAULT_USER_LIMIT):
+    """Recompute one user's list (run as a background job after wishlist/order changes)"""
+    return _store_user_recommendations([user_id], limit)
+
+
+def _user_key(user_id):
+    return f'shop:recommended:{user_id}'
+
+
+def recommended_for(user, limit=4):
+    """A user's precomputed recommendations, cached per user"""
+    def load():
+        return list(
+            Product.objects.filter(recommended_to__user=user, is_active=True)
+            .select_related('primary_image')
+            .order_by('recommended_to__rank')[:limit]
+        )
+    return caching.get_or_set('recommended', _user_key(user.pk), load)
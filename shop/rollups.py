@@ -0,0 +1,166 @@
+"""
+Daily sales rollups for reporting.
+
+Two pre-aggregated tables stand in for ad-hoc ``GROUP BY``s over the order
+tables:
+
+* ``SalesRollup``: one row per (order date, payment method, status) with
+  the order count and the summed order amounts;
+* ``CategorySalesRollup``: one row per (order date, category, payment
+  method, status) with units and line revenue. An order with items in two
+  categories is counted in both, so only ``SalesRollup`` has order counts
+  that add up across categories.
+
+``rollup_sales`` (``python manage.py rollup_sales``, meant for cron) is
+incremental. It reads the orders whose ``updated_at`` is past the stored
+watermark, collects the order dates they fall on, and rebuilds just those
+days from the source tables. A status change moves an order between cells,
+so rebuilding whole days is simpler than applying deltas. Because a rebuild
+is idempotent, each run also re-reads ``OVERLAP`` before the watermark, to
+catch transactions that committed after the previous run.
+
+Orders are bucketed by creation date in the current time zone. Deleting an
+order does not touch ``updated_at``, so run ``rollup_sales --rebuild`` after
+purging orders.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CategorySalesRollup, Order, OrderItem, RollupWatermark, SalesRollup
+
+WATERMARK = 'sales'
+OVERLAP = timedelta(minutes=5)
+DAYS_PER_BATCH = 31
+
+
+def watermark():
+    """The ``updated_at`` up to which orders have been rolled up, or None"""
+    return RollupWatermark.objects.filter(name=WATERMARK).values_list('value', flat=True).first()
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _created_in(days, prefix=''):
+    """Q for ``created_at`` on any of ``days``, as index-friendly ranges over consecutive days"""
+    q = Q()
+    days = sorted(days)
+    start = end = days[0]
+    for day in days[1:] + [None]:
+        if day is not None and day == end + timedelta(days=1):
+            end = day
+            continue
+        q |= Q(**{
+            f'{prefix}created_at__gte': _day_start(start),
+            f'{prefix}created_at__lt': _day_start(end + timedelta(days=1)),
+        })
+        if day is not None:
+            start = end = day
+    return q
+
+
+def rebuild_days(days):
+    """Recompute both rollup tables for ``days`` from Order/OrderItem"""
+    days = sorted(set(days))
+    if not days:
+        return
+    order_rows = (
+        Order.objects.filter(_created_in(days))
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'payment_method', 'status')
+        .annotate(
+            n=Count('id'),
+            total=Sum('total_amount'),
+            discount=Sum('discount_amount'),
+            tax=Sum('tax_amount'),
+            final=Sum('final_amount'),
+        )
+        .order_by()
+    )
+    item_rows = (
+        OrderItem.objects.filter(_created_in(days, 'order__'))
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category_id', 'order__payment_method', 'order__status')
+        .annotate(n=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    with transaction.atomic():
+        SalesRollup.objects.filter(date__in=days).delete()
+        CategorySalesRollup.objects.filter(date__in=days).delete()
+        SalesRollup.objects.bulk_create([
+            SalesRollup(
+                date=row['day'], payment_method=row['payment_method'], status=row['status'],
+                orders=row['n'], total_amount=row['total'], discount_amount=row['discount'],
+                tax_amount=row['tax'], final_amount=row['final'],
+            )
+            for row in order_rows
+        ], batch_size=1000)
+        CategorySalesRollup.objects.bulk_create([
+            CategorySalesRollup(
+                date=row['day'], category_id=row['product__category_id'],
+                payment_method=row['order__payment_method'], status=row['order__status'],
+                orders=row['n'], items=row['units'], revenue=row['revenue'],
+            )
+            for row in item_rows
+        ], batch_size=1000)
+
+
+def rollup_sales(rebuild=False):
+    """
+    Bring the rollups up to date with orders changed since the watermark
+    (or with every order if ``rebuild``), returning the number of days
+    recomputed.
+
+    The whole run is one transaction, so reports never see a half-rebuilt
+    table and a failed run leaves the previous rollups and watermark.
+    """
+    upto = timezone.now()
+    since = None if rebuild else watermark()
+    changed = Order.objects.filter(updated_at__lte=upto)
+    if since is not None:
+        changed = changed.filter(updated_at__gt=since - OVERLAP)
+    days = sorted(set(
+        changed.annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct().order_by()
+    ))
+
+    with transaction.atomic():
+        if rebuild:
+            SalesRollup.objects.all().delete()
+            CategorySalesRollup.objects.all().delete()
+        for i in range(0, len(days), DAYS_PER_BATCH):
+            rebuild_days(days[i:i + DAYS_PER_BATCH])
+        RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': upto})
+    return len(days)
+
+
+def sales_report(date_from, date_to, statuses=None):
+    """
+    Sales between two dates (inclusive), read only from the rollup tables.
+
+    Returns totals plus breakdowns by day, category, payment method and
+    status; ``statuses`` narrows every figure to those order statuses.
+    """
+    cells = SalesRollup.objects.filter(date__gte=date_from, date__lte=date_to)
+    category_cells = CategorySalesRollup.objects.filter(date__gte=date_from, date__lte=date_to)
+    if statuses:
+        cells = cells.filter(status__in=statuses)
+        category_cells = category_cells.filter(status__in=statuses)
+
+    sums = {'orders': Sum('orders'), 'revenue': Sum('final_amount'), 'discount': Sum('discount_amount')}
+    return {
+        'totals': cells.aggregate(**sums),
+        'by_day': list(cells.values('date').annotate(**sums).order_by('date')),
+        'by_payment_method': list(cells.values('payment_method').annotate(**sums).order_by('-revenue')),
+        'by_status': list(cells.values('status').annotate(**sums).order_by('-revenue')),
+        'by_category': list(
+            category_cells.values('category_id', 'category__name')
+            .annotate(items=Sum('items'), revenue=Sum('revenue'))
+            .order_by('-revenue')
+        ),
+        'as_of': watermark(),
+    }
@@ -0,0 +1,141 @@
+"""
+Inverted-index product search.
+
+Product name, brand and description are split into lowercase tokens and
+stored in ``ProductSearchTerm`` rows (one row per term/product pair, with a
+weight reflecting which fields the term appeared in). Searches then run
+against the indexed ``term`` column instead of ``icontains`` scans over
+``shop_product``.
+
+The migration that creates the table indexes the existing catalog, the
+Product signals in ``shop.signals`` keep it current, and
+``python manage.py rebuild_search_index`` rebuilds it after bulk loads that
+bypass signals.
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import Product, ProductSearchTerm
+
+# How much a single occurrence of a term counts towards relevance, per field
+FIELD_WEIGHTS = {
+    'name': 10,
+    'brand': 5,
+    'description': 1,
+}
+
+# Fields that feed the index; saves that touch none of them skip reindexing
+INDEXED_FIELDS = frozenset(FIELD_WEIGHTS) | {'is_active'}
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+MAX_TERM_LENGTH = 50
+MAX_QUERY_TERMS = 8
+
+
+def tokenize(text):
+    """Split text into lowercase, de-stopworded search terms"""
+    if not text:
+        return []
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+def build_terms(product):
+    """Return a {term: weight} mapping for a product"""
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(product, field, '')):
+            weights[token] += field_weight
+    return weights
+
+
+def _term_rows(product):
+    return [
+        ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+        for term, weight in build_terms(product).items()
+    ]
+
+
+def index_product(product):
+    """(Re)index a single product, dropping it from the index if inactive"""
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id=product.pk).delete()
+        if product.is_active:
+            ProductSearchTerm.objects.bulk_create(_term_rows(product))
+
+
+def index_products(products, batch_size=1000):
+    """(Re)index a batch of products with one delete and bulk inserts"""
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=[product.pk for product in products]).delete()
+        rows = []
+        for product in products:
+            if product.is_active:
+                rows.extend(_term_rows(product))
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild the whole index from scratch, returning the number of products indexed"""
+    indexed = 0
+    products = (
+        Product.objects.filter(is_active=True)
+        .only('id', 'name', 'brand', 'description', 'is_active')
+        .order_by('pk')
+    )
+    with transaction.atomic():
+        ProductSearchTerm.objects.all().delete()
+        rows = []
+        for product in products.iterator(chunk_size=batch_size):
+            rows.extend(_term_rows(product))
+            indexed += 1
+            if len(rows) >= batch_size:
+                ProductSearchTerm.objects.bulk_create(rows, batch_size=batch_size)
+                rows = []
+        if rows:
+            ProductSearchTerm.objects.bulk_create(rows, batch_size=batch_size)
+    return indexed
+
+
+def _query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def search_products(queryset, query):
+    """
+    Restrict a Product queryset to items matching every term in ``query``.
+
+    Each query term is matched as a prefix of an indexed term, so "head"
+    finds "headphones". On PostgreSQL the ``LIKE 'head%'`` this becomes is
+    served by a ``varchar_pattern_ops`` index on ``term`` (migration 0019):
+    under a non-C collation the unique (term, product) index cannot be used
+    for it.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return queryset.none()
+    for term in terms:
+        queryset = queryset.filter(
+            pk__in=ProductSearchTerm.objects.filter(term__startswith=term).values('product_id')
+        )
+    return queryset
+
+
+def rank_products(queryset, query):
+    """Annotate search results with ``search_rank`` (sum of matched term weights)"""
+    rank_filter = Q()
+    for term in _query_terms(query):
+        rank_filter |= Q(search_terms__term__startswith=term)
+    return queryset.annotate(search_rank=Sum('search_terms__weight', filter=rank_filter))
@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Cart, CartItem, Category, Coupon, Order, Product, ProductImage, ProductReview, Wishlist
+from . import caching, facets, images, inventory, jobs, ratings, search, snapshots
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index in step with product edits"""
+    # Index rows are removed with the product through the FK cascade, so
+    # deletes need no handler here.
+    if update_fields is not None and not search.INDEXED_FIELDS.intersection(update_fields):
+        return
+    search.index_product(instance)
+
+
+@receiver(pre_save, sender=Product)
+def remember_facet_key(sender, instance, update_fields=None, **kwargs):
+    """Record which facet cell the stored row counts towards before it changes"""
+    instance._old_facet_key = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not facets.FACET_FIELDS.intersection(update_fields):
+        instance._old_facet_key = facets.UNCHANGED
+        return
+    old = (
+        Product.objects.filter(pk=instance.pk)
+        .values('category_id', 'brand', 'price', 'is_active')
+        .first()
+    )
+    if old:
+        instance._old_facet_key = facets.facet_key(**old)
+
+
+@receiver(post_save, sender=Product)
+def update_facet_counts(sender, instance, **kwargs):
+    """Move the product between facet cells when its category, brand or price changes"""
+    old_key = getattr(instance, '_old_facet_key', None)
+    if old_key is facets.UNCHANGED:
+        return
+    new_key = facets.facet_key(instance.category_id, instance.brand, instance.price, instance.is_active)
+    if old_key != new_key:
+        facets.adjust(old_key, -1)
+        facets.adjust(new_key, 1)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_facet_counts(sender, instance, **kwargs):
+    facets.adjust(
+        facets.facet_key(instance.category_id, instance.brand, instance.price, instance.is_active), -1
+    )
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def sync_primary_image(sender, instance, **kwargs):
+    """Re-resolve Product.primary_image whenever a product's images change"""
+    Product(pk=instance.product_id).update_primary_image()
+
+
+@receiver(post_save, sender=ProductImage)
+def queue_image_variants(sender, instance, **kwargs):
+    """Resize new or replaced uploads in the job worker, not in the request"""
+    images.queue_variants([instance])
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._old_rating = None
+    if instance.pk is not None:
+        instance._old_rating = (
+            ProductReview.objects.filter(pk=instance.pk)
+            .values_list('product_id', 'rating')
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_on_save(sender, instance, **kwargs):
+    """Fold a new or edited review into its product's rating aggregates"""
+    old = getattr(instance, '_old_rating', None)
+    if old is None:
+        ratings.adjust_rating(instance.product_id, 1, instance.rating)
+        return
+    old_product_id, old_rating = old
+    if old_product_id != instance.product_id:
+        ratings.adjust_rating(old_product_id, -1, -old_rating)
+        ratings.adjust_rating(instance.product_id, 1, instance.rating)
+    else:
+        ratings.adjust_rating(instance.product_id, 0, instance.rating - old_rating)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_on_delete(sender, instance, **kwargs):
+    ratings.adjust_rating(instance.product_id, -1, -instance.rating)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Any catalog change retires every cached page/fragment built from it"""
+    # Bump after commit so no worker can rebuild from pre-change data under
+    # the new stamp
+    transaction.on_commit(caching.bump_catalog_version)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_snapshot(sender, **kwargs):
+    transaction.on_commit(caching.bump_category_version)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupon_cache(sender, **kwargs):
+    transaction.on_commit(caching.bump_coupon_version)
+
+
+@receiver(post_save, sender=Order)
+def invalidate_order_snapshot(sender, instance, created=False, **kwargs):
+    """Any edit to an order (status change included) retires its rendered snapshot"""
+    if not created:
+        snapshots.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Wishlist)
+def refresh_recommendations_on_wish(sender, instance, created=False, **kwargs):
+    """Wishing for something changes what we recommend to that user"""
+    if created:
+        jobs.enqueue(
+            'refresh_recommendations',
+            {'user_id': instance.user_id},
+            key=f'refresh_recommendations:{instance.user_id}:wishlist:{instance.pk}',
+        )
+
+
+@receiver(post_delete, sender=CartItem)
+def release_item_hold(sender, instance, **kwargs):
+    """A removed cart line gives its held stock back"""
+    if inventory.holds_committed(instance.cart_id):
+        return
+    inventory.release(instance.cart_id, instance.product_id)
+
+
+@receiver(pre_delete, sender=Cart)
+def release_cart_holds(sender, instance, **kwargs):
+    # Runs before the reservation rows go with the cart through the FK cascade
+    inventory.release_cart(instance)
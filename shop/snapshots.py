@@ -0,0 +1,64 @@
+"""
+Rendered snapshots of finished orders.
+
+Delivered and cancelled orders do not change, so the body of their detail
+page is rendered once and stored in ``OrderSnapshot``. Later visits load
+the order and its snapshot in one query and skip the items query and the
+template rendering entirely.
+
+A snapshot records the status it was rendered for and is only served
+while the order still has that status; saving an order also deletes its
+snapshot (see ``shop.signals``), so an admin edit or a status change
+always gets a fresh render. Snapshots keep the product names and prices
+the customer saw, which is what a historical order should show anyway.
+"""
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+
+from .models import OrderSnapshot
+
+TEMPLATE = 'shop/order_detail_body.html'
+
+# Statuses after which an order's details no longer change
+TERMINAL_STATUSES = frozenset(['delivered', 'cancelled'])
+
+
+def _render(order):
+    order_items = order.items.select_related('product__primary_image')
+    return render_to_string(TEMPLATE, {'order': order, 'order_items': order_items})
+
+
+def _stored(order):
+    try:
+        snapshot = order.snapshot
+    except OrderSnapshot.DoesNotExist:
+        return None
+    return snapshot if snapshot.status == order.status else None
+
+
+def order_body(order):
+    """
+    Return the rendered body of an order's detail page.
+
+    ``order`` should be fetched with ``select_related('snapshot')`` so that a
+    stored snapshot costs no extra query.
+    """
+    if order.status not in TERMINAL_STATUSES:
+        return _render(order)
+    snapshot = _stored(order)
+    if snapshot is not None:
+        return snapshot.html
+    html = _render(order)
+    try:
+        with transaction.atomic():
+            OrderSnapshot.objects.update_or_create(
+                order_id=order.pk, defaults={'status': order.status, 'html': html}
+            )
+    except IntegrityError:
+        # Another request stored it first
+        pass
+    return html
+
+
+def invalidate(order_id):
+    OrderSnapshot.objects.filter(order_id=order_id).delete()
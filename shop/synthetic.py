@@ -0,0 +1,403 @@
+"""
+Synthetic shop data at a chosen scale, for finding scaling problems.
+
+``generate`` (``manage.py create_sample_data --scale N``) fills the
+database with a catalog, customers and their activity. One unit of scale
+is 10,000 products, 2,000 users and 10,000 orders, so ``--scale 100`` gives
+a million products. Each user also gets about five reviews and three
+wishlist entries on average, and one user in ten has an open cart.
+
+The data is skewed the way real shops are:
+
+* Product popularity (what gets ordered, reviewed and wishlisted) and
+  customer activity follow Zipf distributions. A few products and
+  customers account for much of the traffic. The popular items are spread
+  over the id range instead of sitting at the start of it.
+* Brands have a long tail: a few big brands, and hundreds with only a
+  handful of products.
+* The category tree is three levels deep (department / aisle / shelf), and
+  its size grows with the square root of the scale. ``Category`` has no
+  parent link, so only the shelves are stored, named by their full path.
+  Products crowd into the popular shelves.
+* Order volume rises over the two years of history. Old orders are
+  delivered or cancelled; recent ones are still moving through the
+  statuses.
+
+Rows are written with ``bulk_create``, one fixed-size partition of ids at a
+time, in batches of ``batch_size``. Each partition draws from its own
+random generator, seeded from ``(seed, table, partition)``. Primary keys
+are assigned by the generator. So the data depends only on ``seed`` and
+``scale``, never on ``workers``, and a slow query seen on a big run can be
+reproduced locally. (Timestamps are placed relative to the time of the
+run, so only they shift between runs.)
+
+With ``workers > 1``, a process pool writes the partitions. That needs
+PostgreSQL or MySQL: SQLite allows one writer at a time, so it always uses
+a single process. Products and users are written first. Orders, reviews,
+wishlists and carts come second, because they reference them.
+
+Bulk writes skip model signals, so ``generate`` rebuilds the search index,
+rating aggregates, facet counts and sales rollups at the end. With
+``with_recommendations=True`` it also rebuilds the recommendation tables.
+"""
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, models, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import caching, facets, ratings, recommendations, rollups, search
+from .ids import RANDOM_BITS, order_id_at
+from .models import Cart, CartItem, Category, Order, OrderItem, Product, ProductReview, Wishlist
+
+# Rows per unit of scale
+SCALE_UNIT = {'products': 10_000, 'users': 2_000, 'orders': 10_000}
+REVIEWS_PER_USER = 5
+WISHLIST_PER_USER = 3
+CART_SHARE = 0.1
+HISTORY_DAYS = 730
+
+# Rows per partition; fixed so the output doesn't depend on the worker count
+PARTITION_SIZE = 10_000
+DEFAULT_BATCH_SIZE = 2000
+
+PASSWORD = 'password'
+
+DEPARTMENTS = ['Electronics', 'Clothing', 'Books', 'Home & Garden', 'Sports', 'Toys', 'Beauty',
+               'Grocery', 'Automotive', 'Office', 'Pets', 'Music']
+AISLES = ['Essentials', 'Outdoor', 'Kids', 'Accessories', 'Premium', 'Everyday', 'Travel', 'Seasonal',
+          'Professional', 'Vintage', 'Compact', 'Family']
+SHELVES = ['Basics', 'Sets', 'Parts', 'Tools', 'Bundles', 'Refills', 'Gifts', 'Classics', 'Minis',
+           'Deluxe', 'Starters', 'Spares']
+ADJECTIVES = ['Classic', 'Wireless', 'Organic', 'Compact', 'Premium', 'Vintage', 'Smart', 'Portable',
+              'Ergonomic', 'Deluxe', 'Eco', 'Ultra', 'Modern', 'Rustic', 'Pro', 'Mini', 'Heavy-Duty', 'Foldable']
+NOUNS = ['Headphones', 'Backpack', 'Lamp', 'Kettle', 'Sneakers', 'Jacket', 'Novel', 'Speaker', 'Blender',
+         'Notebook', 'Watch', 'Camera', 'Chair', 'Mug', 'Keyboard', 'Planter', 'Tent', 'Drill', 'Puzzle', 'Serum']
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ra', 'to', 'vi', 'zu', 'bel', 'cor', 'dan', 'fex',
+             'gal', 'hul', 'jin', 'kor', 'lux', 'mar', 'nor', 'pel', 'quo', 'sen', 'tar', 'vel']
+STATUS_WEIGHTS = {'delivered': 88, 'cancelled': 12}
+PAYMENT_WEIGHTS = {'card': 55, 'paypal': 20, 'stripe': 15, 'cod': 10}
+RATING_WEIGHTS = [4, 3, 8, 25, 60]
+
+_STRIDES = [104729, 1299709, 15485863]
+
+
+def zipf_rank(rng, n, s=1.1):
+    """Draw a 0-based rank from an (approximate, continuous) Zipf(s) distribution over n items"""
+    if n <= 1:
+        return 0
+    x = (1 + rng.random() * (n ** (1 - s) - 1)) ** (1 / (1 - s))
+    return min(int(x), n) - 1
+
+
+def spread(rank, n):
+    """Map a popularity rank to an item index so popular items are scattered over the id range"""
+    stride = next(p for p in _STRIDES if n % p)
+    return (rank * stride) % n
+
+
+def brand_name(index):
+    """Deterministic made-up brand name for a brand index"""
+    n = len(SYLLABLES)
+    return ''.join(SYLLABLES[(index // n ** k) % n] for k in range(3)).capitalize()
+
+
+def _rng(plan, table, start):
+    return random.Random(f'{plan["seed"]}:{table}:{start}')
+
+
+def _next_id(model):
+    return (model.objects.aggregate(top=models.Max('pk'))['top'] or 0) + 1
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _moment(plan, rng, recent_bias=1):
+    """A time in the history window; recent_bias > 1 favours recent times"""
+    age = HISTORY_DAYS * 86400 * rng.random() ** recent_bias
+    return plan['now'] - timedelta(seconds=age)
+
+
+@contextmanager
+def _explicit_timestamps():
+    """Let bulk_create keep the timestamps we set instead of auto_now/auto_now_add"""
+    saved = []
+    for model in (Product, Order, ProductReview, Wishlist, Cart, CartItem):
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _categories(plan, rng):
+    """The shelf categories of a department/aisle/shelf tree sized for the scale"""
+    leaves = max(len(DEPARTMENTS), int(60 * math.sqrt(plan['scale'])))
+    per_department = math.ceil(leaves / len(DEPARTMENTS))
+    aisles = math.ceil(math.sqrt(per_department))
+    shelves = math.ceil(per_department / aisles)
+    rows = []
+    pk = plan['category_base']
+    for department in DEPARTMENTS:
+        for a in range(aisles):
+            aisle = AISLES[a % len(AISLES)] + (f' {a // len(AISLES) + 1}' if a >= len(AISLES) else '')
+            for s in range(shelves):
+                shelf = SHELVES[s % len(SHELVES)] + (f' {s // len(SHELVES) + 1}' if s >= len(SHELVES) else '')
+                path = f'{department} / {aisle} / {shelf}'
+                rows.append(Category(
+                    pk=pk, name=path, slug=f'{slugify(path)[:40]}-{pk}',
+                    description=f'{shelf} in {department}, {aisle.lower()} aisle',
+                    is_active=rng.random() > 0.02,
+                ))
+                pk += 1
+    return rows
+
+
+def _products(plan, start, end, batch_size):
+    rng = _rng(plan, 'products', start)
+    n_categories, n_brands = plan['categories'], plan['brands']
+    rows = []
+    for i in range(start, end):
+        pk = plan['product_base'] + i
+        brand = brand_name(spread(zipf_rank(rng, n_brands, 1.2), n_brands))
+        noun = rng.choice(NOUNS)
+        name = f'{brand} {rng.choice(ADJECTIVES)} {noun} {rng.choice("ABCDEFGHKMRSTXZ")}{rng.randint(10, 999)}'
+        price = Decimal(min(max(rng.lognormvariate(math.log(40), 1.0), 1), 5000)).quantize(Decimal('0.01'))
+        discount = None
+        if rng.random() < 0.15:
+            discount = (price * Decimal(rng.choice(['0.9', '0.8', '0.7', '0.5']))).quantize(Decimal('0.01'))
+        created = _moment(plan, rng, recent_bias=0.7)
+        rows.append(Product(
+            pk=pk, name=name, slug=f'{slugify(name)[:40]}-{pk}',
+            description=f'{name}. A {noun.lower()} from {brand}, one of our {rng.choice(AISLES).lower()} picks.',
+            price=price, discount_price=discount,
+            category_id=plan['category_base'] + spread(zipf_rank(rng, n_categories, 0.9), n_categories),
+            brand=brand,
+            stock=0 if rng.random() < 0.05 else min(int(rng.paretovariate(1.2) * 10), 5000),
+            is_active=rng.random() > 0.03,
+            created_at=created, updated_at=created,
+        ))
+    Product.objects.bulk_create(rows, batch_size=batch_size)
+    return {'products': len(rows)}
+
+
+def _users(plan, start, end, batch_size):
+    rng = _rng(plan, 'users', start)
+    rows = []
+    for i in range(start, end):
+        pk = plan['user_base'] + i
+        rows.append(User(
+            pk=pk, username=f'user{pk}', email=f'user{pk}@example.com', password=plan['password'],
+            first_name=rng.choice(['Alex', 'Sam', 'Jordan', 'Taylor', 'Casey', 'Riley', 'Morgan', 'Jamie']),
+            last_name=rng.choice(['Smith', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Silva', 'Kim', 'Haddad']),
+            date_joined=_moment(plan, rng),
+        ))
+    User.objects.bulk_create(rows, batch_size=batch_size)
+    return {'users': len(rows)}
+
+
+def _final_prices(product_ids):
+    prices = {}
+    ids = sorted(product_ids)
+    # Chunked to stay under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 900):
+        for pk, price, discount in Product.objects.filter(pk__in=ids[i:i + 900]).values_list('id', 'price', 'discount_price'):
+            prices[pk] = discount or price
+    return prices
+
+
+def _order_status(rng, age_days):
+    if age_days < 3:
+        return rng.choice(['pending', 'processing'])
+    if age_days < 14:
+        return rng.choice(['processing', 'shipped', 'shipped', 'cancelled'])
+    return _pick(rng, STATUS_WEIGHTS)
+
+
+def _orders(plan, start, end, batch_size):
+    rng = _rng(plan, 'orders', start)
+    n_users, n_products = plan['users'], plan['products']
+    drafts = []
+    for i in range(start, end):
+        created = _moment(plan, rng, recent_bias=2)
+        user_id = plan['user_base'] + spread(zipf_rank(rng, n_users, 0.8), n_users)
+        lines = {}
+        for _ in range(1 + min(int(rng.expovariate(0.7)), 7)):
+            product_id = plan['product_base'] + spread(zipf_rank(rng, n_products), n_products)
+            lines[product_id] = rng.choice([1, 1, 1, 2, 2, 3])
+        drafts.append((plan['order_base'] + i, created, user_id, lines, rng.getrandbits(RANDOM_BITS)))
+
+    prices = _final_prices({product_id for draft in drafts for product_id in draft[3]})
+    orders, items = [], []
+    for pk, created, user_id, lines, random_part in drafts:
+        total = Decimal('0')
+        for product_id, quantity in lines.items():
+            price = prices[product_id]
+            total += price * quantity
+            items.append(OrderItem(order_id=pk, product_id=product_id, quantity=quantity,
+                                   price=price, total_price=price * quantity))
+        age_days = (plan['now'] - created).days
+        orders.append(Order(
+            pk=pk, order_id=order_id_at(created, random_part), user_id=user_id,
+            first_name='Synthetic', last_name=f'Customer {user_id}', email=f'user{user_id}@example.com',
+            city='Springfield', country='US', status=_order_status(rng, age_days),
+            payment_method=_pick(rng, PAYMENT_WEIGHTS),
+            shipping_address=f'{user_id} Main St', billing_address=f'{user_id} Main St',
+            total_amount=total, final_amount=total,
+            created_at=created, updated_at=created + timedelta(days=min(age_days, rng.randint(0, 10))),
+        ))
+    Order.objects.bulk_create(orders, batch_size=batch_size)
+    OrderItem.objects.bulk_create(items, batch_size=batch_size)
+    return {'orders': len(orders), 'order_items': len(items)}
+
+
+def _activity(plan, start, end, batch_size):
+    """Reviews, wishlists and open carts for users ``start``..``end``"""
+    rng = _rng(plan, 'activity', start)
+    n_products = plan['products']
+    reviews, wishlists, carts, cart_items = [], [], [], []
+
+    def popular_products(count):
+        return {plan['product_base'] + spread(zipf_rank(rng, n_products), n_products) for _ in range(count)}
+
+    for i in range(start, end):
+        user_id = plan['user_base'] + i
+        for product_id in popular_products(min(int(rng.expovariate(1 / REVIEWS_PER_USER)), 200)):
+            rating = rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+            reviews.append(ProductReview(
+                product_id=product_id, user_id=user_id, rating=rating,
+                comment=rng.choice(['Great value.', 'Does the job.', 'Not what I expected.',
+                                    'Would buy again!', 'Arrived quickly, works well.']),
+                created_at=_moment(plan, rng, recent_bias=1.5),
+            ))
+        for product_id in popular_products(min(int(rng.expovariate(1 / WISHLIST_PER_USER)), 100)):
+            wishlists.append(Wishlist(user_id=user_id, product_id=product_id, added_at=_moment(plan, rng)))
+        if rng.random() < CART_SHARE:
+            cart_id = plan['cart_base'] + i
+            created = plan['now'] - timedelta(minutes=rng.randint(1, 60 * 24 * 14))
+            carts.append(Cart(pk=cart_id, user_id=user_id, created_at=created, updated_at=created))
+            for product_id in popular_products(rng.randint(1, 5)):
+                cart_items.append(CartItem(cart_id=cart_id, product_id=product_id,
+                                           quantity=rng.randint(1, 3), added_at=created))
+
+    ProductReview.objects.bulk_create(reviews, batch_size=batch_size)
+    Wishlist.objects.bulk_create(wishlists, batch_size=batch_size)
+    Cart.objects.bulk_create(carts, batch_size=batch_size)
+    CartItem.objects.bulk_create(cart_items, batch_size=batch_size)
+    return {'reviews': len(reviews), 'wishlists': len(wishlists), 'carts': len(carts), 'cart_items': len(cart_items)}
+
+
+WRITERS = {'products': _products, 'users': _users, 'orders': _orders, 'activity': _activity}
+
+
+def _write_partition(task):
+    """Write one partition (runs in a worker process when workers > 1)"""
+    table, start, end, plan, batch_size = task
+    with _explicit_timestamps(), transaction.atomic():
+        return WRITERS[table](plan, start, end, batch_size)
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _partitions(table, total, plan, batch_size):
+    return [(table, start, min(start + PARTITION_SIZE, total), plan, batch_size)
+            for start in range(0, total, PARTITION_SIZE)]
+
+
+def _plan(scale, seed):
+    return {
+        'scale': scale,
+        'seed': seed,
+        'now': timezone.now().replace(microsecond=0),
+        'products': max(10, int(SCALE_UNIT['products'] * scale)),
+        'users': max(5, int(SCALE_UNIT['users'] * scale)),
+        'orders': max(10, int(SCALE_UNIT['orders'] * scale)),
+        'brands': min(max(10, int(300 * math.sqrt(scale))), len(SYLLABLES) ** 3),
+        'category_base': _next_id(Category),
+        'product_base': _next_id(Product),
+        'user_base': _next_id(User),
+        'order_base': _next_id(Order),
+        'cart_base': _next_id(Cart),
+        # A fixed salt keeps the hash (and so the data) reproducible
+        'password': make_password(PASSWORD, salt='synthetic'),
+    }
+
+
+def generate(scale=1.0, seed=0, workers=1, batch_size=DEFAULT_BATCH_SIZE, with_recommendations=False, progress=None):
+    """
+    Add a synthetic dataset of the given scale, then rebuild the derived
+    tables. Returns a dict of row counts; ``progress(message)`` is called as
+    each phase finishes.
+    """
+    progress = progress or (lambda message: None)
+    plan = _plan(scale, seed)
+    if connection.vendor == 'sqlite':
+        workers = 1
+
+    with _explicit_timestamps(), transaction.atomic():
+        categories = _categories(plan, _rng(plan, 'categories', 0))
+        Category.objects.bulk_create(categories, batch_size=batch_size)
+    plan['categories'] = len(categories)
+    progress(f'{len(categories)} categories')
+
+    counts = {'categories': len(categories)}
+    phases = [
+        _partitions('products', plan['products'], plan, batch_size) + _partitions('users', plan['users'], plan, batch_size),
+        _partitions('orders', plan['orders'], plan, batch_size) + _partitions('activity', plan['users'], plan, batch_size),
+    ]
+    def add(written):
+        for table, n in written.items():
+            counts[table] = counts.get(table, 0) + n
+
+    if workers > 1:
+        # Children must open their own connections, not share the parent's
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for tasks in phases:
+                for written in pool.map(_write_partition, tasks):
+                    add(written)
+                progress(', '.join(f'{n} {table}' for table, n in counts.items()))
+    else:
+        for tasks in phases:
+            for task in tasks:
+                add(_write_partition(task))
+            progress(', '.join(f'{n} {table}' for table, n in counts.items()))
+
+    # Explicit primary keys leave PostgreSQL sequences behind
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Category, Product, User, Order, Cart]):
+            cursor.execute(sql)
+
+    rebuild_derived(with_recommendations)
+    progress('rebuilt search index, ratings, facets and sales rollups')
+    return counts
+
+
+def rebuild_derived(with_recommendations=False):
+    """Recompute what the model signals maintain, after bulk writes that skipped them"""
+    search.rebuild_index()
+    ratings.backfill_ratings()
+    facets.rebuild_facets()
+    rollups.rollup_sales(rebuild=True)
+    if with_recommendations:
+        recommendations.build_copurchases()
+        recommendations.build_user_recommendations()
+    caching.bump_catalog_version()
+    caching.bump_category_version()
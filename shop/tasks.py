@@ -0,0 +1,47 @@
+"""
+Background job handlers (queued with ``shop.jobs.enqueue``).
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from . import caching, images, recommendations
+from .jobs import task
+from .models import Order, Product, ProductImage
+
+
+@task('order_confirmation')
+def send_order_confirmation(order_id):
+    """Email the customer a summary of a newly placed order"""
+    order = Order.objects.select_related('user').filter(order_id=order_id).first()
+    if order is None:
+        return
+    recipient = order.email or order.user.email
+    if not recipient:
+        return
+    items = order.items.select_related('product')
+    send_mail(
+        f'Your order #{order.order_id}',
+        render_to_string('shop/emails/order_confirmation.txt', {'order': order, 'items': items}),
+        getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+        [recipient],
+    )
+
+
+@task('refresh_recommendations')
+def refresh_recommendations(user_id):
+    """Recompute a user's "recommended for you" list after their history changed"""
+    recommendations.refresh_user_recommendations(user_id)
+
+
+@task('image_variants')
+def generate_image_variants(image_id, name):
+    """Build the sized variants of a newly uploaded product image"""
+    image = ProductImage.objects.filter(pk=image_id, image=name).first()
+    if image is not None and images.needs_variants(image):
+        images.generate_variants(image)
+        # Cached pages only show primary images, rendered with the original
+        # upload; other images change nothing cached, so a product's batch
+        # of variant jobs invalidates the catalog once, not once per image
+        if Product.objects.filter(primary_image_id=image.pk).exists():
+            caching.bump_catalog_version()
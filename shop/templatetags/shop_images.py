@@ -0,0 +1,54 @@
+import re
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from shop.images import variant_urls
+
+register = template.Library()
+
+DEFAULT_SLOT_WIDTH = 600
+
+
+def _slot_width(sizes):
+    match = re.fullmatch(r'\s*(\d+)px\s*', sizes)
+    return int(match.group(1)) if match else DEFAULT_SLOT_WIDTH
+
+
+def _srcset(variants):
+    return ', '.join(f'{url} {width}w' for width, height, url in variants)
+
+
+@register.simple_tag
+def product_image(image, sizes='250px', **attrs):
+    """
+    Render a ProductImage as a ``<picture>`` with WebP and JPEG ``srcset``s.
+
+    ``sizes`` is the slot width the image is drawn at (any ``sizes`` value);
+    extra keyword arguments become attributes of the ``<img>``. Images
+    without variants yet fall back to the original upload.
+    """
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    jpeg = variant_urls(image, 'jpeg')
+    if not jpeg:
+        return format_html(
+            '<img src="{}"{}>', image.image.url,
+            format_html_join('', ' {}="{}"', attrs.items()),
+        )
+
+    # The src fallback is the smallest JPEG that still fills the slot
+    slot = _slot_width(sizes)
+    fallback = next((variant for variant in jpeg if variant[0] >= slot), jpeg[-1])
+    attrs = {'width': fallback[0], 'height': fallback[1], **attrs}
+    webp = variant_urls(image, 'webp')
+    source = format_html(
+        '<source type="image/webp" srcset="{}" sizes="{}">', _srcset(webp), sizes,
+    ) if webp else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        source, fallback[2], _srcset(jpeg), sizes,
+        format_html_join('', ' {}="{}"', attrs.items()),
+    )
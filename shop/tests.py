@@ -1,3 +1,1560 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import (
+    Cart, CartItem, Category, Coupon, Job, Order, OrderItem, OrderSnapshot, Product, ProductAssociation,
+    ProductFacetCount, ProductImage, ProductReview, StockReservation, StockShard, Wishlist,
+)
+
+
+def make_category(name='Lighting', **kwargs):
+    return Category.objects.create(name=name, slug=slugify(name), **kwargs)
+
+
+def make_product(name, category, price='10.00', stock=10, **kwargs):
+    kwargs.setdefault('description', f'{name} description')
+    return Product.objects.create(
+        name=name, slug=kwargs.pop('slug', slugify(name)), category=category,
+        price=Decimal(price), stock=stock, **kwargs,
+    )
+
+
+def make_order(user, **kwargs):
+    kwargs.setdefault('payment_method', 'card')
+    kwargs.setdefault('total_amount', Decimal('10.00'))
+    kwargs.setdefault('final_amount', kwargs['total_amount'])
+    return Order.objects.create(user=user, shipping_address='1 Main St', billing_address='1 Main St', **kwargs)
+
+
+def fill_cart(user, *lines):
+    """Put ``(product, quantity)`` lines in the user's cart, holding stock as add_to_cart does"""
+    from . import inventory
+
+    cart, _ = Cart.objects.get_or_create(user=user)
+    for product, quantity in lines:
+        assert inventory.set_held(cart, product, quantity)
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    return cart
+
+
+def stock_of(product):
+    return Product.objects.values_list('stock', flat=True).get(pk=product.pk)
+
+
+def listed_names(response):
+    return [product.name for product in response.context['page_obj']]
+
+
+def walk_pages(client, url, params=None):
+    """Follow next cursors from the first page; returns the pages' responses"""
+    responses = [client.get(url, params or {})]
+    while responses[-1].context['page_obj'].has_next():
+        responses.append(client.get(url, {**(params or {}), 'cursor': responses[-1].context['page_obj'].next_cursor}))
+    return responses
+
+
+def page_ids(response):
+    return [obj.pk for obj in response.context['page_obj']]
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        self.by_name = make_product('Brass Lamp', self.category, description='A desk light')
+        self.by_brand = make_product('Desk Light', self.category, brand='Lamp Co', description='Bright')
+        self.by_description = make_product('Reading Light', self.category, description='Works as a lamp too')
+        make_product('Oak Table', self.category, description='Solid wood')
+
+    def search(self, query, **params):
+        return self.client.get(reverse('product_list'), {'q': query, **params})
+
+    def test_ranks_name_over_brand_over_description(self):
+        self.assertEqual(listed_names(self.search('lamp')), ['Brass Lamp', 'Desk Light', 'Reading Light'])
+
+    def test_matches_prefixes_and_requires_every_term(self):
+        self.assertEqual(listed_names(self.search('bra')), ['Brass Lamp'])
+        self.assertEqual(listed_names(self.search('lamp desk')), ['Desk Light', 'Brass Lamp'])
+        self.assertEqual(listed_names(self.search('the')), [])
+
+    def test_index_follows_edits(self):
+        self.by_name.name = 'Brass Sconce'
+        self.by_name.save()
+        self.by_description.is_active = False
+        self.by_description.save()
+        self.assertEqual(listed_names(self.search('lamp')), ['Desk Light'])
+        self.assertEqual(listed_names(self.search('sconce')), ['Brass Sconce'])
+
+    def test_rebuild_matches_incremental_index(self):
+        from . import search
+        from .models import ProductSearchTerm
+
+        self.by_brand.description = 'Now with a lamp shade'
+        self.by_brand.save()
+        incremental = set(ProductSearchTerm.objects.values_list('product_id', 'term', 'weight'))
+        search.rebuild_index()
+        self.assertEqual(set(ProductSearchTerm.objects.values_list('product_id', 'term', 'weight')), incremental)
+
+
+class KeysetPaginationTests(TestCase):
+    ORDERINGS = {
+        'newest': ['-created_at', '-id'],
+        'price_low': ['price', 'id'],
+        'price_high': ['-price', '-id'],
+        'name': ['name', 'id'],
+        'rating': ['-rating_avg', '-rating_count', '-id'],
+    }
+
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        # Plenty of ties on every sort key, so only the trailing id keeps pages apart
+        for i in range(30):
+            make_product(f'Lamp {i % 4}', category, slug=f'lamp-{i}', price=('5.00', '9.99', '20.00')[i % 3])
+        Product.objects.filter(pk__in=Product.objects.order_by('id').values('id')[:10]).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        self.url = reverse('product_list')
+
+    def test_every_sort_visits_each_product_once_in_order(self):
+        for sort, ordering in self.ORDERINGS.items():
+            with self.subTest(sort=sort):
+                pages = walk_pages(self.client, self.url, {'sort': sort})
+                self.assertEqual(len(pages), 3)
+                seen = [pk for page in pages for pk in page_ids(page)]
+                expected = list(Product.objects.filter(is_active=True).order_by(*ordering).values_list('id', flat=True))
+                self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_the_same_pages(self):
+        pages = walk_pages(self.client, self.url, {'sort': 'price_high'})
+        back = self.client.get(self.url, {'sort': 'price_high', 'cursor': pages[-1].context['page_obj'].previous_cursor})
+        self.assertEqual(page_ids(back), page_ids(pages[-2]))
+        self.assertTrue(back.context['page_obj'].has_next())
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        first = self.client.get(self.url)
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True)[12:24])
+        make_product('Brand New Lamp', Category.objects.get(), slug='brand-new')
+        second = self.client.get(self.url, {'cursor': first.context['page_obj'].next_cursor})
+        self.assertEqual(page_ids(second), expected)
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        first = self.client.get(self.url)
+        cursor = first.context['page_obj'].next_cursor
+        response = self.client.get(self.url, {'cursor': cursor[:-2] + ('AA' if cursor[-2:] != 'AA' else 'BB')})
+        self.assertEqual(page_ids(response), page_ids(first))
+
+    def test_order_history_pages(self):
+        user = User.objects.create_user('shopper', password='pw')
+        for _ in range(23):
+            make_order(user)
+        Order.objects.update(created_at=timezone.now())
+        self.client.force_login(user)
+        pages = walk_pages(self.client, reverse('order_history'))
+        seen = [pk for page in pages for pk in page_ids(page)]
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+
+class PrimaryImageTests(TestCase):
+    def setUp(self):
+        self.product = make_product('Lamp', make_category())
+
+    def primary(self):
+        return Product.objects.values_list('primary_image__image', flat=True).get(pk=self.product.pk)
+
+    def test_follows_image_changes(self):
+        self.assertIsNone(self.primary())
+        ProductImage.objects.create(product=self.product, image='products/side.jpg')
+        self.assertEqual(self.primary(), 'products/side.jpg')
+        front = ProductImage.objects.create(product=self.product, image='products/front.jpg', is_primary=True)
+        self.assertEqual(self.primary(), 'products/front.jpg')
+        front.delete()
+        self.assertEqual(self.primary(), 'products/side.jpg')
+
+    def test_saving_a_stale_product_keeps_the_pointer(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductImage.objects.create(product=self.product, image='products/side.jpg')
+        stale.name = 'Brass Lamp'
+        stale.save()
+        self.assertEqual(self.primary(), 'products/side.jpg')
+
+    def test_listing_query_count_does_not_grow_with_images(self):
+        def listing_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('product_list'))
+            return len(queries)
+
+        ProductImage.objects.create(product=self.product, image='products/lamp.jpg')
+        baseline = listing_queries()
+        for i in range(5):
+            product = make_product(f'Shade {i}', self.product.category)
+            ProductImage.objects.create(product=product, image=f'products/shade-{i}.jpg')
+        self.assertEqual(listing_queries(), baseline)
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lighting = make_category('Lighting')
+        self.furniture = make_category('Furniture')
+        self.lamps = [
+            make_product(f'Lamp {i}', self.lighting, price=price, brand=brand)
+            for i, (price, brand) in enumerate([('10.00', 'Lumo'), ('30.00', 'Lumo'), ('30.00', 'Brite'), ('600.00', '')])
+        ]
+        self.desk = make_product('Desk', self.furniture, price='250.00', brand='Oakly')
+
+    def cells(self):
+        return set(ProductFacetCount.objects.filter(count__gt=0).values_list('category_id', 'brand', 'price_bucket', 'count'))
+
+    def assert_matches_rebuild(self):
+        from . import facets
+
+        incremental = self.cells()
+        self.assertFalse(ProductFacetCount.objects.filter(count__lt=0).exists())
+        facets.rebuild_facets()
+        self.assertEqual(incremental, self.cells())
+
+    def test_counts_match_a_rebuild_after_edits(self):
+        self.assert_matches_rebuild()
+        lamp = self.lamps[0]
+        lamp.price = Decimal('75.00')
+        lamp.brand = 'Brite'
+        lamp.save()
+        self.lamps[1].category = self.furniture
+        self.lamps[1].save()
+        self.lamps[2].is_active = False
+        self.lamps[2].save()
+        self.lamps[3].delete()
+        make_product('Lamp 9', self.lighting, price='30.00', brand='Lumo')
+        Product.objects.get(pk=self.desk.pk).save(update_fields=['name'])
+        self.assert_matches_rebuild()
+
+    def test_sidebar_counts_ignore_their_own_filter(self):
+        from . import facets
+
+        result = facets.get_facets(category_id=self.lighting.pk, brands=['Lumo'])
+        self.assertEqual(
+            {entry['slug']: entry['count'] for entry in result['categories']}, {'lighting': 2}
+        )
+        self.assertEqual(
+            {entry['value']: entry['count'] for entry in result['brands']}, {'Brite': 1, 'Lumo': 2}
+        )
+        self.assertEqual({entry['index']: entry['count'] for entry in result['price_buckets']}, {0: 1, 1: 1})
+
+    def test_cells_agree_with_live_counts(self):
+        from . import facets
+
+        cells = facets.get_facets()
+        live = facets.get_facets_live(Product.objects.filter(is_active=True))
+        self.assertEqual(cells, live)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        category = make_category()
+        self.lamp = make_product('Lamp', category)
+        self.desk = make_product('Desk', category)
+        self.users = [User.objects.create_user(f'reviewer{i}') for i in range(3)]
+
+    def review(self, user, rating, product=None):
+        return ProductReview.objects.create(product=product or self.lamp, user=user, rating=rating, comment='ok')
+
+    def aggregates(self, product):
+        return Product.objects.values_list('rating_count', 'rating_sum', 'rating_avg').get(pk=product.pk)
+
+    def test_saving_a_stale_instance_keeps_the_aggregates(self):
+        stale = Product.objects.get(pk=self.lamp.pk)
+        self.review(self.users[0], 5)
+        stale.name = 'Brass Lamp'
+        stale.save()
+        self.assertEqual(self.aggregates(self.lamp), (1, 5, Decimal('5.00')))
+        self.assertEqual(Product.objects.get(pk=self.lamp.pk).name, 'Brass Lamp')
+
+    def test_reviews_update_the_aggregates(self):
+        first = self.review(self.users[0], 5)
+        second = self.review(self.users[1], 4)
+        self.assertEqual(self.aggregates(self.lamp), (2, 9, Decimal('4.50')))
+        second.rating = 2
+        second.save()
+        self.assertEqual(self.aggregates(self.lamp), (2, 7, Decimal('3.50')))
+        first.product = self.desk
+        first.save()
+        self.assertEqual(self.aggregates(self.lamp), (1, 2, Decimal('2.00')))
+        self.assertEqual(self.aggregates(self.desk), (1, 5, Decimal('5.00')))
+        second.delete()
+        self.assertEqual(self.aggregates(self.lamp), (0, 0, Decimal('0.00')))
+
+    def test_backfill_agrees_with_signals(self):
+        from . import ratings
+
+        for user, rating in zip(self.users, [1, 2, 2]):
+            self.review(user, rating)
+        self.review(self.users[0], 3, product=self.desk)
+        before = [self.aggregates(self.lamp), self.aggregates(self.desk)]
+        Product.objects.update(rating_count=0, rating_sum=0, rating_avg=0)
+        ratings.backfill_ratings()
+        self.assertEqual([self.aggregates(self.lamp), self.aggregates(self.desk)], before)
+        self.assertEqual(before[0], (3, 5, Decimal('1.67')))
+
+    def test_sort_by_rating(self):
+        self.review(self.users[0], 2)
+        self.review(self.users[1], 4, product=self.desk)
+        response = self.client.get(reverse('product_list'), {'sort': 'rating'})
+        self.assertEqual(listed_names(response), ['Desk', 'Lamp'])
+
+
+CHECKOUT_FORM = {
+    'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com', 'phone': '5550100',
+    'address': '1 Main St', 'city': 'London', 'state': 'LDN', 'postal_code': 'N1', 'country': 'UK',
+    'payment_method': 'card',
+}
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        self.lamp = make_product('Lamp', category, price='20.00', stock=5)
+        self.desk = make_product('Desk', category, price='150.00', stock=1)
+        self.user = User.objects.create_user('shopper', password='pw')
+
+    def new_order(self):
+        return Order(user=self.user, payment_method='card', shipping_address='1 Main St', billing_address='1 Main St')
+
+    def test_places_the_order_and_empties_the_cart(self):
+        from .checkout import place_order
+
+        cart = fill_cart(self.user, (self.lamp, 2), (self.desk, 1))
+        order = place_order(cart, self.new_order())
+        self.assertEqual(order.total_amount, Decimal('190.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity', 'total_price')),
+            [('Desk', 1, Decimal('150.00')), ('Lamp', 2, Decimal('40.00'))],
+        )
+        self.assertEqual((stock_of(self.lamp), stock_of(self.desk)), (3, 0))
+        self.assertFalse(CartItem.objects.filter(cart=cart).exists())
+        self.assertFalse(StockReservation.objects.filter(cart=cart).exists())
+        self.assertEqual(
+            set(Job.objects.values_list('name', flat=True)), {'order_confirmation', 'refresh_recommendations'}
+        )
+
+    def test_shortfall_rolls_everything_back(self):
+        from .checkout import InsufficientStock, place_order
+
+        cart = fill_cart(self.user, (self.lamp, 2))
+        # Added without a hold (e.g. the hold expired and someone else took the stock)
+        CartItem.objects.create(cart=cart, product=self.desk, quantity=3)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(cart, self.new_order())
+        [shortfall] = raised.exception.shortfalls
+        self.assertEqual((shortfall.product.pk, shortfall.requested, shortfall.available), (self.desk.pk, 3, 1))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual((stock_of(self.lamp), stock_of(self.desk)), (3, 1))
+        self.assertEqual(CartItem.objects.filter(cart=cart).count(), 2)
+        self.assertEqual(StockReservation.objects.get(cart=cart).quantity, 2)
+
+    def test_empty_cart(self):
+        from .checkout import EmptyCart, place_order
+
+        with self.assertRaises(EmptyCart):
+            place_order(Cart.objects.create(user=self.user), self.new_order())
+
+    def test_deactivated_product_cannot_be_bought(self):
+        fill_cart(self.user, (self.lamp, 1))
+        Product.objects.filter(pk=self.lamp.pk).update(is_active=False)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout'), CHECKOUT_FORM)
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+    def test_deleted_product_counts_as_unavailable(self):
+        from . import inventory
+
+        cart = fill_cart(self.user, (self.lamp, 1))
+        items = list(CartItem.objects.filter(cart=cart).select_related('product'))
+        Product.objects.filter(pk=self.lamp.pk).delete()
+        [shortfall] = inventory.hold_cart(cart, items)
+        self.assertEqual((shortfall.requested, shortfall.available), (1, 0))
+
+    def test_checkout_view_places_the_order(self):
+        fill_cart(self.user, (self.lamp, 1))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout'), CHECKOUT_FORM)
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_detail', args=[order.order_id]), fetch_redirect_response=False)
+        self.assertEqual(order.final_amount, Decimal('20.00'))
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        from .checkout import place_order
+
+        def checkout_queries(lines):
+            cart = fill_cart(self.user, *lines)
+            with CaptureQueriesContext(connection) as queries:
+                place_order(cart, self.new_order())
+            return len(queries)
+
+        category = self.lamp.category
+        small = checkout_queries([(self.lamp, 1)])
+        products = [make_product(f'Bulb {i}', category, stock=5) for i in range(6)]
+        self.assertEqual(checkout_queries([(product, 1) for product in products]), small)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        category = make_category()
+        self.lamp = make_product('Lamp', category, stock=5)
+        self.carts = [Cart.objects.create(user=User.objects.create_user(f'shopper{i}')) for i in range(2)]
+
+    def test_holds_take_and_return_stock(self):
+        from . import inventory
+
+        cart = self.carts[0]
+        self.assertTrue(inventory.reserve(cart, self.lamp, 3))
+        self.assertEqual(stock_of(self.lamp), 2)
+        self.assertFalse(inventory.reserve(self.carts[1], self.lamp, 3))
+        self.assertTrue(inventory.set_held(cart, self.lamp, 1))
+        self.assertEqual(stock_of(self.lamp), 4)
+        self.assertEqual(inventory.available_to(cart, self.lamp), 5)
+        inventory.release_cart(cart)
+        self.assertEqual(stock_of(self.lamp), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_bad_quantities_cannot_release_stock(self):
+        from . import inventory
+
+        user = self.carts[0].user
+        fill_cart(user, (self.lamp, 2))
+        fill_cart(self.carts[1].user, (self.lamp, 1))
+        self.client.force_login(user)
+        for quantity in ('-5', '0', 'lots'):
+            self.client.post(reverse('add_to_cart', args=[self.lamp.pk]), {'quantity': quantity})
+        item = CartItem.objects.get(cart=self.carts[0])
+        # Each counts as adding one, until the two free units are gone
+        self.assertEqual(item.quantity, 4)
+        self.assertEqual(stock_of(self.lamp), 0)
+
+        response = self.client.post(
+            reverse('update_cart_item', args=[item.pk]), {'quantity': 'lots'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json(), {'success': False, 'message': 'Invalid quantity'})
+        self.assertEqual(stock_of(self.lamp), 0)
+        with self.assertRaises(ValueError):
+            inventory.set_held(self.carts[0], self.lamp, -1)
+        self.assertEqual(stock_of(self.lamp), 0)
+
+    def test_removing_a_cart_line_releases_its_hold(self):
+        user = self.carts[0].user
+        fill_cart(user, (self.lamp, 2))
+        CartItem.objects.get().delete()
+        self.assertEqual(stock_of(self.lamp), 5)
+
+    def test_expired_holds_are_swept(self):
+        from . import inventory
+
+        inventory.reserve(self.carts[0], self.lamp, 4, ttl=-1)
+        inventory.reserve(self.carts[1], self.lamp, 1)
+        self.assertEqual(stock_of(self.lamp), 0)
+        self.assertEqual(inventory.release_expired(), 1)
+        self.assertEqual(stock_of(self.lamp), 4)
+        self.assertEqual(list(StockReservation.objects.values_list('cart', flat=True)), [self.carts[1].pk])
+
+    def test_short_reserve_reclaims_expired_holds_of_other_carts(self):
+        from . import inventory
+
+        inventory.reserve(self.carts[0], self.lamp, 5, ttl=-1)
+        self.assertTrue(inventory.reserve(self.carts[1], self.lamp, 2))
+        self.assertEqual(stock_of(self.lamp), 3)
+        self.assertFalse(StockReservation.objects.filter(cart=self.carts[0]).exists())
+
+    def test_checkout_renews_an_expired_hold(self):
+        from . import inventory
+
+        user = self.carts[0].user
+        cart = fill_cart(user, (self.lamp, 2))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        inventory.release_expired()
+        items = list(CartItem.objects.filter(cart=cart).select_related('product'))
+        self.assertEqual(inventory.hold_cart(cart, items), [])
+        self.assertEqual(stock_of(self.lamp), 3)
+        self.assertGreater(StockReservation.objects.get().expires_at, timezone.now())
+
+    def test_sharded_holds(self):
+        from . import inventory
+
+        inventory.set_stock_shards(self.lamp, 3)
+        self.assertEqual(sorted(StockShard.objects.values_list('quantity', flat=True)), [1, 2, 2])
+        product = Product.objects.get(pk=self.lamp.pk)
+        self.assertTrue(inventory.reserve(self.carts[0], product, 4))
+        self.assertEqual(inventory.available(product), 1)
+        self.assertFalse(inventory.reserve(self.carts[1], product, 2))
+        inventory.release_cart(self.carts[0])
+        self.assertEqual(inventory.available(product), 5)
+        inventory.set_stock_shards(product, 1)
+        self.assertEqual((stock_of(self.lamp), StockShard.objects.count()), (5, 0))
+
+    def test_saving_a_stale_instance_keeps_the_counter(self):
+        from . import inventory
+
+        stale = Product.objects.get(pk=self.lamp.pk)
+        inventory.reserve(self.carts[0], self.lamp, 2)
+        stale.name = 'Brass Lamp'
+        stale.save()
+        self.assertEqual(stock_of(self.lamp), 3)
+        self.assertEqual(Product.objects.get(pk=self.lamp.pk).name, 'Brass Lamp')
+
+    def test_adjust_stock(self):
+        from . import inventory
+
+        inventory.reserve(self.carts[0], self.lamp, 3)
+        self.assertTrue(inventory.adjust_stock(self.lamp, 10))
+        self.assertEqual(stock_of(self.lamp), 12)
+        self.assertFalse(inventory.adjust_stock(self.lamp, -13))
+        self.assertTrue(inventory.adjust_stock(self.lamp, -12))
+        self.assertEqual(stock_of(self.lamp), 0)
+
+        product = inventory.set_stock_shards(self.lamp, 2)
+        self.assertTrue(inventory.adjust_stock(product, 7))
+        self.assertEqual((stock_of(self.lamp), inventory.available(product)), (7, 7))
+
+    def test_admin_applies_a_stock_change(self):
+        from . import inventory
+
+        inventory.reserve(self.carts[0], self.lamp, 2)
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        response = self.client.post(reverse('admin:shop_product_change', args=[self.lamp.pk]), {
+            'name': 'Lamp', 'slug': 'lamp', 'description': 'A lamp', 'price': '10.00',
+            'category': self.lamp.category_id, 'is_active': 'on',
+            # stock itself is read-only; a posted value is ignored
+            'stock': '999', 'stock_change': '4',
+            'images-TOTAL_FORMS': '0', 'images-INITIAL_FORMS': '0',
+            'images-MIN_NUM_FORMS': '0', 'images-MAX_NUM_FORMS': '1000',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(stock_of(self.lamp), 7)
+
+    def test_imported_stock_leaves_out_what_carts_hold(self):
+        from . import inventory
+
+        inventory.reserve(self.carts[0], self.lamp, 2)
+        Product.objects.filter(pk=self.lamp.pk).update(stock=10)
+        inventory.settle_imported_stock([self.lamp.pk])
+        self.assertEqual(stock_of(self.lamp), 8)
+
+
+# Calls seen by the test job handlers, keyed by their ``key`` argument
+JOB_CALLS = {}
+
+
+def _flaky(key, failures):
+    JOB_CALLS[key] = JOB_CALLS.get(key, 0) + 1
+    if JOB_CALLS[key] <= failures:
+        raise RuntimeError(f'{key} failed')
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from . import jobs
+
+        jobs.task('tests.flaky')(_flaky)
+
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def make_due(self):
+        Job.objects.filter(status='pending').update(run_at=timezone.now())
+
+    def test_failed_job_is_retried_with_backoff(self):
+        from . import jobs
+
+        job = jobs.enqueue('tests.flaky', {'key': 'retry', 'failures': 1})
+        with self.assertLogs('shop.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('retry failed', job.last_error)
+        self.assertEqual(jobs.run_pending(), 0)
+
+        self.make_due()
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('done', 2, ''))
+        self.assertEqual(JOB_CALLS['retry'], 2)
+
+    def test_job_fails_after_max_attempts(self):
+        from . import jobs
+
+        job = jobs.enqueue('tests.flaky', {'key': 'doomed', 'failures': 10}, max_attempts=3)
+        with self.assertLogs('shop.jobs', 'WARNING') as logs:
+            for _ in range(5):
+                self.make_due()
+                jobs.run_pending()
+        self.assertIn('failed after 3 attempts', logs.output[-1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertEqual(JOB_CALLS['doomed'], 3)
+
+    def test_unknown_task_fails_without_retrying(self):
+        from . import jobs
+
+        job = jobs.enqueue('tests.missing')
+        with self.assertLogs('shop.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+
+    def test_enqueue_with_a_key_is_idempotent(self):
+        from . import jobs
+
+        first = jobs.enqueue('tests.flaky', {'key': 'once', 'failures': 0}, key='once')
+        second = jobs.enqueue('tests.flaky', {'key': 'once', 'failures': 0}, key='once')
+        self.assertEqual(first.pk, second.pk)
+        jobs.enqueue_many('tests.flaky', [({'key': 'once', 'failures': 0}, 'once'), ({'key': 'twice', 'failures': 0}, 'twice')])
+        self.assertEqual(sorted(Job.objects.values_list('idempotency_key', flat=True)), ['once', 'twice'])
+        jobs.run_pending()
+        self.assertEqual(JOB_CALLS, {'once': 1, 'twice': 1})
+
+    def test_jobs_roll_back_with_their_transaction(self):
+        from . import jobs
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                jobs.enqueue('tests.flaky', {'key': 'lost', 'failures': 0})
+                raise RuntimeError('order failed')
+        self.assertFalse(Job.objects.exists())
+
+    def test_worker_that_lost_its_lock_cannot_record_an_outcome(self):
+        from . import jobs
+
+        jobs.enqueue('tests.flaky', {'key': 'slow', 'failures': 0})
+        [slow] = jobs.claim('host:1:1')
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=jobs.DEFAULT_LOCK_TIMEOUT + 1))
+        [taken_over] = jobs.claim('host:2:1')
+        jobs.run(slow)
+        self.assertEqual(Job.objects.values_list('status', 'locked_by').get(), ('running', 'host:2:1'))
+        jobs.run(taken_over)
+        self.assertEqual(Job.objects.values_list('status', 'attempts').get(), ('done', 2))
+
+    def test_worker_ids_differ_between_processes(self):
+        import os
+        from unittest import mock
+
+        from . import jobs
+
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            other = jobs.worker_id()
+        self.assertNotEqual(jobs.worker_id(), other)
+
+
+class CouponTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='SAVE10', discount_type='percent', discount_value=Decimal('10'), max_discount=Decimal('15'),
+            min_order_amount=Decimal('20'), valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+            usage_limit=1,
+        )
+        category = make_category()
+        self.lamp = make_product('Lamp', category, price='100.00', stock=5)
+        self.desk = make_product('Desk', category, price='200.00', stock=5)
+
+    def order_for(self, username, *lines):
+        from .checkout import place_order
+
+        user = User.objects.create_user(username)
+        cart = fill_cart(user, *lines)
+        order = Order(user=user, payment_method='card', shipping_address='x', billing_address='x')
+        return place_order(cart, order, coupon_code='save10')
+
+    def test_validate(self):
+        from . import coupons
+
+        self.assertEqual(coupons.validate('save10', Decimal('50'))[1], Decimal('5.00'))
+        self.assertEqual(coupons.validate(' SAVE10 ', Decimal('500'))[1], Decimal('15.00'))
+        for code, subtotal, message in [
+            ('NOPE', Decimal('50'), 'not valid'),
+            ('bad code!', Decimal('50'), 'not valid'),
+            ('SAVE10', Decimal('10'), 'minimum order'),
+        ]:
+            with self.subTest(code=code), self.assertRaisesMessage(coupons.CouponError, message):
+                coupons.validate(code, subtotal)
+
+    def test_usage_limit_cannot_be_exceeded(self):
+        from .coupons import CouponError
+
+        first = self.order_for('first', (self.lamp, 1))
+        self.assertEqual((first.discount_amount, first.final_amount), (Decimal('10.00'), Decimal('90.00')))
+        with self.assertRaises(CouponError):
+            self.order_for('second', (self.desk, 1))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 1)
+        self.assertEqual(Order.objects.count(), 1)
+        # The failed order kept its cart and its hold
+        self.assertEqual(stock_of(self.desk), 4)
+        self.assertTrue(CartItem.objects.filter(product=self.desk).exists())
+
+    def test_stale_cached_coupon_is_refused_at_redemption(self):
+        from . import coupons
+
+        coupon, _ = coupons.validate('SAVE10', Decimal('50'))  # caches used_count=0
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=1)
+        with self.assertRaises(coupons.CouponError):
+            coupons.redeem(coupon)
+        with self.assertRaisesMessage(coupons.CouponError, 'fully redeemed'):
+            coupons.validate('SAVE10', Decimal('50'))
+
+    def test_failed_order_gives_the_use_back(self):
+        from unittest import mock
+
+        with mock.patch('shop.inventory.commit_cart', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                self.order_for('unlucky', (self.lamp, 1))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 0)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderIdTests(TestCase):
+    def test_ids_are_time_ordered_and_unique(self):
+        from . import ids
+
+        issued = [ids.new_order_id() for _ in range(2000)]
+        self.assertEqual(issued, sorted(issued))
+        self.assertEqual(len(set(issued)), len(issued))
+        moment = ids.timestamp_of(issued[0])
+        self.assertLess(abs((timezone.now() - moment).total_seconds()), 60)
+        self.assertIsNone(ids.timestamp_of('0123456789abcdef0123456789abcdef'))
+
+    def test_same_millisecond_steps_are_large(self):
+        from unittest import mock
+
+        from . import ids
+
+        with mock.patch('shop.ids.time.time', return_value=2_000_000_000.0):
+            issued = [ids.new_order_id() for _ in range(50)]
+        self.assertEqual(issued, sorted(issued))
+        randoms = [ids._decode(order_id[ids.TIME_CHARS:]) for order_id in issued]
+        steps = [b - a for a, b in zip(randoms, randoms[1:]) if b > a]
+        self.assertGreater(max(steps), 1 << 32)
+
+    def test_range_query(self):
+        from . import ids
+
+        user = User.objects.create_user('shopper')
+        inside = make_order(user)
+        start = inside.created_at - timedelta(seconds=1)
+        self.assertEqual(
+            list(Order.objects.filter(ids.order_id_range(start, start + timedelta(minutes=1)))), [inside]
+        )
+        self.assertFalse(Order.objects.filter(ids.order_id_range(start - timedelta(hours=1), start)).exists())
+
+
+class OrderSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.lamp = make_product('Lamp', make_category(), price='20.00')
+        self.order = make_order(self.user, status='delivered')
+        OrderItem.objects.create(order=self.order, product=self.lamp, quantity=1, price=Decimal('20.00'), total_price=Decimal('20.00'))
+        self.client.force_login(self.user)
+        self.url = reverse('order_detail', args=[self.order.order_id])
+
+    def test_finished_orders_are_rendered_once(self):
+        first = self.client.get(self.url)
+        self.assertContains(first, 'Lamp')
+        snapshot = OrderSnapshot.objects.get(order=self.order)
+        self.assertEqual(snapshot.status, 'delivered')
+        # Served from the snapshot: later product renames don't show
+        Product.objects.filter(pk=self.lamp.pk).update(name='Renamed Lamp')
+        self.assertNotContains(self.client.get(self.url), 'Renamed Lamp')
+
+    def test_saving_the_order_invalidates_the_snapshot(self):
+        self.client.get(self.url)
+        self.order.status = 'cancelled'
+        self.order.save()
+        self.assertFalse(OrderSnapshot.objects.exists())
+        Product.objects.filter(pk=self.lamp.pk).update(name='Renamed Lamp')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Renamed Lamp')
+        self.assertEqual(OrderSnapshot.objects.get().status, 'cancelled')
+
+    def test_snapshot_for_another_status_is_ignored(self):
+        self.client.get(self.url)
+        Order.objects.filter(pk=self.order.pk).update(status='shipped')
+        Product.objects.filter(pk=self.lamp.pk).update(name='Renamed Lamp')
+        self.assertContains(self.client.get(self.url), 'Renamed Lamp')
+
+    def test_open_orders_are_not_snapshotted(self):
+        Order.objects.filter(pk=self.order.pk).update(status='processing')
+        self.client.get(self.url)
+        self.assertFalse(OrderSnapshot.objects.exists())
+
+
+def write_feed(test, text, suffix='.csv'):
+    """Write a feed to a temporary file removed after the test; returns its path"""
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(handle, 'w', encoding='utf-8', newline='') as feed:
+        feed.write(text)
+    test.addCleanup(os.remove, path)
+    return path
+
+
+def import_feed(path, *args):
+    call_command('import_catalog', path, '--workers', '0', *args, stdout=StringIO(), stderr=StringIO())
+
+
+class ImportCatalogTests(TestCase):
+    HEADER = 'slug,name,description,price,discount_price,stock,brand,is_active,category,images\n'
+
+    def setUp(self):
+        cache.clear()
+        self.lamp = make_product('Brass Lamp', make_category(), price='20.00', stock=10, slug='brass-lamp')
+
+    def test_upserts_on_slug_and_rejects_bad_rows(self):
+        path = write_feed(self, self.HEADER + (
+            'brass-lamp,Brass Lamp,Polished,25.00,,7,Lamp Co,true,Lighting,\n'
+            ',Oak Table,Solid wood,120.00,99.00,3,,yes,Furniture,\n'
+            'broken,Broken,,-1,,x,,maybe,,\n'
+        ))
+        rejects = write_feed(self, '', suffix='.jsonl')
+        import_feed(path, '--rejects', rejects)
+
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.price, self.lamp.stock, self.lamp.description), (Decimal('25.00'), 7, 'Polished'))
+        table = Product.objects.get(slug='oak-table')
+        self.assertEqual((table.category.name, table.discount_price, table.stock), ('Furniture', Decimal('99.00'), 3))
+        self.assertEqual(Product.objects.count(), 2)
+        with open(rejects, encoding='utf-8') as handle:
+            rejected = [json.loads(line) for line in handle]
+        self.assertEqual([reject['line'] for reject in rejected], [4])
+        self.assertEqual(len(rejected[0]['errors']), 4)
+
+    def test_dry_run_writes_nothing(self):
+        import_feed(write_feed(self, self.HEADER + ',Oak Table,,120.00,,3,,,Furniture,\n'), '--dry-run')
+        self.assertFalse(Product.objects.filter(slug='oak-table').exists())
+
+    def test_instant_batches_report_progress(self):
+        from unittest import mock
+
+        with mock.patch('shop.management.commands.import_catalog.time.monotonic', return_value=100.0):
+            import_feed(write_feed(self, self.HEADER + ',Oak Table,,120.00,,3,,,Furniture,\n'))
+        self.assertTrue(Product.objects.filter(slug='oak-table').exists())
+
+    def test_search_and_facets_follow_the_import(self):
+        from . import facets
+
+        import_feed(write_feed(self, self.HEADER + (
+            'brass-lamp,Brass Sconce,,20.00,,10,Lamp Co,true,Lighting,\n'
+            ',Oak Table,,120.00,,3,Woodworks,true,Furniture,\n'
+        )))
+        search = reverse('product_list')
+        self.assertEqual(listed_names(self.client.get(search, {'q': 'sconce'})), ['Brass Sconce'])
+        self.assertEqual(listed_names(self.client.get(search, {'q': 'oak'})), ['Oak Table'])
+        self.assertEqual(listed_names(self.client.get(search, {'q': 'lamp'})), ['Brass Sconce'])
+        furniture = Category.objects.get(name='Furniture')
+        self.assertEqual(list(ProductFacetCount.objects.filter(category=furniture).values_list('brand', 'count')), [('Woodworks', 1)])
+        imported = set(ProductFacetCount.objects.values_list('category_id', 'brand', 'price_bucket', 'count'))
+        facets.rebuild_facets()
+        self.assertEqual(set(ProductFacetCount.objects.values_list('category_id', 'brand', 'price_bucket', 'count')), imported)
+
+    def test_feed_stock_counts_what_carts_hold(self):
+        fill_cart(User.objects.create_user('shopper'), (self.lamp, 3))
+        self.assertEqual(stock_of(self.lamp), 7)
+        import_feed(write_feed(self, self.HEADER + 'brass-lamp,Brass Lamp,,20.00,,12,,true,Lighting,\n'))
+        self.assertEqual(stock_of(self.lamp), 9)
+
+    def test_images_are_added_once_and_get_variant_jobs(self):
+        feed = write_feed(self, self.HEADER + 'brass-lamp,Brass Lamp,,20.00,,10,,true,Lighting,products/a.jpg|products/b.jpg\n')
+        import_feed(feed)
+        import_feed(feed)
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.primary_image.image.name, 'products/a.jpg')
+        self.assertEqual(ProductImage.objects.filter(product=self.lamp).count(), 2)
+        self.assertEqual(
+            sorted(Job.objects.filter(name='image_variants').values_list('payload__name', flat=True)),
+            ['products/a.jpg', 'products/b.jpg'],
+        )
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+
+    def export(self, dataset, **filters):
+        from . import exports
+
+        return ''.join(exports.stream(dataset, **filters))
+
+    def test_products_export_round_trips_through_import(self):
+        lamp = make_product('Brass Lamp', make_category(), price='20.00', stock=10, brand='Lamp Co', discount_price=Decimal('18.00'))
+        make_product('Oak Table', make_category('Furniture'), price='120.00', stock=3, is_active=False)
+        fill_cart(self.user, (lamp, 2))
+        fields = ['slug', 'name', 'description', 'price', 'discount_price', 'stock', 'brand', 'is_active', 'category__name']
+        before = list(Product.objects.order_by('pk').values_list(*fields))
+        path = write_feed(self, self.export('products'))
+
+        Product.objects.update(description='', price=Decimal('1.00'), discount_price=None, brand='', stock=0, is_active=True)
+        import_feed(path)
+        self.assertEqual(list(Product.objects.order_by('pk').values_list(*fields)), before)
+        self.assertEqual(stock_of(lamp), 8)
+
+    def test_orders_filter_by_status_and_date(self):
+        now = timezone.now()
+        old = make_order(self.user, status='delivered')
+        Order.objects.filter(pk=old.pk).update(created_at=now - timedelta(days=10))
+        recent = make_order(self.user, status='delivered')
+        make_order(self.user, status='cancelled')
+
+        def exported(**filters):
+            return [row['order_id'] for row in csv.DictReader(StringIO(self.export('orders', **filters)))]
+
+        self.assertEqual(exported(statuses=['delivered']), [old.order_id, recent.order_id])
+        day = (now - timedelta(days=5)).date().isoformat()
+        self.assertEqual(exported(statuses=['delivered'], created_from=day), [recent.order_id])
+        self.assertEqual(exported(created_to=day), [old.order_id])
+
+    def test_jsonl_lines_are_objects(self):
+        make_product('Brass Lamp', make_category())
+        from . import exports
+
+        lines = list(exports.stream('products', 'jsonl'))
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['name'], 'Brass Lamp')
+
+    def test_bad_arguments_are_rejected_up_front(self):
+        from . import exports
+
+        bad = [
+            {'dataset': 'nope'},
+            {'dataset': 'products', 'fmt': 'xml'},
+            {'dataset': 'orders', 'statuses': ['lost']},
+            {'dataset': 'orders', 'created_from': '2026-13-40'},
+            {'dataset': 'products', 'statuses': ['delivered']},
+        ]
+        for arguments in bad:
+            with self.subTest(**arguments), self.assertRaises(exports.ExportError):
+                exports.stream(**arguments)
+
+
+class HomePageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lamp = make_product('Brass Lamp', make_category())
+
+    def test_page_is_served_from_cache_until_the_catalog_changes(self):
+        self.assertContains(self.client.get(reverse('home')), 'Brass Lamp')
+        # Queryset updates send no signals, so the cached page stays
+        Product.objects.filter(pk=self.lamp.pk).update(name='Quiet Rename')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(reverse('home')), 'Brass Lamp')
+
+        self.lamp.refresh_from_db()
+        self.lamp.name = 'Brass Sconce'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lamp.save()
+        self.assertContains(self.client.get(reverse('home')), 'Brass Sconce')
+
+    def test_hits_and_misses_are_counted(self):
+        from . import caching
+
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual(caching.cache_stats(['home_page']), {'home_page': {'hit': 1, 'miss': 1}})
+
+    def test_signed_in_visitors_share_only_the_catalog_sections(self):
+        self.client.get(reverse('home'))
+        user = User.objects.create_user('shopper')
+        fill_cart(user, (self.lamp, 2))
+        self.client.force_login(user)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Brass Lamp')
+        self.assertEqual(response.context['cart_total_items'], 2)
+
+
+class CategorySnapshotTests(TestCase):
+    def setUp(self):
+        from . import caching
+
+        cache.clear()
+        caching._category_snapshot = None
+        make_category()
+
+    def test_snapshot_is_reused_until_a_category_changes(self):
+        from . import caching
+
+        self.assertEqual([category.name for category in caching.active_categories()], ['Lighting'])
+        with self.assertNumQueries(0):
+            caching.active_categories()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_category('Furniture')
+        with self.assertNumQueries(1):
+            names = {category.name for category in caching.active_categories()}
+        self.assertEqual(names, {'Lighting', 'Furniture'})
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        from .checks import check_shared_cache
+
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['shop.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_inactive_categories_are_left_out(self):
+        from . import caching
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_category('Archive', is_active=False)
+        self.assertEqual([category.name for category in caching.active_categories()], ['Lighting'])
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        category = make_category()
+        self.lamp = make_product('Lamp', category, price='20.00', discount_price=Decimal('15.00'))
+        self.table = make_product('Table', category, price='100.00')
+
+    def test_summary_is_one_query(self):
+        from .cart import cart_summary
+
+        fill_cart(self.user, (self.lamp, 2), (self.table, 1))
+        with self.assertNumQueries(1):
+            summary = cart_summary(self.user)
+        self.assertEqual(summary, {'total_items': 3, 'total_price': Decimal('130.00')})
+
+    def test_empty_cart_and_anonymous_visitors_get_zeroes(self):
+        from .cart import cart_summary
+
+        self.assertEqual(cart_summary(self.user), {'total_items': 0, 'total_price': Decimal('0.00')})
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual((response.context['cart_total_items'], response.context['cart_total_price']), (0, 0))
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.category = make_category()
+        self.lamp = make_product('Lamp', self.category, price='20.00', discount_price=Decimal('15.00'))
+
+    def test_line_totals_are_computed_in_the_database(self):
+        cart = fill_cart(self.user, (self.lamp, 3))
+        with self.assertNumQueries(1):
+            [item] = cart.line_items()
+            self.assertEqual((item.unit_price, item.line_total, item.total_price), (Decimal('15.00'), Decimal('45.00'), Decimal('45.00')))
+            self.assertEqual((item.product.category.name, item.product.primary_image), ('Lighting', None))
+        self.assertEqual(cart.totals(), {'total_items': 3, 'total_price': Decimal('45.00')})
+
+    def test_cart_page_queries_do_not_grow_with_items(self):
+        self.client.force_login(self.user)
+        fill_cart(self.user, (self.lamp, 1))
+        with CaptureQueriesContext(connection) as one_item:
+            self.client.get(reverse('cart'))
+        fill_cart(self.user, *[(make_product(f'Extra {n}', self.category), 1) for n in range(4)])
+        with CaptureQueriesContext(connection) as five_items:
+            response = self.client.get(reverse('cart'))
+        self.assertEqual(len(five_items), len(one_item))
+        self.assertEqual(response.context['cart_totals'], {'total_items': 5, 'total_price': Decimal('55.00')})
+
+
+def place_orders(user, *baskets, status='delivered'):
+    """One order per basket (a list of products) for ``user``"""
+    for products in baskets:
+        order = make_order(user, status=status)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price, total_price=product.price)
+            for product in products
+        ])
+
+
+class CoPurchaseTests(TestCase):
+    def setUp(self):
+        self.category = make_category()
+        self.lamp, self.shade, self.bulb, self.table = [
+            make_product(name, self.category) for name in ('Lamp', 'Shade', 'Bulb', 'Table')
+        ]
+        user = User.objects.create_user('shopper')
+        place_orders(user, [self.lamp, self.shade], [self.lamp, self.shade], [self.lamp, self.bulb])
+        place_orders(user, [self.lamp, self.table], status='cancelled')
+
+    def test_neighbours_are_ranked_by_cosine_similarity(self):
+        from . import recommendations
+
+        self.assertEqual(recommendations.build_copurchases(), 4)
+        self.assertEqual(recommendations.frequently_bought_with(self.lamp), [self.shade, self.bulb])
+        self.assertEqual(recommendations.frequently_bought_with(self.bulb), [self.lamp])
+        self.assertEqual(recommendations.frequently_bought_with(self.table), [])
+        score = ProductAssociation.objects.get(product=self.lamp, related=self.shade).score
+        self.assertAlmostEqual(score, 2 / (3 * 2) ** 0.5)
+
+    def test_chunking_does_not_change_the_result(self):
+        from . import recommendations
+
+        recommendations.build_copurchases()
+        whole = set(ProductAssociation.objects.values_list('product_id', 'related_id', 'rank', 'score'))
+        recommendations.build_copurchases(chunk_size=1)
+        self.assertEqual(set(ProductAssociation.objects.values_list('product_id', 'related_id', 'rank', 'score')), whole)
+
+    def test_top_k_and_min_count_prune_pairs(self):
+        from . import recommendations
+
+        self.assertEqual(recommendations.build_copurchases(top_k=1), 3)
+        self.assertEqual(recommendations.frequently_bought_with(self.lamp), [self.shade])
+        self.assertEqual(recommendations.build_copurchases(min_count=2), 2)
+        self.assertEqual(recommendations.frequently_bought_with(self.lamp), [self.shade])
+
+    def test_products_missing_from_the_id_snapshot_are_skipped(self):
+        from unittest import mock
+
+        from . import recommendations
+
+        # As if the bulb and the table were created while the build ran
+        snapshot = Product.objects.exclude(pk__in=[self.bulb.pk, self.table.pk]).order_by('id')
+        with mock.patch.object(Product.objects, 'order_by', return_value=snapshot):
+            self.assertEqual(recommendations.build_copurchases(), 2)
+        self.assertEqual(recommendations.frequently_bought_with(self.lamp), [self.shade])
+
+    def test_related_products_skip_inactive_and_top_up_from_the_category(self):
+        from . import recommendations
+
+        recommendations.build_copurchases()
+        Product.objects.filter(pk=self.shade.pk).update(is_active=False)
+        self.assertEqual(recommendations.related_products(self.lamp, limit=2), [self.bulb, self.table])
+
+
+class UserRecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        self.lamp, self.shade, self.bulb, self.table = [
+            make_product(name, category) for name in ('Lamp', 'Shade', 'Bulb', 'Table')
+        ]
+        place_orders(User.objects.create_user('regular'), [self.lamp, self.shade], [self.lamp, self.shade], [self.lamp, self.bulb])
+        from . import recommendations
+
+        recommendations.build_copurchases()
+        self.user = User.objects.create_user('shopper')
+
+    def test_recommends_unseen_neighbours_of_wished_and_bought_products(self):
+        from . import recommendations
+
+        Wishlist.objects.create(user=self.user, product=self.lamp)
+        recommendations.build_user_recommendations()
+        self.assertEqual(recommendations.recommended_for(self.user), [self.shade, self.bulb])
+
+        place_orders(self.user, [self.shade])
+        recommendations.refresh_user_recommendations(self.user.pk)
+        self.assertEqual(recommendations.recommended_for(self.user), [self.bulb])
+
+    def test_wishing_queues_a_refresh_and_lists_are_cached(self):
+        from . import jobs, recommendations
+
+        Wishlist.objects.create(user=self.user, product=self.bulb)
+        self.assertEqual(Job.objects.filter(name='refresh_recommendations').count(), 1)
+        jobs.run_pending()
+        self.assertEqual(recommendations.recommended_for(self.user), [self.lamp])
+        with self.assertNumQueries(0):
+            self.assertEqual(recommendations.recommended_for(self.user), [self.lamp])
+
+
+def png_bytes(width, height, mode='RGBA'):
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), (200, 120, 40, 128)[:len(mode)]).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.lamp = make_product('Lamp', make_category())
+
+    def upload(self, width=300, height=200):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        return ProductImage.objects.create(
+            product=self.lamp, image=SimpleUploadedFile('lamp.png', png_bytes(width, height)), is_primary=True,
+        )
+
+    def test_variants_are_never_scaled_up(self):
+        from .image_encoding import encode_variants
+
+        sizes = [(fmt, width, height) for fmt, width, height, _ in encode_variants(png_bytes(300, 200), formats=['jpeg'])]
+        self.assertEqual(sizes, [('jpeg', 80, 53), ('jpeg', 250, 167), ('jpeg', 300, 200)])
+
+    def test_upload_queues_a_job_that_stores_the_variants(self):
+        from django.core.files.storage import default_storage
+
+        from . import images, jobs
+
+        image = self.upload()
+        self.assertEqual(Job.objects.filter(name='image_variants', status='pending').count(), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+        image.refresh_from_db()
+        self.assertEqual(image.variants['source'], image.image.name)
+        self.assertEqual([width for width, _, _ in image.variants['jpeg']], [80, 250, 300])
+        self.assertTrue(all(default_storage.exists(name) for _, _, name in image.variants['jpeg']))
+        self.assertFalse(images.needs_variants(image))
+        # Up to date images are not queued again
+        images.queue_variants([image])
+        self.assertEqual(Job.objects.filter(name='image_variants').count(), 1)
+
+    def test_only_primary_images_invalidate_cached_pages(self):
+        from . import caching, jobs
+
+        primary, extra = self.upload(), self.upload()
+        self.assertEqual(Product.objects.get(pk=self.lamp.pk).primary_image_id, primary.pk)
+        version = caching.catalog_version()
+        # Variants of the second image only
+        Job.objects.exclude(payload__image_id=extra.pk).delete()
+        jobs.run_pending()
+        self.assertEqual(caching.catalog_version(), version)
+        jobs.enqueue('image_variants', {'image_id': primary.pk, 'name': primary.image.name})
+        jobs.run_pending()
+        self.assertNotEqual(caching.catalog_version(), version)
+
+    def test_variant_files_are_content_addressed(self):
+        from . import images
+
+        first, second = self.upload(), self.upload()
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            [name for _, _, name in images.generate_variants(first)['jpeg']],
+            [name for _, _, name in images.generate_variants(second)['jpeg']],
+        )
+
+    def test_tag_renders_a_picture_once_variants_exist(self):
+        from django.template import Context, Template
+
+        from . import images
+
+        image = self.upload()
+        template = Template('{% load shop_images %}{% product_image image sizes="250px" alt="Lamp" %}')
+        self.assertInHTML(f'<img src="{image.image.url}" alt="Lamp" loading="lazy" decoding="async">', template.render(Context({'image': image})))
+
+        images.generate_variants(image)
+        html = template.render(Context({'image': image}))
+        jpeg = images.variant_urls(image, 'jpeg')
+        self.assertIn(f'<img src="{jpeg[1][2]}"', html)
+        self.assertIn(f'{jpeg[2][2]} 300w', html)
+        self.assertIn('width="250" height="167"', html)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        self.category = make_category()
+        self.batch = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.batch += 1
+            shopper = User.objects.create_user(f'shopper{self.batch}')
+            product = make_product(f'Lamp {self.batch}', self.category, price='20.00')
+            fill_cart(shopper, (product, 2))
+            make_order(shopper)
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:shop_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        self.add_rows(1)
+        few = {model: self.changelist_queries(model) for model in ('product', 'cart', 'order')}
+        self.add_rows(5)
+        self.assertEqual({model: self.changelist_queries(model) for model in few}, few)
+
+    def test_cart_totals_come_from_the_changelist_query(self):
+        self.add_rows(2)
+        response = self.client.get(reverse('admin:shop_cart_changelist'), {'o': '2'})
+        carts = list(response.context['cl'].result_list)
+        self.assertEqual([(cart.item_count, cart.price_total) for cart in carts], [(2, Decimal('40.00'))] * 2)
+
+    def test_small_tables_are_counted_exactly(self):
+        from .pagination import EstimatedCountPaginator
+
+        self.add_rows(3)
+        self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('pk'), 100).count, 3)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.lighting, self.furniture = make_category(), make_category('Furniture')
+        self.lamp = make_product('Lamp', self.lighting, price='20.00')
+        self.table = make_product('Table', self.furniture, price='100.00')
+        self.today = timezone.localdate()
+        self.orders = [
+            self.sell(0, 'card', (self.lamp, 2)),
+            self.sell(0, 'paypal', (self.lamp, 1), (self.table, 1)),
+            self.sell(3, 'card', (self.table, 2)),
+        ]
+        # Settled long before the first run, so only later edits count as new
+        Order.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def sell(self, days_ago, payment_method, *lines):
+        total = sum(product.price * quantity for product, quantity in lines)
+        order = make_order(self.user, status='delivered', payment_method=payment_method, total_amount=total)
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price, total_price=product.price * quantity)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        return order
+
+    def report(self, **kwargs):
+        from . import rollups
+
+        return rollups.sales_report(self.today - timedelta(days=7), self.today, **kwargs)
+
+    def test_report_matches_the_order_tables(self):
+        from . import rollups
+
+        self.assertEqual(rollups.rollup_sales(), 2)
+        report = self.report()
+        self.assertEqual(report['totals'], {'orders': 3, 'revenue': Decimal('360.00'), 'discount': Decimal('0.00')})
+        self.assertEqual([(row['date'], row['orders']) for row in report['by_day']], [(self.today - timedelta(days=3), 1), (self.today, 2)])
+        self.assertEqual(
+            [(row['category__name'], row['items'], row['revenue']) for row in report['by_category']],
+            [('Furniture', 3, Decimal('300.00')), ('Lighting', 3, Decimal('60.00'))],
+        )
+        self.assertEqual({row['payment_method']: row['orders'] for row in report['by_payment_method']}, {'card': 2, 'paypal': 1})
+
+    def test_later_runs_only_recompute_changed_days(self):
+        from . import rollups
+
+        rollups.rollup_sales()
+        self.assertEqual(rollups.rollup_sales(), 0)
+        old = self.orders[2]
+        old.status = 'cancelled'
+        old.save()
+        self.assertEqual(rollups.rollup_sales(), 1)
+        self.assertEqual(self.report(statuses=['delivered'])['totals']['orders'], 2)
+        self.assertEqual(self.report(statuses=['cancelled'])['totals']['revenue'], Decimal('200.00'))
+
+    def test_rebuild_forgets_deleted_orders(self):
+        from . import rollups
+
+        rollups.rollup_sales()
+        self.orders[0].delete()
+        rollups.rollup_sales()
+        self.assertEqual(self.report()['totals']['orders'], 3)
+        self.assertEqual(rollups.rollup_sales(rebuild=True), 2)
+        self.assertEqual(self.report()['totals']['orders'], 2)
+
+    def test_failed_rebuild_keeps_the_previous_rollups(self):
+        from unittest import mock
+
+        from . import rollups
+
+        rollups.rollup_sales()
+        before = rollups.watermark()
+        with mock.patch('shop.rollups.rebuild_days', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            rollups.rollup_sales(rebuild=True)
+        self.assertEqual(self.report()['totals']['orders'], 3)
+        self.assertEqual(rollups.watermark(), before)
+
+    def test_report_page_is_for_staff(self):
+        url = reverse('sales_report')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([query for query in queries if 'shop_order' in query['sql']])
+        self.assertEqual(self.client.get(url, {'from': '2026-02-30'}).status_code, 400)
+
+
+class QueryProfilerTests(TestCase):
+    def setUp(self):
+        category = make_category()
+        for n in range(4):
+            make_product(f'Lamp {n}', category)
+
+    def profile(self, view, **settings):
+        from django.test import RequestFactory
+
+        from .profiling import QueryProfilerMiddleware
+
+        with self.settings(**settings):
+            middleware = QueryProfilerMiddleware(view)
+        return middleware(RequestFactory().get('/profiled/'))
+
+    def test_fingerprint_collapses_parameters(self):
+        from .profiling import fingerprint
+
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s,  %s) LIMIT 21'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 3'),
+        )
+
+    def test_repeated_queries_are_reported(self):
+        from django.http import HttpResponse
+        from django.template import engines
+
+        def view(request):
+            for product in Product.objects.all():
+                list(ProductImage.objects.filter(product_id=product.pk))
+            return HttpResponse(engines['django'].from_string('{{ n }}').render({'n': 4}))
+
+        with self.assertLogs('shop.profiling', 'WARNING') as logs:
+            response = self.profile(view, SHOP_PROFILER_QUERY_BUDGET=3, SHOP_PROFILER_DUPLICATE_LIMIT=2)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="5 queries"', response['Server-Timing'])
+        self.assertIn('dupq;desc="3 repeated"', response['Server-Timing'])
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('ran 5 queries (budget 3', logs.output[0])
+        self.assertIn('repeated a query 4 times', logs.output[1])
+
+    def test_template_rendering_is_only_patched_during_sampled_requests(self):
+        from unittest import mock
+
+        from django.core.exceptions import MiddlewareNotUsed
+        from django.http import HttpResponse
+        from django.template.backends.django import Template as BackendTemplate
+
+        original = BackendTemplate.render
+        patched = []
+
+        def view(request):
+            patched.append(BackendTemplate.render is not original)
+            return HttpResponse()
+
+        self.profile(view)
+        with mock.patch('shop.profiling.random.random', return_value=0.5):
+            self.profile(view, SHOP_PROFILER_SAMPLE_RATE=0.1)
+        self.assertEqual(patched, [True, False])
+        self.assertIs(BackendTemplate.render, original)
+        with self.assertRaises(MiddlewareNotUsed):
+            self.profile(view, SHOP_PROFILER_SAMPLE_RATE=0)
+
+    def test_pages_carry_server_timing(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertRegex(response['Server-Timing'], r'tpl;dur=[\d.]+, view;dur=[\d.]+, total;dur=')
+
+
+class BenchmarkTests(TestCase):
+    def report(self, **routes):
+        return {'routes': {
+            name: {'p50_ms': p50, 'p95_ms': p50 * 2, 'queries_mean': queries, 'errors': 0}
+            for name, (p50, queries) in routes.items()
+        }}
+
+    def test_compare_flags_only_real_regressions(self):
+        from . import benchmark
+
+        baseline = self.report(home=(10.0, 4), cart=(0.5, 6), checkout=(20.0, 9))
+        current = self.report(home=(13.0, 4), cart=(0.9, 6), checkout=(20.5, 10), wishlist=(99.0, 50))
+        flagged = [(row['route'], row['metric']) for row in benchmark.compare(baseline, current)]
+        # cart doubled but by less than MIN_DELTA_MS; wishlist has no baseline
+        self.assertEqual(flagged, [('home', 'p50_ms'), ('home', 'p95_ms'), ('checkout', 'queries_mean')])
+        self.assertEqual(benchmark.compare(baseline, current, threshold=0.5), [
+            {'route': 'checkout', 'metric': 'queries_mean', 'baseline': 9, 'current': 10, 'change': 1},
+        ])
+
+    def test_percentile_interpolates(self):
+        from .benchmark import percentile
+
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 95), 4.8)
+        self.assertIsNone(percentile([], 50))
+
+    def test_listing_searches_work_with_one_word_names(self):
+        import random
+
+        from django.test import Client
+
+        from . import benchmark
+
+        make_product('Lamp', make_category())
+        shopper = User.objects.create_user('shopper')
+        workload = benchmark.Workload(random.Random(0), {'anon': Client()}, shopper)
+        searches = {call.path for call in (workload.product_list() for _ in range(50)) if '?q=' in call.path}
+        self.assertEqual(searches, {reverse('product_list') + '?q=lamp'})
+
+    def test_every_route_runs_cleanly_on_a_seeded_catalog(self):
+        from . import benchmark
+
+        benchmark.seed_dataset(scale=0.002, seed=3)
+        report = benchmark.run(requests=2, warmup=1, seed=3)
+        self.assertEqual(set(report['routes']), set(benchmark.ROUTES))
+        self.assertEqual({name: route['errors'] for name, route in report['routes'].items() if route['errors']}, {})
+        self.assertEqual(report['total']['requests'], 2 * len(benchmark.ROUTES))
+
+
+class SyntheticDataTests(TestCase):
+    SCALE = 0.003
+
+    def snapshot(self):
+        return {
+            'products': list(Product.objects.order_by('pk').values_list('pk', 'name', 'brand', 'price', 'category__name', 'stock')),
+            'orders': list(Order.objects.order_by('pk').values_list('pk', 'user__username', 'status', 'payment_method', 'final_amount')),
+            'items': list(OrderItem.objects.order_by('pk').values_list('order_id', 'product_id', 'quantity')),
+            'reviews': list(ProductReview.objects.order_by('pk').values_list('user_id', 'product_id', 'rating')),
+        }
+
+    def wipe(self):
+        User.objects.all().delete()
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+
+    def test_counts_follow_the_scale(self):
+        from . import synthetic
+
+        counts = synthetic.generate(scale=self.SCALE, seed=5)
+        self.assertEqual((counts['products'], counts['users'], counts['orders']), (30, 6, 30))
+        self.assertEqual((Product.objects.count(), User.objects.count(), Order.objects.count()), (30, 6, 30))
+        self.assertTrue(OrderItem.objects.exists())
+
+    def test_same_seed_gives_the_same_data(self):
+        from . import synthetic
+
+        synthetic.generate(scale=self.SCALE, seed=5)
+        first = self.snapshot()
+        self.wipe()
+        synthetic.generate(scale=self.SCALE, seed=5, batch_size=3)
+        self.assertEqual(self.snapshot(), first)
+        self.wipe()
+        synthetic.generate(scale=self.SCALE, seed=6)
+        self.assertNotEqual(self.snapshot()['products'], first['products'])
+
+    def test_derived_tables_are_rebuilt(self):
+        from . import rollups, synthetic
 
-# Create your tests here.
+        synthetic.generate(scale=self.SCALE, seed=5)
+        product = Product.objects.filter(is_active=True).order_by('pk').first()
+        response = self.client.get(reverse('product_list'), {'q': product.name})
+        self.assertIn(product.name, listed_names(response))
+        counted = dict(Product.objects.values_list('pk', 'rating_count'))
+        reviewed = dict(ProductReview.objects.values('product_id').annotate(n=Count('id')).values_list('product_id', 'n'))
+        self.assertEqual({pk: n for pk, n in counted.items() if n}, reviewed)
+        self.assertEqual(rollups.sales_report(timezone.localdate() - timedelta(days=800), timezone.localdate())['totals']['orders'], 30)
+        self.assertEqual(ProductFacetCount.objects.aggregate(n=Sum('count'))['n'], Product.objects.filter(is_active=True).count())
@@ -13,5 +13,7 @@ urlpatterns = [
     path('wishlist/toggle/', views.wishlist_toggle, name='wishlist_toggle'),
     path('orders/', views.order_history, name='order_history'),
     path('order/<str:order_id>/', views.order_detail, name='order_detail'),
+    path('export/<str:dataset>/', views.export_data, name='export_data'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
 ]
 
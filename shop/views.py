@@ -6,35 +6,66 @@ Views:
 ------
 1. home(request):
     - Displays the homepage with featured products, categories, and products on sale.
+      The catalog sections (and, for anonymous visitors, the whole page) are cached
+      with signal-based invalidation, see `caching.py`. Logged-in users also get a
+      "Recommended for You" block from `recommendations.py`.
 2. product_list(request):
     - Displays a list of products with filtering, searching, sorting, and pagination options.
+      Searches go through the inverted index in `search.py` and default to relevance order.
+      Pages are cursor (keyset) based, see `pagination.py`. Sidebar facet counts for
+      category, brand and price come from `facets.py`.
 3. product_detail(request, slug):
     - Displays detailed information about a specific product, including related products, reviews, 
-      and wishlist status.
+      and wishlist status. Related products are the precomputed "frequently bought together"
+      neighbours from `recommendations.py`.
 4. add_to_cart(request, product_id):
-    - Allows authenticated users to add products to their shopping cart.
+    - Allows authenticated users to add products to their shopping cart, placing a
+      time-limited stock hold for the cart (see `inventory.py`).
 5. cart_view(request):
     - Displays the user's shopping cart and allows updating quantities or removing items.
 6. checkout(request):
     - Handles the checkout process, including creating an order and clearing the cart.
+      Orders are placed atomically, converting the cart's stock holds into a sale
+      (see `checkout.py` and `inventory.py`), applying an optional coupon code
+      (`coupons.py`). The confirmation email is queued as a
+      background job (`jobs.py`) rather than sent in the request.
 7. wishlist_view(request):
     - Displays the user's wishlist and allows adding or removing products via AJAX.
 8. order_history(request):
-    - Displays the user's order history.
+    - Displays the user's order history, newest first, using keyset pagination.
 9. order_detail(request, order_id):
-    - Displays detailed information about a specific order.
+    - Displays detailed information about a specific order. Delivered and cancelled
+      orders are served from a stored rendered snapshot (see `snapshots.py`).
+10. export_data(request, dataset):
+    - Staff-only streaming CSV/JSONL dump of products, orders or order items, with
+      status and date filters for orders (see `exports.py`).
+11. sales_report(request):
+    - Staff-only sales report by day, category, payment method and status, read
+      from the daily rollup tables kept by `manage.py rollup_sales` (see `rollups.py`).
 Dependencies:
 -------------
 - Django modules:
     - django.shortcuts (render, get_object_or_404, redirect)
     - django.contrib.auth.decorators (login_required)
     - django.contrib (messages)
-    - django.db.models (Q, Avg)
-    - django.core.paginator (Paginator)
-    - django.http (JsonResponse)
+    - django.http (HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse)
+    - django.contrib.admin.views.decorators (staff_member_required)
+    - django.template.loader (render_to_string)
 - Local imports:
     - .models (Product, Category, Wishlist, Cart, CartItem, Order, OrderItem, etc.)
     - .forms (CheckoutForm, ReviewForm)
+    - .cart (cart_summary)
+    - .checkout (place_order)
+    - .coupons (coupon validation for the order summary)
+    - .inventory (stock holds)
+    - .pagination (keyset_paginate)
+    - .search (search_products, rank_products)
+    - .facets (precomputed facet counts)
+    - .caching (versioned page/fragment cache)
+    - .snapshots (rendered snapshots of finished orders)
+    - .recommendations (co-purchase neighbours, per-user recommendations)
+    - .exports (streaming data dumps)
+    - .rollups (daily sales rollups)
 Required Installations:
 -----------------------
 Ensure the following modules are installed:
@@ -45,35 +76,90 @@ Notes:
 - Ensure that the `forms.py` file contains the `CheckoutForm` and `ReviewForm` classes.
 - Templates such as `home.html`, `shop/product_list.html`, `shop/product_detail.html`, etc., 
   must exist in the appropriate directories.
+- `profiling.QueryProfilerMiddleware` reports query counts and timings for every view
+  in `Server-Timing` headers and logs repeated queries (N+1s).
 """
 
 # Create your views here.
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Avg
-from django.core.paginator import Paginator
 from .models import *
 from .forms import CheckoutForm, ReviewForm
+from .cart import cart_summary
+from .checkout import place_order, CouponError, EmptyCart, InsufficientStock
+from .pagination import keyset_paginate
+from .search import search_products, rank_products
+from . import caching, coupons, exports, facets, inventory, recommendations, rollups, snapshots
 import json
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 
-def home(request):
-    featured_products = Product.objects.filter(is_active=True).order_by('-created_at')[:8]
-    categories = Category.objects.filter(is_active=True)
+def _replace_params(params, **changes):
+    """Return ``params`` urlencoded with ``changes`` applied and the page cursor dropped"""
+    params = params.copy()
+    params.pop('cursor', None)
+    for key, value in changes.items():
+        params[key] = value
+    return params.urlencode()
+
+def _home_sections():
+    featured_products = (
+        Product.objects.filter(is_active=True)
+        .select_related('primary_image')
+        .order_by('-created_at')[:8]
+    )
+    categories = caching.active_categories()
     
     # Get products on sale
     on_sale_products = Product.objects.filter(
         is_active=True, 
         discount_price__isnull=False
-    )[:4]
+    ).select_related('primary_image')[:4]
     
     context = {
         'featured_products': featured_products,
         'categories': categories,
         'on_sale_products': on_sale_products,
     }
-    return render(request, 'home.html', context)
+    # No request: the fragment is shared by every visitor of a variant, so
+    # it must not run the per-user context processors (cart badge etc.)
+    return render_to_string('shop/home_sections.html', context)
+
+def home(request):
+    # The catalog part of the page is cached per visitor variant and
+    # invalidated by catalog signals (see caching.py). Anonymous visitors
+    # without pending messages get the whole rendered page from cache.
+    variant = 'auth' if request.user.is_authenticated else 'anon'
+    serve_full_page = variant == 'anon' and not len(messages.get_messages(request))
+    
+    def render_page():
+        catalog_sections = caching.get_or_set(
+            'home_sections',
+            caching.catalog_key('home_sections', variant),
+            _home_sections,
+        )
+        context = {'catalog_sections': mark_safe(catalog_sections)}
+        if request.user.is_authenticated:
+            # One per-user cache read (see recommendations.py)
+            context['recommended_products'] = recommendations.recommended_for(request.user)
+        return render(request, 'home.html', context)
+    
+    if not serve_full_page:
+        return render_page()
+    
+    content = caching.get_or_set(
+        'home_page',
+        caching.catalog_key('home_page', variant),
+        lambda: render_page().content,
+    )
+    return HttpResponse(content)
 
 def product_list(request):
     category_slug = request.GET.get('category')
@@ -81,57 +167,98 @@ def product_list(request):
     sort_by = request.GET.get('sort', 'newest')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
+    brands = [brand for brand in request.GET.getlist('brand') if brand]
     
-    products = Product.objects.filter(is_active=True)
+    products = Product.objects.filter(is_active=True).select_related('primary_image')
     
+    category = None
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=category)
     
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__icontains=search_query)
-        )
+        products = search_products(products, search_query)
+        if 'sort' not in request.GET:
+            sort_by = 'relevance'
     
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
+    if brands:
+        products = products.filter(brand__in=brands)
     
-    # Sorting
-    if sort_by == 'price_low':
-        products = products.order_by('price')
+    # Price ranges picked from the facet sidebar are half-open buckets
+    price_bucket = facets.bucket_for_range(min_price, max_price)
+    if price_bucket is not None:
+        low, high = facets.PRICE_BUCKETS[price_bucket]
+        products = products.filter(price__gte=low)
+        if high is not None:
+            products = products.filter(price__lt=high)
+    else:
+        if min_price:
+            products = products.filter(price__gte=min_price)
+        if max_price:
+            products = products.filter(price__lte=max_price)
+    
+    # Facet counts come from the precomputed cells unless a text search or
+    # custom price range narrows the results past what the cells describe
+    if search_query or ((min_price or max_price) and price_bucket is None):
+        facet_counts = facets.get_facets_live(products)
+    else:
+        facet_counts = facets.get_facets(category.id if category else None, brands, price_bucket)
+    for entry in facet_counts['categories']:
+        entry['selected'] = entry['slug'] == category_slug
+        entry['query'] = _replace_params(request.GET, category=entry['slug'])
+    for entry in facet_counts['brands']:
+        entry['selected'] = entry['value'] in brands
+    for entry in facet_counts['price_buckets']:
+        entry['selected'] = entry['index'] == price_bucket
+        entry['query'] = _replace_params(request.GET, min_price=entry['min'], max_price=entry['max'] or '')
+    
+    if search_query:
+        products = rank_products(products, search_query)
+    
+    # Sorting (every ordering ends in a unique key so it can drive keyset pagination)
+    if sort_by == 'relevance' and search_query:
+        ordering = ['-search_rank', '-created_at', '-id']
+    elif sort_by == 'price_low':
+        ordering = ['price', 'id']
     elif sort_by == 'price_high':
-        products = products.order_by('-price')
+        ordering = ['-price', '-id']
     elif sort_by == 'name':
-        products = products.order_by('name')
+        ordering = ['name', 'id']
+    elif sort_by == 'rating':
+        ordering = ['-rating_avg', '-rating_count', '-id']
     else:  # newest
-        products = products.order_by('-created_at')
+        ordering = ['-created_at', '-id']
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = keyset_paginate(
+        products,
+        ordering,
+        cursor=request.GET.get('cursor'),
+        per_page=12,
+        query_params=request.GET,
+    )
     
     context = {
         'page_obj': page_obj,
         'category_slug': category_slug,
         'search_query': search_query,
         'sort_by': sort_by,
+        'facets': facet_counts,
+        'selected_brands': brands,
     }
     return render(request, 'shop/product_list.html', context)
 
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    related_products = Product.objects.filter(
-        category=product.category, 
-        is_active=True
-    ).exclude(id=product.id)[:4]
+    product = get_object_or_404(
+        Product.objects.select_related('category', 'primary_image'),
+        slug=slug,
+        is_active=True,
+    )
+    # Frequently bought together, falling back to the same category (see recommendations.py)
+    related_products = recommendations.related_products(product)
     
-    # Calculate average rating
-    avg_rating = product.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    # Average rating is denormalized onto the product (see ratings.py)
+    avg_rating = product.rating_avg
     
     # Check if product is in user's wishlist
     in_wishlist = False
@@ -155,6 +282,7 @@ def product_detail(request, slug):
     
     context = {
         'product': product,
+        'reviews': product.reviews.select_related('user'),
         'related_products': related_products,
         'avg_rating': avg_rating,
         'form': form,
@@ -167,35 +295,32 @@ def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id, is_active=True)
     
     if request.method == 'POST':
-        quantity = int(request.POST.get('quantity', 1))
-        
-        # Check stock availability
-        if not product.is_in_stock():
-            messages.error(request, f'Sorry, {product.name} is out of stock!')
-            return redirect('product_detail', slug=product.slug)
+        # Adding never takes units out of the cart: a zero, negative or
+        # garbled quantity adds one
+        try:
+            quantity = max(1, int(request.POST.get('quantity', 1)))
+        except (TypeError, ValueError):
+            quantity = 1
         
         # Get or create user's cart
         cart, created = Cart.objects.get_or_create(user=request.user)
+        cart_item = CartItem.objects.filter(cart=cart, product=product).first()
+        new_quantity = quantity + (cart_item.quantity if cart_item else 0)
         
-        # Check if product already in cart
-        cart_item, item_created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
+        # Hold the stock for this cart (see inventory.py)
+        if not inventory.set_held(cart, product, new_quantity):
+            available = inventory.available_to(cart, product)
+            if available <= 0:
+                messages.error(request, f'Sorry, {product.name} is out of stock!')
+            else:
+                messages.error(request, f'Only {available} items available in stock!')
+            return redirect('product_detail', slug=product.slug)
         
-        if not item_created:
-            new_quantity = cart_item.quantity + quantity
-            if new_quantity > product.stock:
-                messages.error(request, f'Only {product.stock} items available in stock!')
-                return redirect('product_detail', slug=product.slug)
+        if cart_item:
             cart_item.quantity = new_quantity
             cart_item.save()
         else:
-            if quantity > product.stock:
-                messages.error(request, f'Only {product.stock} items available in stock!')
-                cart_item.delete()
-                return redirect('product_detail', slug=product.slug)
+            CartItem.objects.create(cart=cart, product=product, quantity=new_quantity)
         
         messages.success(request, f'{product.name} added to cart!')
     
@@ -207,14 +332,15 @@ def cart_view(request):
     
     if request.method == 'POST':
         # Handle quantity updates
-        for item in cart.items.all():
+        for item in cart.items.select_related('product'):
             new_quantity = request.POST.get(f'quantity_{item.id}')
             if new_quantity and new_quantity.isdigit():
                 new_quantity = int(new_quantity)
                 if new_quantity <= 0:
                     item.delete()
-                elif new_quantity > item.product.stock:
-                    messages.error(request, f'Only {item.product.stock} items available for {item.product.name}!')
+                elif not inventory.set_held(cart, item.product, new_quantity):
+                    available = inventory.available_to(cart, item.product)
+                    messages.error(request, f'Only {available} items available for {item.product.name}!')
                 else:
                     item.quantity = new_quantity
                     item.save()
@@ -235,25 +361,38 @@ def cart_view(request):
     
     context = {
         'cart': cart,
+        'cart_items': cart.line_items(),
+        'cart_totals': cart.totals(),
     }
     return render(request, 'shop/cart.html', context)
 
 @login_required
 def checkout(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
+    cart_items = list(cart.line_items())
     
-    if cart.items.count() == 0:
+    if not cart_items:
         messages.warning(request, 'Your cart is empty!')
         return redirect('product_list')
     
-    if request.method == 'POST':
+    cart_totals = cart.totals()
+    coupon_code = request.POST.get('coupon_code', '').strip()
+    coupon_discount = None
+    
+    if request.method == 'POST' and 'apply_coupon' in request.POST:
+        # Preview the coupon without validating (or placing) the order
+        form = CheckoutForm(initial=request.POST.dict())
+        if coupon_code:
+            try:
+                coupon, coupon_discount = coupons.validate(coupon_code, cart_totals['total_price'])
+            except CouponError as e:
+                messages.error(request, str(e))
+    elif request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
             # Create order
             order = form.save(commit=False)
             order.user = request.user
-            order.total_amount = cart.total_price
-            order.final_amount = cart.total_price  # Calculate with discounts later
             
             # Build shipping and billing addresses from form data
             address_parts = [
@@ -267,30 +406,33 @@ def checkout(request):
             order.shipping_address = shipping_address
             order.billing_address = shipping_address  # Default to same as shipping
             
-            # Validate cart items are still in stock
-            for cart_item in cart.items.all():
-                if cart_item.quantity > cart_item.product.stock:
-                    messages.error(request, f'Sorry, {cart_item.product.name} only has {cart_item.product.stock} items in stock!')
-                    return redirect('cart')
-            
-            order.save()
-            
-            # Create order items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.get_final_price(),
-                    total_price=cart_item.total_price
-                )
-            
-            # Clear cart
-            cart.items.all().delete()
-            
-            messages.success(request, f'Order #{order.order_id} placed successfully!')
-            return redirect('order_detail', order_id=order.order_id)
+            # Stock check, stock decrement, order items and cart clearing all
+            # happen in one transaction (see checkout.py)
+            try:
+                order = place_order(cart, order, coupon_code=form.cleaned_data.get('coupon_code'))
+            except CouponError as e:
+                form.add_error('coupon_code', str(e))
+            except EmptyCart:
+                messages.warning(request, 'Your cart is empty!')
+                return redirect('product_list')
+            except InsufficientStock as e:
+                for shortfall in e.shortfalls:
+                    name = shortfall.product.name if shortfall.product else 'An item'
+                    if shortfall.available:
+                        messages.error(request, f'Sorry, {name} only has {shortfall.available} items in stock!')
+                    else:
+                        messages.error(request, f'Sorry, {name} is no longer available!')
+                return redirect('cart')
+            else:
+                messages.success(request, f'Order #{order.order_id} placed successfully!')
+                return redirect('order_detail', order_id=order.order_id)
     else:
+        # Starting checkout renews the cart's stock holds
+        for shortfall in inventory.hold_cart(cart, cart_items):
+            if shortfall.available:
+                messages.warning(request, f'Only {shortfall.available} of {shortfall.product.name} are still available.')
+            else:
+                messages.warning(request, f'{shortfall.product.name} is no longer available.')
         initial_data = {}
         if request.user.is_authenticated:
             initial_data = {
@@ -302,13 +444,18 @@ def checkout(request):
     
     context = {
         'cart': cart,
+        'cart_items': cart_items,
+        'cart_totals': cart_totals,
+        'coupon_code': coupon_code,
+        'coupon_discount': coupon_discount,
+        'order_total': cart_totals['total_price'] - (coupon_discount or 0),
         'form': form,
     }
     return render(request, 'shop/checkout.html', context)
 
 @login_required
 def wishlist_view(request):
-    wishlist_items = Wishlist.objects.filter(user=request.user)
+    wishlist_items = Wishlist.objects.filter(user=request.user).select_related('product__primary_image')
     
     if request.method == 'POST':
         product_id = request.POST.get('product_id')
@@ -334,35 +481,48 @@ def wishlist_view(request):
 
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'shop/orders.html', {'orders': orders})
+    orders = Order.objects.filter(user=request.user).annotate(item_count=Count('items'))
+    page_obj = keyset_paginate(
+        orders,
+        ['-created_at', '-id'],
+        cursor=request.GET.get('cursor'),
+        per_page=10,
+        query_params=request.GET,
+    )
+    return render(request, 'shop/orders.html', {'orders': page_obj, 'page_obj': page_obj})
 
 @login_required
 def update_cart_item(request, item_id):
     """AJAX endpoint to update cart item quantity"""
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            quantity = int(request.POST.get('quantity', 1))
+            cart_item = CartItem.objects.select_related('product').get(id=item_id, cart__user=request.user)
+            try:
+                quantity = int(request.POST.get('quantity', 1))
+            except (TypeError, ValueError):
+                return JsonResponse({'success': False, 'message': 'Invalid quantity'})
             
+            # Zero or less removes the line (its hold goes with it)
             if quantity <= 0:
                 cart_item.delete()
                 return JsonResponse({'success': True, 'message': 'Item removed'})
             
-            if quantity > cart_item.product.stock:
+            if not inventory.set_held(cart_item.cart, cart_item.product, quantity):
+                available = inventory.available_to(cart_item.cart, cart_item.product)
                 return JsonResponse({
                     'success': False, 
-                    'message': f'Only {cart_item.product.stock} items available!'
+                    'message': f'Only {available} items available!'
                 })
             
             cart_item.quantity = quantity
             cart_item.save()
+            summary = cart_summary(request.user)
             
             return JsonResponse({
                 'success': True,
                 'item_total': str(cart_item.total_price),
-                'cart_total': str(cart_item.cart.total_price),
-                'cart_items': cart_item.cart.total_items
+                'cart_total': str(summary['total_price']),
+                'cart_items': summary['total_items']
             })
         except CartItem.DoesNotExist:
             return JsonResponse({'success': False, 'message': 'Item not found'})
@@ -395,5 +555,45 @@ def wishlist_toggle(request):
 
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, order_id=order_id, user=request.user)
-    return render(request, 'shop/order_detail.html', {'order': order})
\ No newline at end of file
+    order = get_object_or_404(Order.objects.select_related('snapshot'), order_id=order_id, user=request.user)
+    # Delivered/cancelled orders are served from a stored snapshot (see snapshots.py)
+    order_body = mark_safe(snapshots.order_body(order))
+    return render(request, 'shop/order_detail.html', {'order': order, 'order_body': order_body})
+
+@staff_member_required
+def export_data(request, dataset):
+    """Stream a products/orders/order_items dump as CSV or JSONL (see exports.py)"""
+    fmt = request.GET.get('format', 'csv')
+    try:
+        lines = exports.stream(
+            dataset,
+            fmt,
+            statuses=request.GET.getlist('status'),
+            created_from=request.GET.get('from'),
+            created_to=request.GET.get('to'),
+        )
+    except exports.ExportError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(lines, content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+
+@staff_member_required
+def sales_report(request):
+    """Sales between two dates from the rollup tables only; never touches Order/OrderItem"""
+    today = timezone.localdate()
+    try:
+        date_to = parse_date(request.GET.get('to') or '') or today
+        date_from = parse_date(request.GET.get('from') or '') or date_to - timedelta(days=29)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
+    statuses = [s for s in request.GET.getlist('status') if s]
+    context = {
+        'report': rollups.sales_report(date_from, date_to, statuses),
+        'date_from': date_from,
+        'date_to': date_to,
+        'statuses': statuses,
+        'status_choices': Order.STATUS_CHOICES,
+    }
+    return render(request, 'shop/sales_report.html', context)